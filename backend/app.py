@@ -5,9 +5,17 @@ from flask_jwt_extended import JWTManager
 from config import Config, DATABASE_DIR
 from models import db, User
 from seed_data import seed_all
+from services.ingest_queue import ingest_queue
+from services.ring_buffer import ring_buffer
+from services.staleness import staleness_monitor
+from services.sensor_stream import sensor_stream
+from services.spatial import spatial_index
+from services.tiles import tile_cache
+from services.response_cache import response_cache
 from flask_jwt_extended.exceptions import JWTExtendedException
 from werkzeug.exceptions import HTTPException
 import os
+import click
 
 # Инициализация расширений
 migrate = Migrate()
@@ -30,6 +38,12 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
+    ring_buffer.init_app(app)
+    staleness_monitor.init_app(app)
+    sensor_stream.init_app(app)
+    spatial_index.init_app(app)
+    tile_cache.init_app(app)
+    response_cache.init_app(app)
 
     # Инициализация БД и заполнение данными при первом запуске
     with app.app_context():
@@ -38,6 +52,9 @@ def create_app():
         if User.query.first() is None:
             seed_all()
 
+    # Очередь записи — после подготовки БД: при старте она сразу переносит сегменты прошлого запуска
+    ingest_queue.init_app(app)
+
     # Регистрация blueprints
     from routes import (
         auth_bp,
@@ -49,6 +66,7 @@ def create_app():
         reports_bp,
         map_bp,
         admin_bp,
+        predictions_bp,
     )
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -60,6 +78,7 @@ def create_app():
     app.register_blueprint(reports_bp, url_prefix='/api/reports')
     app.register_blueprint(map_bp, url_prefix='/api/map')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(predictions_bp, url_prefix='/api/predictions')
 
     # Главная страница API
     @app.route('/api')
@@ -73,19 +92,31 @@ def create_app():
             },
             'documentation': {
                 'sensors': {
-                    'get_all': 'GET /api/sensors',
+                    'get_all': 'GET /api/sensors?since=<watermark>',
                     'get_by_id': 'GET /api/sensors/:id',
+                    'stream': 'GET /api/sensors/stream?since=<watermark> (Server-Sent Events: sensors, danger, reset)',
                     'get_critical': 'GET /api/sensors/critical',
                     'get_average': 'GET /api/sensors/average',
-                    'get_history': 'GET /api/sensors/:id/readings?hours=24',
-                    'get_zones': 'GET /api/sensors/zones',
+                    'get_history': 'GET /api/sensors/:id/readings?hours=24&resolution=raw|hour|day&points=500&after=<timestamp,id>',
+                    'get_history_multi': 'GET /api/sensors/readings/history?sensors=a,b|zone=<id>|facility=<id>&hours=24&step=300',
+                    'export': 'GET /api/sensors/readings/export?sensors=a,b&start=<iso>&end=<iso>&format=csv|parquet (auth)',
+                    'add_reading': 'POST /api/sensors/:id/readings (admin/mchs)',
+                    'add_readings_batch': 'POST /api/sensors/readings/batch (admin/mchs)',
+                    'add_readings_stream': 'POST /api/sensors/readings/stream?chunk_size=1000&offset=0 (NDJSON, admin/mchs)',
+                    'ingest_queue': 'GET /api/sensors/readings/queue (admin/mchs)',
+                    'get_anomalies': 'GET /api/sensors/readings/anomalies?sensors=a,b&hours=168&flag=spike|rate|flatline|level_shift (admin/mchs)',
+                    'get_zones': 'GET /api/sensors/zones?since=<watermark>&zoom=<0..22>|tolerance=<градусы>',
                     'create': 'POST /api/sensors (admin/mchs)',
                     'update': 'PUT /api/sensors/:id (admin/mchs)',
                     'delete': 'DELETE /api/sensors/:id (admin)',
+                },
+                'predictions': {
+                    'get_all': 'GET /api/predictions?horizon=6&risk=low,medium,high',
+                    'get_by_sensor': 'GET /api/predictions/:sensor_id?horizon=6',
                 }}
                 ,
                 'facilities': {
-                    'get_all': 'GET /api/facilities',
+                    'get_all': 'GET /api/facilities?since=<watermark>',
                     'get_by_id': 'GET /api/facilities/:id',
                     'create': 'POST /api/facilities (admin/mchs)',
                     'update': 'PUT /api/facilities/:id (admin/mchs)',
@@ -132,6 +163,96 @@ def init_db():
     seed_all()
     print("✅ База данных инициализирована!")
 
+@app.cli.command()
+@click.option('--sensor', 'sensor_ids', multiple=True, help='ID датчика (можно несколько); по умолчанию все')
+def rebuild_rollups(sensor_ids):
+    """Пересчитать часовые и суточные агрегаты показаний"""
+    from services import rollups
+
+    print("🔄 Пересчёт агрегатов показаний...")
+    total = rollups.rebuild(list(sensor_ids) or None)
+    print(f"✅ Агрегаты пересчитаны по {total} показаниям")
+
+@app.cli.command()
+@click.option('--days', type=int, default=None, help='Возраст показаний в днях (по умолчанию SENSOR_ARCHIVE_AFTER_DAYS)')
+def archive_readings(days):
+    """Вынести старые показания в холодный архив"""
+    from services import archive
+
+    print("📦 Архивация старых показаний...")
+    result = archive.archive_readings(days)
+    print(f"✅ Перенесено показаний: {result['readings']}, файлов: {result['files']}")
+
+@app.cli.command()
+def simplify_zones():
+    """Пересчитать упрощённые полигоны всех зон риска"""
+    from models import RiskZone
+    from services.simplify import simplify_levels
+
+    zones = RiskZone.query.all()
+    for zone in zones:
+        zone.simplified = simplify_levels(zone.coordinates)
+    db.session.commit()
+    print(f"✅ Упрощено полигонов: {len(zones)}")
+
+@app.cli.command()
+def refresh_zones():
+    """Пересчитать уровень воды и тренд всех зон риска по датчикам"""
+    from services import zones
+
+    count = zones.refresh_zones()
+    db.session.commit()
+    print(f"✅ Обновлено зон: {count}")
+
+@app.cli.command()
+@click.option('--sensor', 'sensor_ids', multiple=True, help='ID датчика (можно несколько); по умолчанию все')
+@click.option('--hours', type=int, default=None, help='Глубина истории в часах (по умолчанию SENSOR_FORECAST_FIT_HOURS)')
+def fit_forecasts(sensor_ids, hours):
+    """Обучить модели прогноза уровня воды заново по истории показаний"""
+    from services import forecast
+
+    print("📈 Обучение моделей прогноза...")
+    count = forecast.fit(list(sensor_ids) or None, hours)
+    db.session.commit()
+    print(f"✅ Обучено моделей: {count}")
+
+@app.cli.command()
+def dedupe_readings():
+    """Удалить дубли показаний (повторы от шлюзов)"""
+    from services.dedupe import dedupe_readings as dedupe
+
+    print("🧹 Поиск дублей показаний...")
+    result = dedupe()
+    print(f"✅ Удалено дублей: {result['deleted']}, датчиков: {len(result['sensors'])}")
+
+@app.cli.command()
+@click.option('--sensor', 'sensor_ids', multiple=True, help='ID датчика (можно несколько); по умолчанию все активные')
+@click.option('--start', default=None, help='Начало периода (ISO 8601)')
+@click.option('--end', default=None, help='Конец периода (ISO 8601, не включительно)')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'parquet']), default='csv', help='Формат файла')
+@click.option('--output', '-o', required=True, help='Путь к файлу')
+def export_readings(sensor_ids, start, end, fmt, output):
+    """Выгрузить историю показаний в CSV или Parquet"""
+    from models import Sensor
+    from services.export import export_readings as export
+    from services.ingest import parse_timestamp
+
+    if not sensor_ids:
+        sensor_ids = [s.id for s in Sensor.query.filter_by(is_active=True).order_by(Sensor.id).all()]
+
+    print("📤 Выгрузка показаний...")
+    chunks = export(
+        list(sensor_ids),
+        start=parse_timestamp(start) if start else None,
+        end=parse_timestamp(end) if end else None,
+        fmt=fmt,
+        chunk_size=app.config['SENSOR_EXPORT_CHUNK_SIZE']
+    )
+    with open(output, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    print(f"✅ Показания выгружены в {output}")
+
 @app.cli.command()
 def create_admin():
     """Создать администратора"""
@@ -59,6 +59,98 @@ class Config:
     JOBS_PER_PAGE = 20
     APPLICATIONS_PER_PAGE = 50
     USERS_PER_PAGE = 30
+
+    # Настройки приёма показаний датчиков
+    SENSOR_BATCH_MAX_SIZE = int(os.environ.get('SENSOR_BATCH_MAX_SIZE') or 5000)  # показаний в одном пакете
+    SENSOR_STREAM_CHUNK_SIZE = int(os.environ.get('SENSOR_STREAM_CHUNK_SIZE') or 1000)  # показаний на один commit
+    SENSOR_STREAM_MAX_CONTENT_LENGTH = 10 * 1024 * 1024 * 1024  # 10GB для потоковой догрузки
+
+    # Очередь отложенной записи показаний (подтверждение после записи в локальный журнал)
+    SENSOR_INGEST_QUEUE_ENABLED = os.environ.get('SENSOR_INGEST_QUEUE_ENABLED', 'false').lower() in ['true', 'on', '1']
+    SENSOR_INGEST_QUEUE_DIR = os.environ.get('SENSOR_INGEST_QUEUE_DIR') or os.path.join(DATABASE_DIR, 'ingest_queue')
+    SENSOR_INGEST_FLUSH_INTERVAL = float(os.environ.get('SENSOR_INGEST_FLUSH_INTERVAL') or 1.0)  # секунды
+    SENSOR_INGEST_FLUSH_SIZE = int(os.environ.get('SENSOR_INGEST_FLUSH_SIZE') or 500)  # показаний до внеочередного commit
+
+    # Выбор разрешения истории показаний по длине окна: raw -> hour -> day
+    SENSOR_READINGS_RAW_MAX_HOURS = 48
+    SENSOR_READINGS_HOURLY_MAX_HOURS = 24 * 31
+
+    # История нескольких датчиков одним запросом (GET /api/sensors/readings/history)
+    SENSOR_HISTORY_MAX_SENSORS = 100
+    SENSOR_HISTORY_MAX_GRID_POINTS = 10000
+
+    # Потоковая выгрузка показаний (CSV/Parquet): строк на одну порцию чтения
+    SENSOR_EXPORT_CHUNK_SIZE = int(os.environ.get('SENSOR_EXPORT_CHUNK_SIZE') or 10000)
+
+    # Холодный архив показаний (сжатые .npz по датчику и месяцу)
+    SENSOR_ARCHIVE_DIR = os.environ.get('SENSOR_ARCHIVE_DIR') or os.path.join(DATABASE_DIR, 'archive')
+    SENSOR_ARCHIVE_AFTER_DAYS = int(os.environ.get('SENSOR_ARCHIVE_AFTER_DAYS') or 180)
+
+    # Уровень и тренд зон риска по связанным датчикам
+    SENSOR_ZONE_LEVEL_MODE = os.environ.get('SENSOR_ZONE_LEVEL_MODE') or 'max'  # max или mean
+    SENSOR_ZONE_TREND_HOURS = 6  # окно для наклона тренда
+    SENSOR_ZONE_TREND_THRESHOLD = 0.01  # м/ч: меньше по модулю — stable
+
+    # Оповещения о пересечении порогов уровня воды
+    SENSOR_ALERT_ENABLED = os.environ.get('SENSOR_ALERT_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SENSOR_ALERT_HYSTERESIS = 0.1  # м: понижение уровня объявляется только ниже порога на эту величину
+    SENSOR_ALERT_DEBOUNCE = 2  # показаний подряд за порогом до объявления перехода
+    SENSOR_ALERT_STAFF_ROLES = ['admin', 'emergency', 'expert']  # получают все переходы
+    SENSOR_ALERT_PUBLIC_LEVELS = ['danger', 'critical']  # о повышении до этих уровней узнают все пользователи
+
+    # Кэш готовых ответов публичных списков (общий для воркеров, SQLite в /dev/shm)
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH')  # по умолчанию /dev/shm/gidroatlas-cache-<хеш БД>.sqlite
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES') or 1000)
+
+    # Монитор датчиков, переставших присылать показания
+    SENSOR_MONITOR_ENABLED = os.environ.get('SENSOR_MONITOR_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SENSOR_REPORT_INTERVAL = int(os.environ.get('SENSOR_REPORT_INTERVAL') or 900)  # с, если у датчика не задан свой
+    SENSOR_STALE_FACTOR = 2  # пропущено столько интервалов — stale
+    SENSOR_OFFLINE_FACTOR = 8  # пропущено столько интервалов — offline
+    SENSOR_MONITOR_POLL_INTERVAL = 30  # с: как часто проверять возврат датчиков на связь
+
+    # Поток изменений датчиков для дашбордов (SSE, GET /api/sensors/stream)
+    SENSOR_STREAM_POLL_INTERVAL = 1.0  # с: как часто проверять изменения из других процессов
+    SENSOR_STREAM_HEARTBEAT = 15  # с: комментарий-пинг в простаивающем соединении (прокси не рвут его)
+    SENSOR_STREAM_MAX_SECONDS = 1800  # с: после этого соединение закрывается, браузер переподключается
+    SENSOR_STREAM_BACKLOG = 256  # последних событий в памяти для отставших подписчиков
+    # Подписчиков на процесс. На gthread (API, порт 5252) каждый держит поток — лимит меньше
+    # GUNICORN_THREADS; на gevent (порт 5253) — гринлет, лимит в тысячах (см. Dockerfile).
+    # Сверх лимита — 503 и Retry-After
+    SENSOR_STREAM_MAX_SUBSCRIBERS = int(os.environ.get('SENSOR_STREAM_MAX_SUBSCRIBERS') or 192)
+    SENSOR_STREAM_RETRY_AFTER = 30  # с: через сколько повторить подписку после отказа
+
+    # Пространственный индекс слоёв карты (выборка по bbox)
+    MAP_GRID_CELL_DEGREES = 0.5  # размер ячейки сетки, градусы
+    MAP_CLUSTER_MAX_ZOOM = 14  # до этого зума включительно ?zoom= отдаёт кластеры, крупнее — объекты
+    MAP_CLUSTER_CELLS_PER_TILE = 4  # ячеек кластера на сторону тайла 256 px (~64 px на кластер)
+    MAP_TILE_CACHE_DIR = os.environ.get('MAP_TILE_CACHE_DIR') or os.path.join(DATABASE_DIR, 'tiles')
+    MAP_TILE_MAX_ZOOM = 16  # тайлы крупнее не строятся — карта растягивает тайл этого зума
+    MAP_TILE_MAX_AGE = 60  # с: Cache-Control тайла для браузера и CDN
+
+    # Детектор аномалий в показаниях (выбросы, скачки, зависшие датчики)
+    SENSOR_ANOMALY_ENABLED = os.environ.get('SENSOR_ANOMALY_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SENSOR_ANOMALY_ALPHA = 0.05  # вес нового показания в скользящих среднем и дисперсии
+    SENSOR_ANOMALY_WARMUP = 20  # показаний до начала проверок
+    SENSOR_ANOMALY_SPIKE_SIGMA = 5.0  # выброс — дальше этого числа стандартных отклонений
+    SENSOR_ANOMALY_MAX_RATE = 1.0  # м/ч: физически допустимая скорость изменения уровня
+    SENSOR_ANOMALY_FLATLINE_COUNT = 30  # одинаковых значений подряд — датчик завис
+    SENSOR_ANOMALY_CONFIRM_COUNT = 3  # отклонённых подряд — принимаем как реальный скачок уровня
+
+    # Прогноз уровня воды (сглаживание Хольта с затухающим трендом)
+    SENSOR_FORECAST_ALPHA = 0.3  # вес нового показания в уровне
+    SENSOR_FORECAST_BETA = 0.1  # вес нового наклона в тренде
+    SENSOR_FORECAST_PHI = 0.95  # затухание тренда за час
+    SENSOR_FORECAST_FIT_HOURS = 72  # история для обучения моделей с нуля
+    SENSOR_FORECAST_HORIZONS = [1, 3, 6, 12, 24]  # часы, отдаваемые в /api/predictions
+    SENSOR_FORECAST_DEFAULT_HORIZON = 6
+
+    # Кольцевой буфер свежих показаний (общий для воркеров, в /dev/shm)
+    SENSOR_RING_ENABLED = os.environ.get('SENSOR_RING_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SENSOR_RING_DIR = os.environ.get('SENSOR_RING_DIR')  # по умолчанию /dev/shm/gidroatlas-ring-<хеш БД>
+    SENSOR_RING_CAPACITY = int(os.environ.get('SENSOR_RING_CAPACITY') or 4096)  # показаний на датчик
+    SENSOR_RING_WINDOW_HOURS = int(os.environ.get('SENSOR_RING_WINDOW_HOURS') or 24)  # окно, отдаваемое из буфера
     
     # Настройки кеширования
     CACHE_TYPE = os.environ.get('CACHE_TYPE') or 'simple'
@@ -0,0 +1,29 @@
+"""Составной индекс (sensor_id, timestamp) для истории показаний
+
+Revision ID: 3f9a1c2d7e4b
+Revises: 
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2d7e4b'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Запросы истории фильтруют по датчику и сортируют по времени — один индекс на оба поля.
+    # Отдельный индекс по sensor_id становится лишним: его покрывает префикс составного.
+    op.create_index('ix_sensor_readings_sensor_id_timestamp', 'sensor_readings',
+                    ['sensor_id', 'timestamp'], unique=False, if_not_exists=True)
+    op.drop_index('ix_sensor_readings_sensor_id', table_name='sensor_readings', if_exists=True)
+
+
+def downgrade():
+    op.create_index('ix_sensor_readings_sensor_id', 'sensor_readings', ['sensor_id'],
+                    unique=False, if_not_exists=True)
+    op.drop_index('ix_sensor_readings_sensor_id_timestamp', table_name='sensor_readings', if_exists=True)
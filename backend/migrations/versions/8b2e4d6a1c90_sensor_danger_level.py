@@ -0,0 +1,50 @@
+"""Пороги уровня воды и материализованный danger_level датчиков
+
+Revision ID: 8b2e4d6a1c90
+Revises: 3f9a1c2d7e4b
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6a1c90'
+down_revision = '3f9a1c2d7e4b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('sensors')}
+
+    # Пороги по умолчанию — прежние захардкоженные 4/5/6 м
+    with op.batch_alter_table('sensors') as batch_op:
+        if 'attention_threshold' not in existing:
+            batch_op.add_column(sa.Column('attention_threshold', sa.Float(), nullable=False, server_default='4.0'))
+        if 'danger_threshold' not in existing:
+            batch_op.add_column(sa.Column('danger_threshold', sa.Float(), nullable=False, server_default='5.0'))
+        if 'critical_threshold' not in existing:
+            batch_op.add_column(sa.Column('critical_threshold', sa.Float(), nullable=False, server_default='6.0'))
+        if 'danger_level' not in existing:
+            batch_op.add_column(sa.Column('danger_level', sa.String(length=20), nullable=False, server_default='safe'))
+
+    op.execute("""
+        UPDATE sensors SET danger_level = CASE
+            WHEN COALESCE(water_level, 0) >= critical_threshold THEN 'critical'
+            WHEN COALESCE(water_level, 0) >= danger_threshold THEN 'danger'
+            WHEN COALESCE(water_level, 0) >= attention_threshold THEN 'attention'
+            ELSE 'safe'
+        END
+    """)
+    op.create_index('ix_sensors_danger_level', 'sensors', ['danger_level'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_sensors_danger_level', table_name='sensors', if_exists=True)
+    with op.batch_alter_table('sensors') as batch_op:
+        batch_op.drop_column('danger_level')
+        batch_op.drop_column('critical_threshold')
+        batch_op.drop_column('danger_threshold')
+        batch_op.drop_column('attention_threshold')
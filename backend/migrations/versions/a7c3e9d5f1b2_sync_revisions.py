@@ -0,0 +1,52 @@
+"""Ревизии записей и надгробия удалённых для дельта-синхронизации
+
+Revision ID: a7c3e9d5f1b2
+Revises: f2c6a9d3b8e4
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9d5f1b2'
+down_revision = 'f2c6a9d3b8e4'
+branch_labels = None
+depends_on = None
+
+TABLES = ['sensors', 'risk_zones', 'hydro_facilities', 'water_bodies']
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # Существующие записи получают ревизию 0 — они входят в любой полный список
+    for table in TABLES:
+        existing = {c['name'] for c in inspector.get_columns(table)}
+        if 'revision' not in existing:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(sa.Column('revision', sa.BigInteger(), nullable=False, server_default='0'))
+        op.create_index(f'ix_{table}_revision', table, ['revision'], unique=False, if_not_exists=True)
+
+    if not inspector.has_table('sync_tombstones'):
+        op.create_table(
+            'sync_tombstones',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('table_name', sa.String(length=64), nullable=False),
+            sa.Column('record_id', sa.String(length=64), nullable=False),
+            sa.Column('revision', sa.BigInteger(), nullable=False),
+            sa.Column('deleted_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_sync_tombstones_table_revision', 'sync_tombstones', ['table_name', 'revision'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_sync_tombstones_table_revision', table_name='sync_tombstones', if_exists=True)
+    op.drop_table('sync_tombstones')
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_revision', table_name=table, if_exists=True)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('revision')
@@ -0,0 +1,68 @@
+"""Числовые координаты ГТС и водных объектов и индексы для выборки по bbox
+
+Revision ID: b4e8f2a6c1d3
+Revises: a7c3e9d5f1b2
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8f2a6c1d3'
+down_revision = 'a7c3e9d5f1b2'
+branch_labels = None
+depends_on = None
+
+TABLES = ['hydro_facilities', 'water_bodies']
+
+
+def _point(coordinates):
+    """Как models.coordinates_point: точка или центр вершин полигона"""
+    if isinstance(coordinates, str):
+        coordinates = json.loads(coordinates)
+    if isinstance(coordinates, dict):
+        coordinates = [coordinates]
+    try:
+        points = [(float(p['lat']), float(p['lng'])) for p in coordinates or []]
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    if not points:
+        return None, None
+    return sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    for name in TABLES:
+        existing = {c['name'] for c in inspector.get_columns(name)}
+        with op.batch_alter_table(name) as batch_op:
+            if 'latitude' not in existing:
+                batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+            if 'longitude' not in existing:
+                batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+        # Заполняем из JSON coordinates (объектов немного — построчно)
+        table = sa.table(name, sa.column('id', sa.Integer), sa.column('coordinates', sa.JSON),
+                         sa.column('latitude', sa.Float), sa.column('longitude', sa.Float))
+        for row in bind.execute(sa.select(table.c.id, table.c.coordinates)).fetchall():
+            lat, lng = _point(row.coordinates)
+            bind.execute(table.update().where(table.c.id == row.id).values(latitude=lat, longitude=lng))
+
+        op.create_index(f'ix_{name}_lat_lng', name, ['latitude', 'longitude'], unique=False, if_not_exists=True)
+
+    op.create_index('ix_sensors_lat_lng', 'sensors', ['latitude', 'longitude'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_sensors_lat_lng', table_name='sensors', if_exists=True)
+    for name in TABLES:
+        op.drop_index(f'ix_{name}_lat_lng', table_name=name, if_exists=True)
+        with op.batch_alter_table(name) as batch_op:
+            batch_op.drop_column('longitude')
+            batch_op.drop_column('latitude')
@@ -0,0 +1,56 @@
+"""Уникальный ключ показаний (sensor_id, timestamp) и ключ идемпотентности
+
+Revision ID: c4d1e7f3a2b6
+Revises: 8b2e4d6a1c90
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d1e7f3a2b6'
+down_revision = '8b2e4d6a1c90'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing = {c['name'] for c in sa.inspect(bind).get_columns('sensor_readings')}
+    if 'idempotency_key' not in existing:
+        with op.batch_alter_table('sensor_readings') as batch_op:
+            batch_op.add_column(sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+
+    # Уникальный индекс не создать, пока в таблице есть дубли — оставляем первую запись группы
+    # (то же правило, что у flask dedupe-readings; агрегаты пересчитывает ревизия e9f4b1c7d2a5)
+    deleted = bind.execute(sa.text("""
+        DELETE FROM sensor_readings WHERE EXISTS (
+            SELECT 1 FROM sensor_readings AS earlier
+            WHERE earlier.sensor_id = sensor_readings.sensor_id
+              AND earlier.timestamp = sensor_readings.timestamp
+              AND earlier.id < sensor_readings.id
+        )
+    """)).rowcount
+    if deleted:
+        logger.info("Удалено дублей показаний: %d", deleted)
+
+    op.drop_index('ix_sensor_readings_sensor_id_timestamp', table_name='sensor_readings', if_exists=True)
+    op.create_index('ix_sensor_readings_sensor_id_timestamp', 'sensor_readings',
+                    ['sensor_id', 'timestamp'], unique=True)
+    op.create_index('ix_sensor_readings_sensor_id_idempotency_key', 'sensor_readings',
+                    ['sensor_id', 'idempotency_key'], unique=True, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_sensor_readings_sensor_id_idempotency_key', table_name='sensor_readings', if_exists=True)
+    op.drop_index('ix_sensor_readings_sensor_id_timestamp', table_name='sensor_readings', if_exists=True)
+    op.create_index('ix_sensor_readings_sensor_id_timestamp', 'sensor_readings',
+                    ['sensor_id', 'timestamp'], unique=False)
+    with op.batch_alter_table('sensor_readings') as batch_op:
+        batch_op.drop_column('idempotency_key')
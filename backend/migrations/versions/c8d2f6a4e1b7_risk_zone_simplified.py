@@ -0,0 +1,104 @@
+"""Упрощённые полигоны зон риска для мелких масштабов карты
+
+Revision ID: c8d2f6a4e1b7
+Revises: b4e8f2a6c1d3
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+import json
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8d2f6a4e1b7'
+down_revision = 'b4e8f2a6c1d3'
+branch_labels = None
+depends_on = None
+
+# Упрощение зафиксировано на момент ревизии (копия services.simplify): миграция не должна
+# меняться вместе с кодом приложения. Новые уровни — командой flask simplify-zones.
+TOLERANCES = (0.0001, 0.0005, 0.002, 0.01, 0.05)
+
+
+def _douglas_peucker(points, tolerance):
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+
+def _simplify_ring(ring, tolerance):
+    points = np.array([(float(p['lng']), float(p['lat'])) for p in ring])
+    if len(points) <= 3:
+        return None
+    split = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    if split == 0:
+        return None
+    first = _douglas_peucker(points[:split + 1], tolerance)
+    second = _douglas_peucker(np.vstack([points[split:], points[:1]]), tolerance)[1:-1] + split
+    indices = np.concatenate([first, second])
+    if len(indices) < 3:
+        return None
+    return [ring[i] for i in indices]
+
+
+def _simplify_levels(ring):
+    levels = {}
+    if not isinstance(ring, list):
+        return levels
+    try:
+        previous = len(ring)
+        for tolerance in TOLERANCES:
+            simplified = _simplify_ring(ring, tolerance)
+            if simplified is None:
+                break
+            if len(simplified) < previous:
+                levels[repr(tolerance)] = simplified
+                previous = len(simplified)
+    except (KeyError, TypeError, ValueError):
+        return {}
+    return levels
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    existing = {c['name'] for c in inspector.get_columns('risk_zones')}
+    if 'simplified' not in existing:
+        with op.batch_alter_table('risk_zones') as batch_op:
+            batch_op.add_column(sa.Column('simplified', sa.JSON(), nullable=True))
+
+    # Считаем упрощения существующих полигонов (зон немного — построчно)
+    table = sa.table('risk_zones', sa.column('id', sa.Integer), sa.column('coordinates', sa.JSON),
+                     sa.column('simplified', sa.JSON))
+    for row in bind.execute(sa.select(table.c.id, table.c.coordinates)).fetchall():
+        coordinates = row.coordinates
+        if isinstance(coordinates, str):
+            coordinates = json.loads(coordinates)
+        bind.execute(table.update().where(table.c.id == row.id).values(simplified=_simplify_levels(coordinates)))
+
+
+def downgrade():
+    with op.batch_alter_table('risk_zones') as batch_op:
+        batch_op.drop_column('simplified')
@@ -0,0 +1,44 @@
+"""Обратный индекс датчик -> зоны риска
+
+Revision ID: d7a3f1b9c5e2
+Revises: c4d1e7f3a2b6
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3f1b9c5e2'
+down_revision = 'c4d1e7f3a2b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('risk_zone_sensors'):
+        op.create_table(
+            'risk_zone_sensors',
+            sa.Column('zone_id', sa.String(length=50), sa.ForeignKey('risk_zones.id'), primary_key=True),
+            sa.Column('sensor_id', sa.String(length=50), primary_key=True),
+        )
+        op.create_index('ix_risk_zone_sensors_sensor_id', 'risk_zone_sensors', ['sensor_id'], unique=False)
+
+    # Заполняем индекс из related_sensor_ids существующих зон
+    zones = sa.table('risk_zones', sa.column('id', sa.String), sa.column('related_sensor_ids', sa.JSON))
+    links = sa.table('risk_zone_sensors', sa.column('zone_id', sa.String), sa.column('sensor_id', sa.String))
+    bind.execute(links.delete())
+    rows = [
+        {'zone_id': zone.id, 'sensor_id': sensor_id}
+        for zone in bind.execute(sa.select(zones.c.id, zones.c.related_sensor_ids))
+        for sensor_id in dict.fromkeys(zone.related_sensor_ids or [])
+    ]
+    if rows:
+        bind.execute(links.insert(), rows)
+
+
+def downgrade():
+    op.drop_index('ix_risk_zone_sensors_sensor_id', table_name='risk_zone_sensors', if_exists=True)
+    op.drop_table('risk_zone_sensors')
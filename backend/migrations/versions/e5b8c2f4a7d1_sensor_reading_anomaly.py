@@ -0,0 +1,36 @@
+"""Метка детектора аномалий у показаний
+
+Revision ID: e5b8c2f4a7d1
+Revises: d7a3f1b9c5e2
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8c2f4a7d1'
+down_revision = 'd7a3f1b9c5e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('sensor_readings')}
+    if 'anomaly' not in existing:
+        with op.batch_alter_table('sensor_readings') as batch_op:
+            batch_op.add_column(sa.Column('anomaly', sa.String(length=50), nullable=True))
+
+    # Частичный индекс: в нём только помеченные показания
+    op.create_index(
+        'ix_sensor_readings_anomaly', 'sensor_readings', ['sensor_id', 'timestamp'], unique=False,
+        sqlite_where=sa.text('anomaly IS NOT NULL'), postgresql_where=sa.text('anomaly IS NOT NULL'),
+        if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index('ix_sensor_readings_anomaly', table_name='sensor_readings', if_exists=True)
+    with op.batch_alter_table('sensor_readings') as batch_op:
+        batch_op.drop_column('anomaly')
@@ -0,0 +1,112 @@
+"""Часовые и суточные агрегаты показаний: таблица и заполнение по истории
+
+Revision ID: e9f4b1c7d2a5
+Revises: c8d2f6a4e1b7
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9f4b1c7d2a5'
+down_revision = 'c8d2f6a4e1b7'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# Флаги аномалий, исключающие показание из агрегатов (карантин)
+QUARANTINE_FLAGS = ('spike', 'rate')
+
+INSERT_CHUNK_SIZE = 500
+
+
+def _bucket_start(ts, resolution):
+    if resolution == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # Таблицу мог уже создать db.create_all() при старте приложения — тогда она пустая
+    if not sa.inspect(bind).has_table('sensor_reading_rollups'):
+        op.create_table(
+            'sensor_reading_rollups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('sensor_id', sa.String(length=50), nullable=False),
+            sa.Column('resolution', sa.String(length=10), nullable=False),
+            sa.Column('bucket_start', sa.DateTime(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('min_level', sa.Float(), nullable=False),
+            sa.Column('max_level', sa.Float(), nullable=False),
+            sa.Column('sum_level', sa.Float(), nullable=False),
+            sa.Column('last_level', sa.Float(), nullable=False),
+            sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['sensor_id'], ['sensors.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('sensor_id', 'resolution', 'bucket_start', name='uq_rollup_sensor_bucket')
+        )
+
+    # Пересчёт по sensor_readings (после удаления дублей и без показаний в карантине).
+    # Архивных файлов до этой ревизии нет; если архив уже вёлся — flask rebuild-rollups
+    readings = sa.table('sensor_readings', sa.column('id', sa.Integer), sa.column('sensor_id', sa.String),
+                        sa.column('timestamp', sa.DateTime), sa.column('water_level', sa.Float),
+                        sa.column('anomaly', sa.String))
+    rollups = sa.table('sensor_reading_rollups', sa.column('sensor_id', sa.String),
+                       sa.column('resolution', sa.String), sa.column('bucket_start', sa.DateTime),
+                       sa.column('count', sa.Integer), sa.column('min_level', sa.Float),
+                       sa.column('max_level', sa.Float), sa.column('sum_level', sa.Float),
+                       sa.column('last_level', sa.Float), sa.column('last_timestamp', sa.DateTime))
+
+    bind.execute(rollups.delete())
+
+    query = sa.select(readings.c.sensor_id, readings.c.timestamp, readings.c.water_level).where(
+        sa.or_(readings.c.anomaly.is_(None),
+               sa.and_(*[~readings.c.anomaly.contains(flag) for flag in QUARANTINE_FLAGS]))
+    ).order_by(readings.c.sensor_id, readings.c.timestamp, readings.c.id)
+
+    # Показания идут по датчику и времени: интервал закрывается, как только начался следующий
+    total = 0
+    written = 0
+    pending = []
+    current = {}
+    for row in bind.execution_options(yield_per=5000).execute(query):
+        total += 1
+        for resolution in ('hour', 'day'):
+            key = (row.sensor_id, _bucket_start(row.timestamp, resolution))
+            agg = current.get(resolution)
+            if agg is not None and (agg['sensor_id'], agg['bucket_start']) == key:
+                agg['count'] += 1
+                agg['sum_level'] += row.water_level
+                agg['min_level'] = min(agg['min_level'], row.water_level)
+                agg['max_level'] = max(agg['max_level'], row.water_level)
+                agg['last_level'] = row.water_level
+                agg['last_timestamp'] = row.timestamp
+                continue
+            if agg is not None:
+                pending.append(agg)
+            current[resolution] = {
+                'sensor_id': key[0], 'resolution': resolution, 'bucket_start': key[1], 'count': 1,
+                'min_level': row.water_level, 'max_level': row.water_level, 'sum_level': row.water_level,
+                'last_level': row.water_level, 'last_timestamp': row.timestamp,
+            }
+        if len(pending) >= INSERT_CHUNK_SIZE:
+            bind.execute(rollups.insert(), pending)
+            written += len(pending)
+            pending = []
+
+    pending.extend(current.values())
+    if pending:
+        bind.execute(rollups.insert(), pending)
+        written += len(pending)
+    logger.info("Агрегаты показаний пересчитаны: показаний %d, агрегатов %d", total, written)
+
+
+def downgrade():
+    op.drop_table('sensor_reading_rollups')
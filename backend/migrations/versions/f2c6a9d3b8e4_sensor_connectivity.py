@@ -0,0 +1,36 @@
+"""Интервал отчётов и состояние связи датчиков
+
+Revision ID: f2c6a9d3b8e4
+Revises: e5b8c2f4a7d1
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6a9d3b8e4'
+down_revision = 'e5b8c2f4a7d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('sensors')}
+
+    # Все датчики начинают как online — монитор переведёт молчащие при первой проверке
+    with op.batch_alter_table('sensors') as batch_op:
+        if 'report_interval' not in existing:
+            batch_op.add_column(sa.Column('report_interval', sa.Integer(), nullable=True))
+        if 'connectivity' not in existing:
+            batch_op.add_column(sa.Column('connectivity', sa.String(length=20), nullable=False, server_default='online'))
+
+    op.create_index('ix_sensors_connectivity', 'sensors', ['connectivity'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_sensors_connectivity', table_name='sensors', if_exists=True)
+    with op.batch_alter_table('sensors') as batch_op:
+        batch_op.drop_column('connectivity')
+        batch_op.drop_column('report_interval')
@@ -1,11 +1,18 @@
 from flask import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, event, inspect
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date
+from services.simplify import simplify_levels, pick as pick_simplified
 
 db = SQLAlchemy()
 
 
+def _next_revision(context):
+    """Ревизия записи для дельта-синхронизации: следующее значение счётчика её таблицы"""
+    return TableVersion.bump(context.connection, context.current_column.table.name)
+
+
 # models.py (фрагмент)
 class User(db.Model):
     __tablename__ = 'users'
@@ -56,6 +63,9 @@ class User(db.Model):
 class Sensor(db.Model):
     """Модель датчика мониторинга уровня воды"""
     __tablename__ = 'sensors'
+    __table_args__ = (
+        db.Index('ix_sensors_lat_lng', 'latitude', 'longitude'),  # выборка по bbox карты
+    )
 
     # Идентификация
     id = db.Column(db.String(50), primary_key=True)
@@ -70,14 +80,26 @@ class Sensor(db.Model):
     water_level = db.Column(db.Float, default=0.0)
     temperature = db.Column(db.Float, nullable=True)
 
+    # Пороги уровня воды (м) и материализованный уровень опасности
+    attention_threshold = db.Column(db.Float, nullable=False, default=4.0)
+    danger_threshold = db.Column(db.Float, nullable=False, default=5.0)
+    critical_threshold = db.Column(db.Float, nullable=False, default=6.0)
+    danger_level = db.Column(db.String(20), nullable=False, default='safe', index=True)  # safe, attention, danger, critical
+
     # Статус датчика
     status = db.Column(db.String(20), default='active')  # active, inactive, maintenance, error
     is_active = db.Column(db.Boolean, default=True)
 
+    # Связь с датчиком: ожидаемый интервал отчётов (с) и состояние по монитору (services.staleness)
+    report_interval = db.Column(db.Integer, nullable=True)  # None — SENSOR_REPORT_INTERVAL
+    connectivity = db.Column(db.String(20), nullable=False, default='online', index=True)  # online, stale, offline
+
     # Временные метки
     last_update = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Ревизия последнего изменения (дельта-синхронизация, services.versions.changes)
+    revision = db.Column(db.BigInteger, nullable=False, default=_next_revision, onupdate=_next_revision, index=True)
 
     # Дополнительная информация
     description = db.Column(db.Text, nullable=True)
@@ -87,16 +109,27 @@ class Sensor(db.Model):
                                cascade='all, delete-orphan', order_by='SensorReading.timestamp.desc()')
 
     def get_danger_level(self):
-        """Вычисляет уровень опасности на основе water_level"""
-        if self.water_level >= 6.0:
+        """Вычисляет уровень опасности по water_level и порогам датчика"""
+        level = self.water_level or 0.0
+        if level >= self.critical_threshold:
             return 'critical'
-        elif self.water_level >= 5.0:
+        elif level >= self.danger_threshold:
             return 'danger'
-        elif self.water_level >= 4.0:
+        elif level >= self.attention_threshold:
             return 'attention'
         else:
             return 'safe'
 
+    @classmethod
+    def danger_level_expr(cls, water_level):
+        """То же вычисление в SQL — для массовых UPDATE в обход ORM"""
+        return case(
+            (water_level >= cls.critical_threshold, 'critical'),
+            (water_level >= cls.danger_threshold, 'danger'),
+            (water_level >= cls.attention_threshold, 'attention'),
+            else_='safe'
+        )
+
     def to_dict(self):
         """Преобразует модель в словарь (формат фронтенда)"""
         return {
@@ -111,7 +144,14 @@ class Sensor(db.Model):
             'temperature': self.temperature,
             'status': self.status,
             'lastUpdate': self.last_update.isoformat() if self.last_update else None,
-            'dangerLevel': self.get_danger_level(),
+            'connectivity': self.connectivity,
+            'reportInterval': self.report_interval,
+            'dangerLevel': self.danger_level,
+            'thresholds': {
+                'attention': self.attention_threshold,
+                'danger': self.danger_threshold,
+                'critical': self.critical_threshold
+            },
             'description': self.description,
             'createdAt': self.created_at.isoformat() if self.created_at else None
         }
@@ -120,12 +160,31 @@ class Sensor(db.Model):
         return f'<Sensor {self.id}: {self.name}>'
 
 
+@event.listens_for(Sensor, 'before_insert')
+@event.listens_for(Sensor, 'before_update')
+def _refresh_sensor_danger_level(mapper, connection, target):
+    """Пересчёт danger_level при сохранении датчика через ORM (уровень или пороги могли измениться)"""
+    for name in ('attention_threshold', 'danger_threshold', 'critical_threshold'):
+        if getattr(target, name) is None:
+            setattr(target, name, Sensor.__table__.c[name].default.arg)
+    target.danger_level = target.get_danger_level()
+
+
 class SensorReading(db.Model):
     """Модель истории показаний датчика"""
     __tablename__ = 'sensor_readings'
+    __table_args__ = (
+        # История всегда читается по датчику в порядке времени; он же ключ идемпотентности —
+        # повтор показания с той же временной меткой не создаёт дубль
+        db.Index('ix_sensor_readings_sensor_id_timestamp', 'sensor_id', 'timestamp', unique=True),
+        db.Index('ix_sensor_readings_sensor_id_idempotency_key', 'sensor_id', 'idempotency_key', unique=True),
+        # Частичный индекс: только помеченные детектором аномалий показания (их единицы на миллионы)
+        db.Index('ix_sensor_readings_anomaly', 'sensor_id', 'timestamp',
+                 sqlite_where=db.text('anomaly IS NOT NULL'), postgresql_where=db.text('anomaly IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    sensor_id = db.Column(db.String(50), db.ForeignKey('sensors.id'), nullable=False, index=True)
+    sensor_id = db.Column(db.String(50), db.ForeignKey('sensors.id'), nullable=False)
 
     # Показания
     water_level = db.Column(db.Float, nullable=False)
@@ -137,6 +196,12 @@ class SensorReading(db.Model):
     # Дополнительные данные (для будущего расширения)
     extra_data = db.Column(db.JSON, nullable=True)
 
+    # Ключ идемпотентности от шлюза (опционально) — для повторов без временной метки
+    idempotency_key = db.Column(db.String(64), nullable=True)
+
+    # Метки детектора аномалий через запятую (spike, rate, flatline, level_shift); подробности — в extra_data
+    anomaly = db.Column(db.String(50), nullable=True)
+
     def to_dict(self):
         """Преобразует показание в словарь"""
         return {
@@ -145,13 +210,144 @@ class SensorReading(db.Model):
             'waterLevel': self.water_level,
             'temperature': self.temperature,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
-            'extraData': self.extra_data
+            'extraData': self.extra_data,
+            'anomaly': self.anomaly.split(',') if self.anomaly else None
         }
 
     def __repr__(self):
         return f'<SensorReading sensor={self.sensor_id} level={self.water_level}m at {self.timestamp}>'
 
 
+class SensorReadingRollup(db.Model):
+    """Агрегаты показаний датчика за час/сутки (поддерживаются при приёме показаний)"""
+    __tablename__ = 'sensor_reading_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('sensor_id', 'resolution', 'bucket_start', name='uq_rollup_sensor_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    sensor_id = db.Column(db.String(50), db.ForeignKey('sensors.id'), nullable=False)
+
+    # Разрешение (hour, day) и начало интервала
+    resolution = db.Column(db.String(10), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+
+    # Агрегаты уровня воды (среднее = sum_level / count)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    min_level = db.Column(db.Float, nullable=False)
+    max_level = db.Column(db.Float, nullable=False)
+    sum_level = db.Column(db.Float, nullable=False, default=0.0)
+    last_level = db.Column(db.Float, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+
+    def to_dict(self):
+        """Преобразует агрегат в словарь (waterLevel — среднее, как у сырых показаний)"""
+        mean = round(self.sum_level / self.count, 3) if self.count else None
+        return {
+            'sensorId': self.sensor_id,
+            'resolution': self.resolution,
+            'timestamp': self.bucket_start.isoformat() if self.bucket_start else None,
+            'waterLevel': mean,
+            'mean': mean,
+            'min': self.min_level,
+            'max': self.max_level,
+            'last': self.last_level,
+            'count': self.count
+        }
+
+    def __repr__(self):
+        return f'<SensorReadingRollup sensor={self.sensor_id} {self.resolution} {self.bucket_start}>'
+
+
+class SensorReadingArchive(db.Model):
+    """Манифест архива: какие показания датчика за какой месяц вынесены в файл"""
+    __tablename__ = 'sensor_reading_archives'
+    __table_args__ = (
+        db.UniqueConstraint('sensor_id', 'month', name='uq_archive_sensor_month'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    sensor_id = db.Column(db.String(50), db.ForeignKey('sensors.id'), nullable=False, index=True)
+
+    # Месяц архива (YYYY-MM) и его границы [period_start, period_end)
+    month = db.Column(db.String(7), nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+    period_end = db.Column(db.DateTime, nullable=False)
+
+    # Файл относительно SENSOR_ARCHIVE_DIR
+    path = db.Column(db.String(500), nullable=False)
+    row_count = db.Column(db.Integer, default=0)
+    size_bytes = db.Column(db.Integer, default=0)
+
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'sensorId': self.sensor_id,
+            'month': self.month,
+            'periodStart': self.period_start.isoformat() if self.period_start else None,
+            'periodEnd': self.period_end.isoformat() if self.period_end else None,
+            'path': self.path,
+            'rowCount': self.row_count,
+            'sizeBytes': self.size_bytes,
+            'archivedAt': self.archived_at.isoformat() if self.archived_at else None
+        }
+
+    def __repr__(self):
+        return f'<SensorReadingArchive sensor={self.sensor_id} {self.month} rows={self.row_count}>'
+
+
+class SensorForecastModel(db.Model):
+    """Параметры модели прогноза уровня воды датчика (Хольт с затухающим трендом)"""
+    __tablename__ = 'sensor_forecast_models'
+
+    sensor_id = db.Column(db.String(50), db.ForeignKey('sensors.id'), primary_key=True)
+    level = db.Column(db.Float, nullable=False)  # сглаженный уровень, м
+    trend = db.Column(db.Float, nullable=False, default=0.0)  # м/ч
+    variance = db.Column(db.Float, nullable=False, default=0.0)  # EWMA квадрата ошибки прогноза на шаг
+    abs_error = db.Column(db.Float, nullable=False, default=0.0)  # EWMA модуля ошибки прогноза на шаг
+    observations = db.Column(db.Integer, nullable=False, default=0)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SensorForecastModel {self.sensor_id}: level={self.level} trend={self.trend}>'
+
+
+class SensorAnomalyState(db.Model):
+    """Состояние детектора аномалий датчика: экспоненциальные среднее и дисперсия (Уэлфорд)"""
+    __tablename__ = 'sensor_anomaly_states'
+
+    sensor_id = db.Column(db.String(50), db.ForeignKey('sensors.id'), primary_key=True)
+    mean = db.Column(db.Float, nullable=False, default=0.0)
+    variance = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)  # принятых показаний (для разогрева)
+
+    # Последнее принятое показание — база для ограничения скорости изменения
+    last_value = db.Column(db.Float, nullable=True)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+
+    flat_count = db.Column(db.Integer, nullable=False, default=0)  # подряд одинаковых значений
+    reject_count = db.Column(db.Integer, nullable=False, default=0)  # подряд отклонённых показаний
+
+    def __repr__(self):
+        return f'<SensorAnomalyState {self.sensor_id}: mean={self.mean}>'
+
+
+class SensorAlertState(db.Model):
+    """Состояние оповещений датчика: последний объявленный уровень и ожидающий переход (debounce)"""
+    __tablename__ = 'sensor_alert_states'
+
+    sensor_id = db.Column(db.String(50), db.ForeignKey('sensors.id'), primary_key=True)
+    level = db.Column(db.String(20), nullable=False, default='safe')  # safe, attention, danger, critical
+    pending_level = db.Column(db.String(20), nullable=True)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SensorAlertState {self.sensor_id}: {self.level}>'
+
+
 class RiskZone(db.Model):
     """Модель зоны риска затопления"""
     __tablename__ = 'risk_zones'
@@ -167,6 +363,8 @@ class RiskZone(db.Model):
 
     # Координаты полигона (храним как JSON)
     coordinates = db.Column(db.JSON, nullable=False)
+    # Упрощения полигона для мелких масштабов: {'допуск': кольцо} (services.simplify)
+    simplified = db.Column(db.JSON, nullable=True)
 
     # Текущие вычисляемые/сохранённые показатели, необходимые для UI
     water_level = db.Column(db.Float, default=0.0)
@@ -189,16 +387,22 @@ class RiskZone(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Ревизия последнего изменения (дельта-синхронизация, services.versions.changes)
+    revision = db.Column(db.BigInteger, nullable=False, default=_next_revision, onupdate=_next_revision, index=True)
 
-    def to_dict(self):
-        """Преобразует зону в словарь (формат фронтенда)"""
+    def coordinates_at(self, tolerance):
+        """Полигон, упрощённый с допуском не больше tolerance (градусы), и фактический допуск"""
+        return pick_simplified(self.coordinates, self.simplified, tolerance)
+
+    def to_dict(self, tolerance=None):
+        """Преобразует зону в словарь (формат фронтенда); tolerance — упрощённый полигон"""
         return {
             'id': self.id,
             'name': self.name,
             'type': self.type,
             'location': self.location or self.name,
             'region': self.region,
-            'coordinates': self.coordinates,
+            'coordinates': self.coordinates_at(tolerance)[0],
             'waterLevel': self.water_level,
             'threshold': self.threshold,
             'trend': self.trend,
@@ -214,6 +418,38 @@ class RiskZone(db.Model):
         return f'<RiskZone {self.id}: {self.name} ({self.type})>'
 
 
+class RiskZoneSensor(db.Model):
+    """Обратный индекс датчик -> зоны риска (строится из RiskZone.related_sensor_ids)"""
+    __tablename__ = 'risk_zone_sensors'
+
+    zone_id = db.Column(db.String(50), db.ForeignKey('risk_zones.id'), primary_key=True)
+    sensor_id = db.Column(db.String(50), primary_key=True, index=True)
+
+    def __repr__(self):
+        return f'<RiskZoneSensor {self.sensor_id} -> {self.zone_id}>'
+
+
+@event.listens_for(RiskZone, 'before_insert')
+@event.listens_for(RiskZone, 'before_update')
+def _refresh_simplified(mapper, connection, target):
+    """Пересчёт упрощений полигона при изменении coordinates"""
+    if target.simplified is None or inspect(target).attrs.coordinates.history.has_changes():
+        target.simplified = simplify_levels(target.coordinates)
+
+
+@event.listens_for(RiskZone, 'after_insert')
+@event.listens_for(RiskZone, 'after_update')
+def _sync_risk_zone_sensors(mapper, connection, target):
+    """Перестраивает обратный индекс зоны при изменении related_sensor_ids"""
+    if not inspect(target).attrs.related_sensor_ids.history.has_changes():
+        return
+    table = RiskZoneSensor.__table__
+    connection.execute(table.delete().where(table.c.zone_id == target.id))
+    sensor_ids = list(dict.fromkeys(target.related_sensor_ids or []))
+    if sensor_ids:
+        connection.execute(table.insert(), [{'zone_id': target.id, 'sensor_id': sid} for sid in sensor_ids])
+
+
 class Notification(db.Model):
     """Модель уведомлений для пользователей"""
     __tablename__ = 'notifications'
@@ -324,6 +560,9 @@ class HydroFacility(db.Model):
     количество проблем/алертов и доп.метаданные.
     """
     __tablename__ = 'hydro_facilities'
+    __table_args__ = (
+        db.Index('ix_hydro_facilities_lat_lng', 'latitude', 'longitude'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False, index=True)
@@ -357,6 +596,9 @@ class HydroFacility(db.Model):
 
     # Геоданные (опционально) — хранить как JSON или отдельные поля lat/lng
     coordinates = db.Column(db.JSON, nullable=True)
+    # Точка объекта числами — заполняется из coordinates при сохранении (выборка по bbox карты)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
 
     # Связи/метаданные
     related_sensor_ids = db.Column(db.JSON, nullable=True)  # список id датчиков, связанных с объектом
@@ -365,6 +607,8 @@ class HydroFacility(db.Model):
     # Метаданные времени
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Ревизия последнего изменения (дельта-синхронизация, services.versions.changes)
+    revision = db.Column(db.BigInteger, nullable=False, default=_next_revision, onupdate=_next_revision, index=True)
 
     def calculate_priority(self):
         """Вычисляет приоритетный балл и уровень на основе технического состояния и возраста паспорта"""
@@ -434,6 +678,9 @@ class WaterBody(db.Model):
     Представляет естественные и искусственные водные объекты для системы мониторинга.
     """
     __tablename__ = 'water_bodies'
+    __table_args__ = (
+        db.Index('ix_water_bodies_lat_lng', 'latitude', 'longitude'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False, index=True)
@@ -442,6 +689,9 @@ class WaterBody(db.Model):
 
     # Геоданные
     coordinates = db.Column(db.JSON, nullable=True)  # полигон или точка
+    # Точка объекта числами (для полигона — центр вершин), заполняется из coordinates при сохранении
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
     length = db.Column(db.Float, nullable=True)  # для рек (км)
     area = db.Column(db.Float, nullable=True)  # для озёр/водохранилищ (км²)
 
@@ -468,6 +718,8 @@ class WaterBody(db.Model):
     # Метаданные
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Ревизия последнего изменения (дельта-синхронизация, services.versions.changes)
+    revision = db.Column(db.BigInteger, nullable=False, default=_next_revision, onupdate=_next_revision, index=True)
 
     def calculate_priority(self):
         """Вычисляет приоритетный балл (аналогично HydroFacility)"""
@@ -524,6 +776,28 @@ class WaterBody(db.Model):
         return f'<WaterBody {self.id}: {self.name} ({self.type})>'
 
 
+def coordinates_point(coordinates):
+    """(lat, lng) из JSON coordinates: точка {'lat', 'lng'} или центр вершин полигона [{'lat', 'lng'}, ...]"""
+    if isinstance(coordinates, dict):
+        coordinates = [coordinates]
+    try:
+        points = [(float(p['lat']), float(p['lng'])) for p in coordinates or []]
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    if not points:
+        return None, None
+    return sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+
+
+@event.listens_for(HydroFacility, 'before_insert')
+@event.listens_for(HydroFacility, 'before_update')
+@event.listens_for(WaterBody, 'before_insert')
+@event.listens_for(WaterBody, 'before_update')
+def _refresh_point(mapper, connection, target):
+    """Числовые latitude/longitude из coordinates — по ним индекс и выборка по bbox карты"""
+    target.latitude, target.longitude = coordinates_point(target.coordinates)
+
+
 class Report(db.Model):
     """Модель отчёта МЧС
     Представляет различные типы отчётов: еженедельные, месячные, по инцидентам, по эвакуациям.
@@ -594,3 +868,63 @@ class Report(db.Model):
     def __repr__(self):
         return f'<Report {self.id}: {self.title} ({self.type})>'
 
+
+
+class TableVersion(db.Model):
+    """Счётчик версий таблицы: увеличивается при каждой записи в неё (services.versions)"""
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    @staticmethod
+    def bump(connection, name):
+        """Увеличивает счётчик таблицы name в текущей транзакции и возвращает новое значение"""
+        if connection.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        table = TableVersion.__table__
+        stmt = insert(table).values(name=name, version=1, updated_at=datetime.utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={'version': table.c.version + 1, 'updated_at': stmt.excluded.updated_at}
+        ).returning(table.c.version)
+        return connection.execute(stmt).scalar_one()
+
+    def __repr__(self):
+        return f'<TableVersion {self.name}: {self.version}>'
+
+
+class SyncTombstone(db.Model):
+    """Удалённая запись отслеживаемой таблицы: клиенты дельта-синхронизации узнают о ней по ревизии"""
+    __tablename__ = 'sync_tombstones'
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    record_id = db.Column(db.String(64), nullable=False)
+    revision = db.Column(db.BigInteger, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_sync_tombstones_table_revision', 'table_name', 'revision'),
+    )
+
+    def __repr__(self):
+        return f'<SyncTombstone {self.table_name}:{self.record_id} @{self.revision}>'
+
+
+def _record_tombstone(mapper, connection, target):
+    """Удаление записи увеличивает счётчик таблицы и оставляет надгробие с этой ревизией"""
+    name = mapper.local_table.name
+    connection.execute(SyncTombstone.__table__.insert().values(
+        table_name=name,
+        record_id=str(target.id),
+        revision=TableVersion.bump(connection, name),
+        deleted_at=datetime.utcnow()
+    ))
+
+
+for _model in (Sensor, RiskZone, HydroFacility, WaterBody):
+    event.listen(_model, 'after_delete', _record_tombstone)
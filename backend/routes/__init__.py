@@ -7,6 +7,7 @@ from routes.facilities import facilities_bp
 from routes.reports import reports_bp
 from routes.map import map_bp
 from routes.admin import admin_bp
+from routes.predictions import predictions_bp
 
 
 __all__ = [
@@ -19,4 +20,5 @@ __all__ = [
     'reports_bp',
     'map_bp',
     'admin_bp',
+    'predictions_bp',
 ]
\ No newline at end of file
@@ -1,6 +1,7 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt
 from models import db, User, HydroFacility, WaterBody, Sensor
+from services import forecast
 from datetime import datetime, timedelta
 import psutil
 import os
@@ -221,7 +222,7 @@ def get_system_analytics():
 @jwt_required()
 def get_ai_models():
     """
-    Получить список AI моделей (mock данные)
+    Получить список AI моделей (прогноз уровня воды — реальные метрики, остальное mock)
     GET /api/admin/ai/models
     """
     error = require_admin()
@@ -229,36 +230,30 @@ def get_ai_models():
         return error
 
     try:
-        # Mock данные для AI моделей
+        # Прогноз уровня воды — реальные модели датчиков (services.forecast)
+        stats = forecast.summary()
+        config = current_app.config
         models = [
             {
-                'id': 'lstm-water-level',
+                'id': 'holt-water-level',
                 'name': 'Прогнозирование уровня воды',
-                'type': 'LSTM',
-                'version': '1.2.0',
-                'status': 'active',
-                'accuracy': 94.2,
-                'lastTrained': (datetime.utcnow() - timedelta(days=3)).isoformat(),
-                'datasetSize': 50000,
+                'type': 'Holt (damped trend)',
+                'version': '2.0.0',
+                'status': 'active' if stats['models'] else 'idle',
+                'lastTrained': stats['updatedAt'].isoformat() if stats['updatedAt'] else None,
+                'datasetSize': stats['observations'],
                 'parameters': {
-                    'epochs': 100,
-                    'batchSize': 32,
-                    'learningRate': 0.001,
-                    'layers': 3,
-                    'neurons': 128
+                    'alpha': config['SENSOR_FORECAST_ALPHA'],
+                    'beta': config['SENSOR_FORECAST_BETA'],
+                    'phi': config['SENSOR_FORECAST_PHI'],
+                    'fitHours': config['SENSOR_FORECAST_FIT_HOURS'],
+                    'horizons': config['SENSOR_FORECAST_HORIZONS']
                 },
                 'metrics': {
-                    'mse': 0.042,
-                    'rmse': 0.205,
-                    'mae': 0.156,
-                    'r2': 0.942
-                },
-                'resources': {
-                    'cpu': 15,
-                    'memory': 2.4,
-                    'gpu': 0
+                    'rmse': round(stats['rmse'], 4),
+                    'mae': round(stats['mae'], 4)
                 },
-                'predictions': 12453
+                'predictions': stats['models']
             },
             {
                 'id': 'rf-condition',
@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt
 from models import db, HydroFacility, WaterBody
 from datetime import datetime
+from services.versions import conditional, watermark, parse_since, changes
+from services.response_cache import response_cache
 
 facilities_bp = Blueprint('facilities', __name__)
 
@@ -28,9 +30,30 @@ def validate_facility_data(data, partial=False):
 
 
 @facilities_bp.route('', methods=['GET'])
+@conditional('hydro_facilities')
 def list_facilities():
-    """Получить список всех объектов ГТС с возможностью фильтрации и приоритизации"""
+    """
+    Получить список всех объектов ГТС с возможностью фильтрации и приоритизации.
+    since — водяной знак прошлой синхронизации: только изменённые после него объекты
+    и id удалённых (фильтры и сортировка не применяются)
+    """
     try:
+        since = parse_since()
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр since'}), 400
+
+    try:
+        mark = watermark('hydro_facilities')
+        if since is not None and since <= mark:
+            facilities, deleted = changes(HydroFacility, since)
+            return jsonify({
+                'success': True,
+                'data': [f.to_dict() for f in facilities],
+                'deleted': deleted,
+                'watermark': mark,
+                'count': len(facilities)
+            }), 200
+
         query = HydroFacility.query
 
         # Фильтрация по региону
@@ -106,6 +129,7 @@ def list_facilities():
             'success': True,
             'data': [f.to_dict() for f in facilities],
             'stats': stats,
+            'watermark': mark,
             'count': len(facilities)
         }), 200
     except Exception as e:
@@ -114,6 +138,7 @@ def list_facilities():
 
 
 @facilities_bp.route('/<int:fid>', methods=['GET'])
+@conditional('hydro_facilities')
 def get_facility(fid):
     try:
         f = HydroFacility.query.get(fid)
@@ -165,6 +190,7 @@ def create_facility():
 
         db.session.add(facility)
         db.session.commit()
+        response_cache.invalidate('hydro_facilities')
 
         return jsonify({'success': True, 'message': 'ГТС создано', 'data': facility.to_dict()}), 201
     except Exception as e:
@@ -229,6 +255,7 @@ def update_facility(fid):
 
         f.updated_at = datetime.utcnow()
         db.session.commit()
+        response_cache.invalidate('hydro_facilities')
 
         return jsonify({'success': True, 'message': 'ГТС обновлено', 'data': f.to_dict()}), 200
     except Exception as e:
@@ -253,6 +280,7 @@ def delete_facility(fid):
         f.status = 'inactive'
         f.updated_at = datetime.utcnow()
         db.session.commit()
+        response_cache.invalidate('hydro_facilities')
 
         return jsonify({'success': True, 'message': 'ГТС удалено (помечено как неактивно)'}), 200
     except Exception as e:
@@ -264,9 +292,26 @@ def delete_facility(fid):
 # ===== Маршруты для водных объектов =====
 
 @facilities_bp.route('/water-bodies', methods=['GET'])
+@conditional('water_bodies')
 def list_water_bodies():
-    """Получить список всех водных объектов"""
+    """Получить список всех водных объектов (since — дельта-синхронизация, как у ГТС)"""
     try:
+        since = parse_since()
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр since'}), 400
+
+    try:
+        mark = watermark('water_bodies')
+        if since is not None and since <= mark:
+            water_bodies, deleted = changes(WaterBody, since)
+            return jsonify({
+                'success': True,
+                'data': [wb.to_dict() for wb in water_bodies],
+                'deleted': deleted,
+                'watermark': mark,
+                'count': len(water_bodies)
+            }), 200
+
         query = WaterBody.query
 
         # Фильтрация по региону
@@ -284,6 +329,7 @@ def list_water_bodies():
         return jsonify({
             'success': True,
             'data': [wb.to_dict() for wb in water_bodies],
+            'watermark': mark,
             'count': len(water_bodies)
         }), 200
     except Exception as e:
@@ -292,6 +338,7 @@ def list_water_bodies():
 
 
 @facilities_bp.route('/water-bodies/<int:wbid>', methods=['GET'])
+@conditional('water_bodies')
 def get_water_body(wbid):
     """Получить один водный объект по ID"""
     try:
@@ -343,6 +390,7 @@ def create_water_body():
 
         db.session.add(water_body)
         db.session.commit()
+        response_cache.invalidate('water_bodies')
 
         return jsonify({'success': True, 'message': 'Водный объект создан', 'data': water_body.to_dict()}), 201
     except Exception as e:
@@ -406,6 +454,7 @@ def update_water_body(wbid):
 
         wb.updated_at = datetime.utcnow()
         db.session.commit()
+        response_cache.invalidate('water_bodies')
 
         return jsonify({'success': True, 'message': 'Водный объект обновлён', 'data': wb.to_dict()}), 200
     except Exception as e:
@@ -430,6 +479,7 @@ def delete_water_body(wbid):
         # Hard delete
         db.session.delete(wb)
         db.session.commit()
+        response_cache.invalidate('water_bodies')
 
         return jsonify({'success': True, 'message': 'Водный объект удалён'}), 200
     except Exception as e:
@@ -1,7 +1,13 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, WaterBody, HydroFacility, Sensor, User
 from datetime import datetime
+import hashlib
+from sqlalchemy import or_
+from services.versions import conditional
+from services.response_cache import response_cache
+from services.spatial import spatial_index, parse_bbox, parse_zoom
+from services.tiles import tile_cache, LAYERS as TILE_LAYERS
 
 map_bp = Blueprint('map', __name__)
 
@@ -10,6 +16,7 @@ map_bp = Blueprint('map', __name__)
 # =====================
 
 @map_bp.route('/waterbodies', methods=['GET'])
+@conditional('water_bodies')
 def get_waterbodies():
     """
     Получить все водные объекты для карты
@@ -17,9 +24,20 @@ def get_waterbodies():
     Query параметры:
     - region: фильтр по региону (опционально)
     - condition: фильтр по техническому состоянию (опционально)
+    - bbox: minLng,minLat,maxLng,maxLat — только объекты в видимой области (опционально)
+    - zoom: масштаб карты; до MAP_CLUSTER_MAX_ZOOM вместо объектов — кластеры
+      (count, центроид, худшее состояние condition), прочие фильтры кроме bbox не применяются
     """
     region = request.args.get('region')
     condition = request.args.get('condition', type=int)
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        zoom = parse_zoom(request.args.get('zoom'))
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр bbox или zoom'}), 400
+
+    if zoom is not None and zoom <= spatial_index.max_zoom:
+        return jsonify(spatial_index.clusters('water_bodies', zoom, bbox)), 200
 
     query = WaterBody.query
 
@@ -27,6 +45,9 @@ def get_waterbodies():
     if region and region != 'all':
         query = query.filter(WaterBody.region.ilike(f'%{region}%'))
 
+    if bbox:
+        query = query.filter(WaterBody.id.in_(spatial_index.query('water_bodies', bbox)))
+
     water_bodies = query.all()
 
     # Преобразуем в формат для карты
@@ -68,6 +89,7 @@ def get_waterbodies():
 
 
 @map_bp.route('/waterbodies/<int:id>', methods=['GET'])
+@conditional('water_bodies')
 def get_waterbody_details(id):
     """Получить детальную информацию о водном объекте"""
     wb = WaterBody.query.get_or_404(id)
@@ -97,6 +119,7 @@ def get_waterbody_details(id):
 
 
 @map_bp.route('/facilities', methods=['GET'])
+@conditional('hydro_facilities')
 def get_facilities():
     """
     Получить все гидротехнические сооружения для карты
@@ -104,9 +127,20 @@ def get_facilities():
     Query параметры:
     - region: фильтр по региону (опционально)
     - condition: фильтр по техническому состоянию (опционально)
+    - bbox: minLng,minLat,maxLng,maxLat — только объекты в видимой области (опционально)
+    - zoom: масштаб карты; до MAP_CLUSTER_MAX_ZOOM вместо объектов — кластеры
+      (count, центроид, худшее состояние condition), прочие фильтры кроме bbox не применяются
     """
     region = request.args.get('region')
     condition = request.args.get('condition', type=int)
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        zoom = parse_zoom(request.args.get('zoom'))
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр bbox или zoom'}), 400
+
+    if zoom is not None and zoom <= spatial_index.max_zoom:
+        return jsonify(spatial_index.clusters('hydro_facilities', zoom, bbox)), 200
 
     query = HydroFacility.query
 
@@ -117,6 +151,9 @@ def get_facilities():
     if condition:
         query = query.filter(HydroFacility.technical_condition == condition)
 
+    if bbox:
+        query = query.filter(HydroFacility.id.in_(spatial_index.query('hydro_facilities', bbox)))
+
     facilities = query.all()
 
     # Преобразуем в формат для карты
@@ -159,6 +196,7 @@ def get_facilities():
 
 
 @map_bp.route('/facilities/<int:id>', methods=['GET'])
+@conditional('hydro_facilities')
 def get_facility_details(id):
     """Получить детальную информацию о ГТС"""
     facility = HydroFacility.query.get_or_404(id)
@@ -198,8 +236,13 @@ def get_critical_zones():
 
     Query параметры:
     - region: фильтр по региону (опционально)
+    - bbox: minLng,minLat,maxLng,maxLat (опционально)
     """
     region = request.args.get('region')
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр bbox'}), 400
 
     # TODO: Создать модель CriticalZone
     # Пока возвращаем моковые данные
@@ -240,29 +283,56 @@ def get_critical_zones():
     if region and region != 'all':
         mock_zones = [z for z in mock_zones if region.lower() in z['region'].lower()]
 
+    if bbox:
+        min_lng, min_lat, max_lng, max_lat = bbox
+        mock_zones = [
+            z for z in mock_zones
+            if min_lat <= z['lat'] <= max_lat
+            and (min_lng <= z['lng'] <= max_lng if min_lng <= max_lng else (z['lng'] >= min_lng or z['lng'] <= max_lng))
+        ]
+
     return jsonify(mock_zones), 200
 
 
 @map_bp.route('/sensors', methods=['GET'])
+@conditional('sensors')
 def get_map_sensors():
     """
     Получить датчики для отображения на карте
 
     Query параметры:
     - region: фильтр по региону (опционально)
-    - status: фильтр по статусу (online/offline) (опционально)
+    - status: фильтр по связи (online/stale/offline) или статусу датчика (опционально)
+    - bbox: minLng,minLat,maxLng,maxLat — только датчики в видимой области (опционально)
+    - zoom: масштаб карты; до MAP_CLUSTER_MAX_ZOOM вместо датчиков — кластеры
+      (count, центроид, худший dangerLevel), прочие фильтры кроме bbox не применяются
     """
     region = request.args.get('region')
     status_filter = request.args.get('status')
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        zoom = parse_zoom(request.args.get('zoom'))
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр bbox или zoom'}), 400
+
+    if zoom is not None and zoom <= spatial_index.max_zoom:
+        return jsonify(spatial_index.clusters('sensors', zoom, bbox)), 200
 
     query = Sensor.query.filter_by(is_active=True)
 
+    if bbox:
+        query = query.filter(Sensor.id.in_(spatial_index.query('sensors', bbox)))
+
     # Фильтрация по региону
     if region and region != 'all':
         query = query.filter(Sensor.location.ilike(f'%{region}%'))
 
-    # Фильтрация по статусу
-    if status_filter:
+    # Фильтрация по статусу: online/stale — по монитору связи, offline — ещё и выведенные из работы
+    if status_filter in ['online', 'stale']:
+        query = query.filter(Sensor.status == 'active', Sensor.connectivity == status_filter)
+    elif status_filter == 'offline':
+        query = query.filter(or_(Sensor.status != 'active', Sensor.connectivity == 'offline'))
+    elif status_filter:
         query = query.filter(Sensor.status == status_filter)
 
     sensors = query.all()
@@ -277,17 +347,43 @@ def get_map_sensors():
             'region': s.location,  # можно улучшить, добавив отдельное поле region в модель
             'lat': s.latitude,
             'lng': s.longitude,
-            'status': 'online' if s.status == 'active' else 'offline',
+            'status': s.connectivity if s.status == 'active' else 'offline',
             'type': 'level',  # можно добавить тип датчика в модель
             'waterLevel': s.water_level,
             'temperature': s.temperature,
             'lastUpdate': s.last_update.isoformat() if s.last_update else None,
-            'dangerLevel': s.get_danger_level()
+            'isStale': s.connectivity != 'online',  # waterLevel может быть неактуален
+            'dangerLevel': s.danger_level
         })
 
     return jsonify(result), 200
 
 
+@map_bp.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(layer, z, x, y):
+    """
+    Тайл слоя карты (схема XYZ) в виде GeoJSON FeatureCollection
+
+    Слои: sensors, facilities, waterbodies, zones (полигоны зон риска)
+    """
+    if layer not in TILE_LAYERS:
+        return jsonify({'error': 'Неизвестный слой'}), 404
+    if z > tile_cache.max_zoom or x >= (1 << z) or y >= (1 << z):
+        return jsonify({'error': 'Тайл не найден'}), 404
+
+    try:
+        body = tile_cache.get(layer, z, x, y)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка построения тайла: {e}")
+        return jsonify({'error': 'Ошибка при построении тайла'}), 500
+
+    response = Response(body, mimetype='application/geo+json')
+    response.set_etag(hashlib.sha1(body).hexdigest()[:20])
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['MAP_TILE_MAX_AGE']}"
+    return response.make_conditional(request)
+
+
 # =====================
 # ADMIN ENDPOINTS (требуют авторизации)
 # =====================
@@ -337,6 +433,7 @@ def admin_create_waterbody():
 
     db.session.add(wb)
     db.session.commit()
+    response_cache.invalidate('water_bodies')
 
     return jsonify({
         'id': wb.id,
@@ -380,6 +477,7 @@ def admin_update_waterbody(id):
 
     wb.updated_at = datetime.utcnow()
     db.session.commit()
+    response_cache.invalidate('water_bodies')
 
     return jsonify({
         'id': wb.id,
@@ -403,6 +501,7 @@ def admin_delete_waterbody(id):
     wb = WaterBody.query.get_or_404(id)
     db.session.delete(wb)
     db.session.commit()
+    response_cache.invalidate('water_bodies')
 
     return jsonify({'message': 'Объект удалён'}), 200
 
@@ -451,6 +550,7 @@ def admin_create_facility():
 
     db.session.add(facility)
     db.session.commit()
+    response_cache.invalidate('hydro_facilities')
 
     priority = facility.calculate_priority()
 
@@ -499,6 +599,7 @@ def admin_update_facility(id):
 
     facility.updated_at = datetime.utcnow()
     db.session.commit()
+    response_cache.invalidate('hydro_facilities')
 
     priority = facility.calculate_priority()
 
@@ -526,6 +627,7 @@ def admin_delete_facility(id):
     facility = HydroFacility.query.get_or_404(id)
     db.session.delete(facility)
     db.session.commit()
+    response_cache.invalidate('hydro_facilities')
 
     return jsonify({'message': 'ГТС удалено'}), 200
 
@@ -0,0 +1,208 @@
+from flask import Blueprint, request, jsonify, current_app
+from models import db, Sensor
+from datetime import datetime
+import numpy as np
+from services import forecast
+
+predictions_bp = Blueprint('predictions', __name__)
+
+
+RISKS = ['low', 'medium', 'high']
+
+RECOMMENDATIONS = {
+    'high': ['Срочно эвакуировать', 'Закрыть переезды', 'Активировать защиту'],
+    'medium': ['Подготовить средства защиты', 'Предупредить население'],
+    'low': ['Продолжать мониторинг'],
+}
+
+
+def _timeframe(hours):
+    """Человекочитаемый срок до достижения порога"""
+    if hours <= 0:
+        return 'уже достигнут'
+    if hours < 1:
+        return 'менее часа'
+    if hours < 24:
+        return f'{int(np.ceil(hours))} ч'
+    return f'{int(np.ceil(hours / 24))} сут'
+
+
+def build_predictions(sensors, horizon):
+    """
+    Прогнозы по датчикам в формате фронтенда: одно векторное вычисление по всему списку.
+    Возвращает (прогнозы, id датчиков без обученной модели).
+    """
+    horizons = sorted(set(current_app.config['SENSOR_FORECAST_HORIZONS']) | {horizon})
+    result = forecast.forecast([s.id for s in sensors], horizons)
+    if not result['sensorIds']:
+        return [], result['missing']
+
+    by_id = {s.id: s for s in sensors}
+    chosen = [by_id[sid] for sid in result['sensorIds']]
+    models = result['models']
+    phi = current_app.config['SENSOR_FORECAST_PHI']
+    column = horizons.index(horizon)
+
+    attention = np.array([s.attention_threshold for s in chosen])
+    danger = np.array([s.danger_threshold for s in chosen])
+    critical = np.array([s.critical_threshold for s in chosen])
+    level = np.array([models[s.id].level for s in chosen])
+    trend = result['trend']
+
+    # Сроки считаются от последнего показания — переводим их на «сейчас»
+    now = datetime.utcnow()
+    lag = np.array([max((now - models[s.id].last_timestamp).total_seconds() / 3600.0, 0.0) for s in chosen])
+    hours_to_danger = np.maximum(forecast.hours_to(level, trend, danger, phi) - lag, 0.0)
+    hours_to_critical = np.maximum(forecast.hours_to(level, trend, critical, phi) - lag, 0.0)
+
+    predicted = result['value'][:, column]
+    upper = result['upper'][:, column]
+    predicted_level = np.select(
+        [predicted >= critical, predicted >= danger, predicted >= attention],
+        ['critical', 'danger', 'attention'], default='safe'
+    )
+    # high — прогноз достигает критического уровня; medium — опасного, или критический в пределах 95% интервала
+    risk = np.select(
+        [hours_to_critical <= horizon, (hours_to_danger <= horizon) | (upper >= critical)],
+        ['high', 'medium'], default='low'
+    )
+
+    # Уверенность: насколько 95% интервал узок относительно полосы порогов датчика
+    band = np.maximum(critical - attention, 0.1)
+    half_width = (result['upper'][:, column] - result['lower'][:, column]) / 2
+    confidence = np.clip(100 * (1 - half_width / band), 0, 99).round()
+
+    predictions = []
+    for i, sensor in enumerate(chosen):
+        model = models[sensor.id]
+        next_hours = hours_to_critical[i] if sensor.danger_level in ('danger', 'critical') else hours_to_danger[i]
+        predictions.append({
+            'id': sensor.id,
+            'sensorId': sensor.id,
+            'name': sensor.name,
+            'location': sensor.location,
+            'type': 'water_level',
+            'currentValue': sensor.water_level,
+            'predictedValue': round(float(predicted[i]), 3),
+            'predictedRange': {
+                'lower': round(float(result['lower'][i, column]), 3),
+                'upper': round(float(upper[i]), 3)
+            },
+            'horizon': horizon,
+            'timeframe': _timeframe(next_hours) if np.isfinite(next_hours) else f'{horizon} ч',
+            'confidence': int(confidence[i]),
+            'risk': str(risk[i]),
+            'dangerLevel': sensor.danger_level,
+            'predictedDangerLevel': str(predicted_level[i]),
+            'hoursToDanger': round(float(hours_to_danger[i]), 1) if np.isfinite(hours_to_danger[i]) else None,
+            'hoursToCritical': round(float(hours_to_critical[i]), 1) if np.isfinite(hours_to_critical[i]) else None,
+            'factors': {
+                'dangerLevel': sensor.danger_level,
+                'trend': round(float(trend[i]), 4),  # м/ч
+                'lastUpdated': model.last_timestamp.isoformat(),
+                'observations': model.observations,
+                'mae': round(model.abs_error, 4)
+            },
+            'recommendations': RECOMMENDATIONS[str(risk[i])],
+            'forecast': [
+                {
+                    'horizon': h,
+                    'value': round(float(result['value'][i, k]), 3),
+                    'lower': round(float(result['lower'][i, k]), 3),
+                    'upper': round(float(result['upper'][i, k]), 3)
+                }
+                for k, h in enumerate(horizons)
+            ],
+            'createdAt': model.updated_at.isoformat() if model.updated_at else None,
+            'coordinates': {
+                'lat': sensor.latitude,
+                'lng': sensor.longitude
+            },
+            'affectedPopulation': 0
+        })
+    return predictions, result['missing']
+
+
+def _parse_horizon():
+    config = current_app.config
+    horizon = request.args.get('horizon', config['SENSOR_FORECAST_DEFAULT_HORIZON'], type=float)
+    if horizon is None or not (0 < horizon <= max(config['SENSOR_FORECAST_HORIZONS'])):
+        return None
+    return int(horizon) if float(horizon).is_integer() else horizon
+
+
+@predictions_bp.route('', methods=['GET'])
+def get_predictions():
+    """
+    Прогноз уровня воды по всем активным датчикам
+    Доступ: PUBLIC
+
+    Query параметры:
+    - horizon: горизонт прогноза в часах (по умолчанию SENSOR_FORECAST_DEFAULT_HORIZON)
+    - risk: фильтр по риску (low, medium, high), можно через запятую
+
+    Модели обучаются при приёме показаний и командой flask fit-forecasts; датчики
+    без модели перечислены в noModel.
+    """
+    horizon = _parse_horizon()
+    if horizon is None:
+        return jsonify({'error': 'Некорректный горизонт прогноза'}), 400
+
+    risks = [r for r in request.args.get('risk', '').split(',') if r]
+    if any(r not in RISKS for r in risks):
+        return jsonify({'error': f'Допустимые значения risk: {", ".join(RISKS)}'}), 400
+
+    try:
+        sensors = Sensor.query.filter(Sensor.is_active.is_(True)).order_by(Sensor.id).all()
+        predictions, missing = build_predictions(sensors, horizon)
+        if risks:
+            predictions = [p for p in predictions if p['risk'] in risks]
+
+        # Сначала самые рискованные, внутри — по близости критического уровня
+        predictions.sort(key=lambda p: (
+            -RISKS.index(p['risk']),
+            p['hoursToCritical'] if p['hoursToCritical'] is not None else float('inf')
+        ))
+
+        return jsonify({
+            'success': True,
+            'data': predictions,
+            'count': len(predictions),
+            'noModel': missing,
+            'horizon': horizon
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка построения прогноза: {e}")
+        return jsonify({'error': 'Ошибка при построении прогноза'}), 500
+
+
+@predictions_bp.route('/<sensor_id>', methods=['GET'])
+def get_sensor_prediction(sensor_id):
+    """
+    Прогноз уровня воды по одному датчику
+    Доступ: PUBLIC
+    """
+    horizon = _parse_horizon()
+    if horizon is None:
+        return jsonify({'error': 'Некорректный горизонт прогноза'}), 400
+
+    try:
+        sensor = Sensor.query.filter_by(id=sensor_id, is_active=True).first()
+        if not sensor:
+            return jsonify({'error': 'Датчик не найден'}), 404
+
+        predictions, _ = build_predictions([sensor], horizon)
+        if not predictions:
+            return jsonify({'error': 'Модель прогноза для датчика ещё не обучена'}), 404
+
+        return jsonify({
+            'success': True,
+            'data': predictions[0]
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка построения прогноза: {e}")
+        return jsonify({'error': 'Ошибка при построении прогноза'}), 500
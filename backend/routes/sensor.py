@@ -1,14 +1,33 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, json
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from models import db, Sensor, SensorReading, RiskZone, User
+from models import db, Sensor, SensorReading, SensorReadingRollup, RiskZone, HydroFacility, User
 from datetime import datetime, timedelta
-from sqlalchemy import desc, func
+import heapq
+import numpy as np
+from sqlalchemy import desc, func, tuple_
+from services.ingest import parse_timestamp, validate_reading, store_readings, ingest_batch, ingest_stream
+from services.ingest_queue import ingest_queue
+from services.ring_buffer import ring_buffer, to_us, from_us
+from services.staleness import staleness_monitor
+from services.sensor_stream import sensor_stream
+from services.versions import conditional, watermark, parse_since, changes
+from services.response_cache import response_cache
+from services import archive, zones
+from services.anomalies import FLAGS as ANOMALY_FLAGS
+from services.downsampling import lttb_indices, resample_mean
+from services.simplify import zoom_tolerance
+from services.spatial import parse_zoom
+from services.export import export_readings, export_filename, FORMATS as EXPORT_FORMATS
+from services.rollups import RESOLUTIONS as ROLLUP_RESOLUTIONS, pick_resolution, bucket_start as rollup_bucket_start
 
 sensor_bp = Blueprint('sensor', __name__)
 
 
-def validate_sensor_data(data, partial=False):
-    """Валидация данных датчика"""
+THRESHOLD_FIELDS = ['attention_threshold', 'danger_threshold', 'critical_threshold']
+
+
+def validate_sensor_data(data, partial=False, sensor=None):
+    """Валидация данных датчика (sensor — текущий датчик при частичном обновлении)"""
     errors = []
 
     if not partial:
@@ -31,6 +50,28 @@ def validate_sensor_data(data, partial=False):
         if not isinstance(data['water_level'], (int, float)) or data['water_level'] < 0:
             errors.append('Некорректный уровень воды')
 
+    # Валидация порогов: числа, attention <= danger <= critical
+    if any(field in data for field in THRESHOLD_FIELDS):
+        thresholds = []
+        for field in THRESHOLD_FIELDS:
+            if field in data:
+                value = data[field]
+            elif sensor is not None:
+                value = getattr(sensor, field)
+            else:
+                value = Sensor.__table__.c[field].default.arg
+            if not isinstance(value, (int, float)) or value < 0:
+                errors.append(f'Некорректный порог {field}')
+            thresholds.append(value)
+        if len(errors) == 0 and not thresholds[0] <= thresholds[1] <= thresholds[2]:
+            errors.append('Пороги должны возрастать: attention <= danger <= critical')
+
+    # Валидация интервала отчётов (секунды; None — значение по умолчанию)
+    if data.get('report_interval') is not None:
+        interval = data['report_interval']
+        if isinstance(interval, bool) or not isinstance(interval, int) or interval <= 0:
+            errors.append('Некорректный интервал отчётов')
+
     # Валидация статуса
     if 'status' in data:
         valid_statuses = ['active', 'inactive', 'maintenance', 'error']
@@ -45,12 +86,33 @@ def validate_sensor_data(data, partial=False):
 # ============================================
 
 @sensor_bp.route('', methods=['GET'])
+@conditional('sensors')
 def get_all_sensors():
     """
     Получить список всех датчиков
     Доступ: PUBLIC (без авторизации)
+
+    Query параметры:
+    - since: водяной знак прошлой синхронизации — только изменённые после него датчики
+      и id удалённых (фильтры не применяются); ответ без deleted — полный список
     """
     try:
+        since = parse_since()
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр since'}), 400
+
+    try:
+        mark = watermark('sensors')
+        if since is not None and since <= mark:
+            sensors, deleted = changes(Sensor, since, visible=lambda s: s.is_active)
+            return jsonify({
+                'success': True,
+                'data': [sensor.to_dict() for sensor in sensors],
+                'deleted': deleted,
+                'watermark': mark,
+                'count': len(sensors)
+            }), 200
+
         query = Sensor.query.filter_by(is_active=True)
 
         # Фильтр по статусу
@@ -58,16 +120,17 @@ def get_all_sensors():
         if status:
             query = query.filter_by(status=status)
 
-        sensors = query.all()
-
-        # Фильтр по уровню опасности (после загрузки, т.к. это вычисляемое поле)
+        # Фильтр по уровню опасности (индексированная колонка)
         danger_level = request.args.get('danger_level')
         if danger_level:
-            sensors = [s for s in sensors if s.get_danger_level() == danger_level]
+            query = query.filter_by(danger_level=danger_level)
+
+        sensors = query.all()
 
         return jsonify({
             'success': True,
             'data': [sensor.to_dict() for sensor in sensors],
+            'watermark': mark,
             'count': len(sensors)
         }), 200
 
@@ -76,7 +139,67 @@ def get_all_sensors():
         return jsonify({'error': 'Ошибка при получении датчиков'}), 500
 
 
+@sensor_bp.route('/stream', methods=['GET'])
+def stream_sensors():
+    """
+    Поток изменений датчиков (Server-Sent Events) вместо периодического опроса GET /api/sensors
+    Доступ: PUBLIC
+
+    Query параметры:
+    - since: водяной знак из GET /api/sensors — сначала придут изменения после него
+      (при переподключении браузер сам присылает Last-Event-ID)
+
+    События: sensors (изменённые датчики и id удалённых), danger (переход уровня
+    опасности), reset (перечитать полный список)
+
+    Число подписчиков на процесс ограничено (SENSOR_STREAM_MAX_SUBSCRIBERS): сверх
+    лимита — 503 с Retry-After, клиент повторяет подписку позже
+    """
+    try:
+        since = request.headers.get('Last-Event-ID') or request.args.get('since')
+        since = int(since) if since else None
+        if since is not None and since < 0:
+            raise ValueError(since)
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр since'}), 400
+
+    try:
+        sensor_stream.start()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка подписки на изменения датчиков: {e}")
+        return jsonify({'error': 'Ошибка при подписке на изменения датчиков'}), 500
+
+    # Каждый подписчик держит поток воркера — сверх лимита отказываем, чтобы потоки остались для API
+    if not sensor_stream.reserve():
+        response = jsonify({'error': 'Слишком много подписчиков, повторите позже'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(current_app.config['SENSOR_STREAM_RETRY_AFTER'])
+        return response
+
+    try:
+        revision = watermark('sensors')
+        initial = sensor_stream.catch_up(since, revision)
+        db.session.commit()
+    except Exception as e:
+        sensor_stream.release()
+        db.session.rollback()
+        print(f"Ошибка подписки на изменения датчиков: {e}")
+        return jsonify({'error': 'Ошибка при подписке на изменения датчиков'}), 500
+
+    # Генератор не обращается к БД: соединение вернётся в пул при завершении запроса
+    response = Response(
+        sensor_stream.listen(revision, initial),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Место освобождается при закрытии ответа — даже если генератор так и не запустился
+    response.call_on_close(sensor_stream.release)
+    return response
+
+
 @sensor_bp.route('/<sensor_id>', methods=['GET'])
+@conditional('sensors')
 def get_sensor_by_id(sensor_id):
     """
     Получить датчик по ID
@@ -99,17 +222,19 @@ def get_sensor_by_id(sensor_id):
 
 
 @sensor_bp.route('/critical', methods=['GET'])
+@conditional('sensors')
 def get_critical_sensors():
     """
     Получить датчики с критическим или опасным уровнем воды
     Доступ: PUBLIC
     """
     try:
-        # Получаем все активные датчики
-        sensors = Sensor.query.filter_by(is_active=True, status='active').all()
-
-        # Фильтруем по уровню опасности
-        critical = [s for s in sensors if s.get_danger_level() in ['danger', 'critical']]
+        # Выборка по индексу danger_level: стоимость зависит от числа опасных датчиков, а не от всего парка
+        critical = Sensor.query.filter(
+            Sensor.danger_level.in_(['danger', 'critical']),
+            Sensor.is_active.is_(True),
+            Sensor.status == 'active'
+        ).all()
 
         return jsonify({
             'success': True,
@@ -123,6 +248,7 @@ def get_critical_sensors():
 
 
 @sensor_bp.route('/average', methods=['GET'])
+@conditional('sensors')
 def get_average_water_level():
     """
     Получить средний уровень воды по всем датчикам
@@ -187,11 +313,16 @@ def create_sensor():
             water_level=data.get('water_level', 0.0),
             temperature=data.get('temperature'),
             status=data.get('status', 'active'),
-            description=data.get('description')
+            description=data.get('description'),
+            report_interval=data.get('report_interval'),
+            **{field: data[field] for field in THRESHOLD_FIELDS if field in data}
         )
 
         db.session.add(sensor)
         db.session.commit()
+        response_cache.invalidate('sensors')
+        sensor_stream.publish()
+        staleness_monitor.track(sensor)
 
         return jsonify({
             'success': True,
@@ -227,7 +358,7 @@ def update_sensor(sensor_id):
             return jsonify({'error': 'Данные не предоставлены'}), 400
 
         # Валидация
-        errors = validate_sensor_data(data, partial=True)
+        errors = validate_sensor_data(data, partial=True, sensor=sensor)
         if errors:
             return jsonify({'error': 'Ошибка валидации', 'details': errors}), 400
 
@@ -251,9 +382,23 @@ def update_sensor(sensor_id):
             sensor.description = data['description']
         if 'is_active' in data:
             sensor.is_active = data['is_active']
+        if 'report_interval' in data:
+            sensor.report_interval = data['report_interval']
+        for field in THRESHOLD_FIELDS:
+            if field in data:
+                setattr(sensor, field, data[field])
 
+        # danger_level пересчитывается при сохранении (models._refresh_sensor_danger_level)
         sensor.updated_at = datetime.utcnow()
+        if 'water_level' in data or 'is_active' in data:
+            zones.refresh_for_sensors([sensor_id])
         db.session.commit()
+        response_cache.invalidate('sensors', 'risk_zones')
+        sensor_stream.publish()
+
+        if not sensor.is_active:
+            ring_buffer.invalidate(sensor_id)
+        staleness_monitor.track(sensor)
 
         return jsonify({
             'success': True,
@@ -287,7 +432,12 @@ def delete_sensor(sensor_id):
         # Soft delete
         sensor.is_active = False
         sensor.updated_at = datetime.utcnow()
+        zones.refresh_for_sensors([sensor_id])
         db.session.commit()
+        response_cache.invalidate('sensors', 'risk_zones')
+        sensor_stream.publish()
+        ring_buffer.invalidate(sensor_id)
+        staleness_monitor.track(sensor)
 
         return jsonify({
             'success': True,
@@ -312,32 +462,113 @@ def get_sensor_readings(sensor_id):
 
     Query параметры:
     - hours: количество часов истории (по умолчанию 24)
-    - limit: максимальное количество записей (по умолчанию 100)
+    - resolution: raw, hour или day (по умолчанию выбирается по длине окна)
+    - limit: максимальное количество записей (по умолчанию 100 для raw,
+      для агрегатов и при points — без ограничения)
+    - points: прорядить ряд до N точек по LTTB (сохраняет пики и провалы)
+    - after: курсор "<timestamp>,<id>" из nextCursor предыдущей страницы (только raw);
+      без явного hours окно по времени не ограничивается
+
+    Сырые показания за hours <= SENSOR_RING_WINDOW_HOURS отдаются из кольцевого буфера
+    (без extraData).
     """
     try:
-        sensor = Sensor.query.filter_by(id=sensor_id, is_active=True).first()
-        if not sensor:
-            return jsonify({'error': 'Датчик не найден'}), 404
-
         # Параметры запроса
         hours = int(request.args.get('hours', 24))
-        limit = int(request.args.get('limit', 100))
+        after = request.args.get('after')
+        resolution = request.args.get('resolution') or ('raw' if after else pick_resolution(hours, current_app.config))
+        if resolution not in ['raw'] + list(ROLLUP_RESOLUTIONS):
+            return jsonify({'error': 'Некорректные параметры запроса'}), 400
+
+        points = request.args.get('points')
+        points = int(points) if points is not None else None
+        if points is not None and points < 3:
+            return jsonify({'error': 'Параметр points должен быть не меньше 3'}), 400
+
+        if after and (resolution != 'raw' or points is not None):
+            return jsonify({'error': 'Курсор after поддерживается только для сырых показаний без points'}), 400
 
         # Вычисляем временную границу
         time_threshold = datetime.utcnow() - timedelta(hours=hours)
-
-        # Получаем показания
-        readings = SensorReading.query.filter(
-            SensorReading.sensor_id == sensor_id,
-            SensorReading.timestamp >= time_threshold
-        ).order_by(SensorReading.timestamp.asc()).limit(limit).all()
+        next_cursor = None
+
+        # Свежее окно целиком отдаётся из кольцевого буфера, без обращения к БД
+        buffered = None
+        if resolution == 'raw' and not after and ring_buffer.covers(hours):
+            buffered = ring_buffer.recent(sensor_id, time_threshold)
+
+        if buffered is None:
+            sensor = Sensor.query.filter_by(id=sensor_id, is_active=True).first()
+            if not sensor:
+                return jsonify({'error': 'Датчик не найден'}), 404
+
+        if buffered is not None:
+            limit = int(request.args.get('limit', 100)) if points is None or 'limit' in request.args else None
+            readings = buffered[:limit]
+            if points is None and readings and len(readings) == limit:
+                last = readings[-1]
+                next_cursor = f'{last.timestamp.isoformat()},{last.id}'
+        elif resolution == 'raw':
+            # Получаем показания (индекс sensor_id + timestamp)
+            query = SensorReading.query.filter(SensorReading.sensor_id == sensor_id)
+            window_start = time_threshold if not after or 'hours' in request.args else None
+            if window_start is not None:
+                query = query.filter(SensorReading.timestamp >= window_start)
+            cursor = None
+            if after:
+                # Keyset-пагинация: строки строго после (timestamp, id) курсора
+                cursor_ts, cursor_id = after.rsplit(',', 1)
+                cursor = (parse_timestamp(cursor_ts), int(cursor_id))
+                query = query.filter(tuple_(SensorReading.timestamp, SensorReading.id) > cursor)
+            query = query.order_by(SensorReading.timestamp.asc(), SensorReading.id.asc())
+
+            limit = int(request.args.get('limit', 100)) if points is None or 'limit' in request.args else None
+            if limit is not None:
+                query = query.limit(limit)
+
+            # Окно, уходящее за горячий период, дочитывается из архива
+            archived = archive.load_readings(sensor_id, start=window_start, after=cursor, limit=limit)
+            readings = list(heapq.merge(archived, query.all(), key=lambda r: (r.timestamp, r.id)))[:limit]
+
+            if points is None and readings and len(readings) == limit:
+                last = readings[-1]
+                next_cursor = f'{last.timestamp.isoformat()},{last.id}'
+
+            # Прогреваем буфер, чтобы следующие запросы свежего окна обходились без SQL
+            if ring_buffer.covers(hours):
+                ring_buffer.warm(sensor_id)
+        else:
+            # Часовые/суточные агрегаты вместо сырых строк
+            query = SensorReadingRollup.query.filter(
+                SensorReadingRollup.sensor_id == sensor_id,
+                SensorReadingRollup.resolution == resolution,
+                SensorReadingRollup.bucket_start >= rollup_bucket_start(time_threshold, resolution)
+            ).order_by(SensorReadingRollup.bucket_start.asc())
+            if 'limit' in request.args:
+                query = query.limit(int(request.args['limit']))
+            readings = query.all()
+
+        total = len(readings)
+        data = [reading.to_dict() for reading in readings] if points is None or total <= points else None
+        if data is None:
+            # Прореживание по LTTB: в словари превращаем только выбранные точки
+            if resolution == 'raw':
+                levels = [r.water_level for r in readings]
+                times = [r.timestamp.timestamp() for r in readings]
+            else:
+                levels = [r.sum_level / r.count for r in readings]
+                times = [r.bucket_start.timestamp() for r in readings]
+            data = [readings[i].to_dict() for i in lttb_indices(times, levels, points)]
 
         return jsonify({
             'success': True,
-            'data': [reading.to_dict() for reading in readings],
-            'count': len(readings),
+            'data': data,
+            'count': len(data),
+            'total': total,
             'sensorId': sensor_id,
-            'hours': hours
+            'hours': hours,
+            'resolution': resolution,
+            'nextCursor': next_cursor
         }), 200
 
     except ValueError:
@@ -354,7 +585,8 @@ def add_sensor_reading(sensor_id):
     Добавить новое показание датчика
     Доступ: ADMIN, MCHS
 
-    Автоматически обновляет текущие показания в модели Sensor
+    Автоматически обновляет текущие показания в модели Sensor.
+    Повтор (та же временная метка или idempotency_key) не создаёт дубль: 200 и прежнее показание.
     """
     try:
         # Проверка прав
@@ -371,31 +603,46 @@ def add_sensor_reading(sensor_id):
             return jsonify({'error': 'Уровень воды обязателен'}), 400
 
         # Валидация
-        if not isinstance(data['water_level'], (int, float)) or data['water_level'] < 0:
-            return jsonify({'error': 'Некорректный уровень воды'}), 400
-
-        # Создание показания
-        timestamp = datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00')) if 'timestamp' in data else datetime.utcnow()
-
-        reading = SensorReading(
-            sensor_id=sensor_id,
-            water_level=data['water_level'],
-            temperature=data.get('temperature'),
-            timestamp=timestamp
-        )
-
-        # Обновляем текущие показания в датчике
-        sensor.water_level = data['water_level']
-        sensor.temperature = data.get('temperature')
-        sensor.last_update = timestamp
-
-        db.session.add(reading)
+        row, error = validate_reading(data, sensor_id=sensor_id)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Режим отложенной записи: подтверждаем после записи в журнал очереди
+        if ingest_queue.enabled:
+            ingest_queue.enqueue([row])
+            return jsonify({
+                'success': True,
+                'message': 'Показание принято в очередь',
+                'data': {
+                    'sensorId': sensor_id,
+                    'waterLevel': row['water_level'],
+                    'temperature': row['temperature'],
+                    'timestamp': row['timestamp'].isoformat()
+                }
+            }), 202
+
+        # Создание показания и обновление текущих показаний в датчике
+        readings = store_readings([row], {sensor.id: sensor.last_update}, returning=True)
         db.session.commit()
+        sensor_stream.publish()
+
+        if not readings:
+            # Повтор: возвращаем ранее сохранённое показание
+            key = SensorReading.timestamp == row['timestamp']
+            if row['idempotency_key'] is not None:
+                key = key | (SensorReading.idempotency_key == row['idempotency_key'])
+            reading = SensorReading.query.filter(SensorReading.sensor_id == sensor_id, key).first()
+            return jsonify({
+                'success': True,
+                'message': 'Показание уже было добавлено',
+                'duplicate': True,
+                'data': reading.to_dict() if reading else None
+            }), 200
 
         return jsonify({
             'success': True,
             'message': 'Показание добавлено',
-            'data': reading.to_dict()
+            'data': readings[0].to_dict()
         }), 201
 
     except Exception as e:
@@ -404,17 +651,409 @@ def add_sensor_reading(sensor_id):
         return jsonify({'error': 'Ошибка при добавлении показания'}), 500
 
 
+@sensor_bp.route('/readings/batch', methods=['POST'])
+@jwt_required()
+def add_sensor_readings_batch():
+    """
+    Добавить пакет показаний по нескольким датчикам
+    Доступ: ADMIN, MCHS
+
+    Body: { readings: [{ sensor_id, water_level, temperature?, timestamp?, idempotency_key? }, ...] }
+    (допускается и просто массив показаний)
+
+    Весь пакет проверяется за один проход и записывается одним INSERT,
+    текущие показания датчиков обновляются до самого свежего показания одним UPDATE.
+    Ответ содержит статус accepted/duplicate/rejected для каждого элемента;
+    duplicate — показание уже было сохранено (повторная отправка).
+    """
+    try:
+        # Проверка прав
+        claims = get_jwt()
+        if claims.get('user_type') not in ['admin', 'mchs']:
+            return jsonify({'error': 'Требуются права администратора'}), 403
+
+        data = request.get_json()
+        items = data.get('readings') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Список показаний не предоставлен'}), 400
+
+        max_size = current_app.config['SENSOR_BATCH_MAX_SIZE']
+        if len(items) > max_size:
+            return jsonify({'error': f'Слишком большой пакет (максимум {max_size} показаний)'}), 413
+
+        queue = ingest_queue if ingest_queue.enabled else None
+        results, accepted = ingest_batch(items, queue=queue)
+        duplicates = sum(1 for r in results if r['status'] == 'duplicate')
+        rejected = len(items) - accepted - duplicates
+
+        if accepted:
+            status_code = 202 if queue is not None else 201
+        else:
+            # Повтор уже сохранённого пакета — не ошибка
+            status_code = 200 if duplicates else 400
+
+        return jsonify({
+            'success': accepted + duplicates > 0,
+            'message': f'Принято показаний: {accepted}, повторов: {duplicates}, отклонено: {rejected}',
+            'accepted': accepted,
+            'duplicates': duplicates,
+            'rejected': rejected,
+            'queued': queue is not None,
+            'results': results
+        }), status_code
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ошибка пакетного добавления показаний: {e}")
+        return jsonify({'error': 'Ошибка при пакетном добавлении показаний'}), 500
+
+
+@sensor_bp.route('/readings/stream', methods=['POST'])
+@jwt_required()
+def add_sensor_readings_stream():
+    """
+    Потоковая догрузка показаний в формате NDJSON (одно показание JSON на строку)
+    Доступ: ADMIN, MCHS
+
+    Query параметры:
+    - chunk_size: сколько показаний фиксировать одним commit (по умолчанию из конфига)
+    - offset: сколько первых строк пропустить (committedLine из прошлой попытки)
+
+    Тело читается из потока построчно, поэтому память не зависит от размера загрузки.
+    Ответ — тоже NDJSON: событие progress после каждого commit с номером последней
+    зафиксированной строки (committedLine), счётчиками и первыми отклонёнными строками
+    (errors), в конце — done или aborted.
+
+    Ответ пишется, пока тело ещё загружается: клиент должен читать его параллельно
+    с отправкой. Клиент, который сначала отправляет всё тело (requests, часть шлюзов),
+    при большой загрузке упрётся в заполненный буфер сокета — ему нужен chunk_size,
+    при котором событий progress немного.
+    """
+    # Проверка прав
+    claims = get_jwt()
+    if claims.get('user_type') not in ['admin', 'mchs']:
+        return jsonify({'error': 'Требуются права администратора'}), 403
+
+    try:
+        chunk_size = int(request.args.get('chunk_size', current_app.config['SENSOR_STREAM_CHUNK_SIZE']))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'Некорректные параметры запроса'}), 400
+
+    if chunk_size < 1 or chunk_size > current_app.config['SENSOR_BATCH_MAX_SIZE'] or offset < 0:
+        return jsonify({'error': 'Некорректные параметры запроса'}), 400
+
+    # Общий лимит MAX_CONTENT_LENGTH рассчитан на загрузку файлов, а не на догрузку истории
+    request.max_content_length = current_app.config['SENSOR_STREAM_MAX_CONTENT_LENGTH']
+    stream = request.stream
+
+    def generate():
+        try:
+            for event in ingest_stream(stream, chunk_size, offset):
+                yield json.dumps(event) + '\n'
+        except Exception as e:
+            db.session.rollback()
+            print(f"Ошибка потоковой догрузки показаний: {e}")
+            yield json.dumps({'event': 'error', 'error': 'Ошибка при потоковой догрузке показаний'}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@sensor_bp.route('/readings/history', methods=['GET'])
+def get_multi_sensor_history():
+    """
+    История показаний нескольких датчиков одним запросом
+    Доступ: PUBLIC
+
+    Query параметры:
+    - sensors: id датчиков через запятую, либо
+    - zone / facility: id зоны риска или ГТС — берутся их related_sensor_ids
+    - hours: количество часов истории (по умолчанию 24)
+    - resolution: raw, hour или day (по умолчанию выбирается по длине окна)
+    - step: шаг общей временной сетки в секундах; значения усредняются по интервалам
+
+    Ответ колоночный: series[sensorId] = {timestamps: [...], values: [...]}.
+    При step общий массив timestamps один на все датчики, а у каждого датчика
+    только values той же длины (null — в интервале нет показаний).
+    """
+    try:
+        if request.args.get('zone'):
+            zone = RiskZone.query.filter_by(id=request.args['zone'], is_active=True).first()
+            if not zone:
+                return jsonify({'error': 'Зона не найдена'}), 404
+            sensor_ids = zone.related_sensor_ids or []
+        elif request.args.get('facility'):
+            facility = db.session.get(HydroFacility, int(request.args['facility']))
+            if not facility:
+                return jsonify({'error': 'Объект не найден'}), 404
+            sensor_ids = facility.related_sensor_ids or []
+        else:
+            sensor_ids = request.args.get('sensors', '').split(',')
+
+        sensor_ids = list(dict.fromkeys(str(sid).strip() for sid in sensor_ids if str(sid).strip()))
+        if not sensor_ids and not (request.args.get('zone') or request.args.get('facility')):
+            return jsonify({'error': 'Не указаны датчики'}), 400
+        if len(sensor_ids) > current_app.config['SENSOR_HISTORY_MAX_SENSORS']:
+            return jsonify({'error': f"Не более {current_app.config['SENSOR_HISTORY_MAX_SENSORS']} датчиков за запрос"}), 400
+
+        hours = int(request.args.get('hours', 24))
+        resolution = request.args.get('resolution') or pick_resolution(hours, current_app.config)
+        if hours <= 0 or resolution not in ['raw'] + list(ROLLUP_RESOLUTIONS):
+            return jsonify({'error': 'Некорректные параметры запроса'}), 400
+
+        step = request.args.get('step')
+        step = int(step) if step is not None else None
+        if step is not None and (step <= 0 or hours * 3600 / step > current_app.config['SENSOR_HISTORY_MAX_GRID_POINTS']):
+            return jsonify({'error': 'Некорректный шаг сетки'}), 400
+
+        now = datetime.utcnow()
+        time_threshold = now - timedelta(hours=hours)
+
+        # Неизвестные и отключённые датчики пропускаем
+        active = {
+            row.id for row in db.session.query(Sensor.id).filter(
+                Sensor.id.in_(sensor_ids), Sensor.is_active.is_(True)
+            )
+        }
+        sensor_ids = [sid for sid in sensor_ids if sid in active]
+        columns = {sid: ([], []) for sid in sensor_ids}
+
+        if resolution == 'raw':
+            # Свежие окна — из кольцевого буфера, остальные датчики — одним запросом
+            pending = []
+            for sid in sensor_ids:
+                buffered = ring_buffer.recent(sid, time_threshold) if ring_buffer.covers(hours) else None
+                if buffered is None:
+                    pending.append(sid)
+                    continue
+                columns[sid][0].extend(r.timestamp for r in buffered)
+                columns[sid][1].extend(r.water_level for r in buffered)
+
+            if pending:
+                if time_threshold < now - timedelta(days=current_app.config['SENSOR_ARCHIVE_AFTER_DAYS']):
+                    for sid in pending:
+                        for r in archive.load_readings(sid, start=time_threshold):
+                            columns[sid][0].append(r.timestamp)
+                            columns[sid][1].append(r.water_level)
+
+                rows = db.session.query(
+                    SensorReading.sensor_id, SensorReading.timestamp, SensorReading.water_level
+                ).filter(
+                    SensorReading.sensor_id.in_(pending),
+                    SensorReading.timestamp >= time_threshold
+                ).order_by(SensorReading.sensor_id, SensorReading.timestamp, SensorReading.id)
+                for row in rows:
+                    columns[row.sensor_id][0].append(row.timestamp)
+                    columns[row.sensor_id][1].append(row.water_level)
+        else:
+            rows = db.session.query(
+                SensorReadingRollup.sensor_id, SensorReadingRollup.bucket_start,
+                SensorReadingRollup.sum_level, SensorReadingRollup.count
+            ).filter(
+                SensorReadingRollup.sensor_id.in_(sensor_ids),
+                SensorReadingRollup.resolution == resolution,
+                SensorReadingRollup.bucket_start >= rollup_bucket_start(time_threshold, resolution)
+            ).order_by(SensorReadingRollup.sensor_id, SensorReadingRollup.bucket_start)
+            for row in rows:
+                columns[row.sensor_id][0].append(row.bucket_start)
+                columns[row.sensor_id][1].append(row.sum_level / row.count)
+
+        timestamps = None
+        if step is None:
+            series = {
+                sid: {
+                    'timestamps': [ts.isoformat() for ts in times],
+                    'values': values
+                }
+                for sid, (times, values) in columns.items()
+            }
+        else:
+            # Общая сетка, выровненная по step от начала эпохи
+            start = int(to_us(time_threshold) // 1_000_000) // step * step
+            size = -(-(int(to_us(now) // 1_000_000) + 1 - start) // step)
+            timestamps = [from_us((start + i * step) * 1_000_000).isoformat() for i in range(size)]
+            series = {}
+            for sid, (times, values) in columns.items():
+                seconds = np.array(times, dtype='datetime64[us]').astype(np.int64) / 1e6
+                grid = resample_mean(seconds, values, start, step, size)
+                series[sid] = {'values': [None if np.isnan(v) else round(float(v), 4) for v in grid]}
+
+        return jsonify({
+            'success': True,
+            'sensorIds': sensor_ids,
+            'hours': hours,
+            'resolution': resolution,
+            'step': step,
+            'timestamps': timestamps,
+            'series': series
+        }), 200
+
+    except ValueError:
+        return jsonify({'error': 'Некорректные параметры запроса'}), 400
+    except Exception as e:
+        print(f"Ошибка получения истории датчиков: {e}")
+        return jsonify({'error': 'Ошибка при получении истории показаний'}), 500
+
+
+@sensor_bp.route('/readings/export', methods=['GET'])
+@jwt_required()
+def export_sensor_readings():
+    """
+    Потоковая выгрузка истории показаний
+    Доступ: авторизованные пользователи
+
+    Query параметры:
+    - sensors: id датчиков через запятую (по умолчанию все активные)
+    - start, end: границы периода в ISO 8601 (end не включительно)
+    - format: csv (по умолчанию) или parquet
+
+    Файл формируется порциями по SENSOR_EXPORT_CHUNK_SIZE строк по мере отправки,
+    поэтому память не зависит от размера выгрузки.
+    """
+    try:
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f"Формат должен быть одним из: {', '.join(EXPORT_FORMATS)}"}), 400
+
+        start = parse_timestamp(request.args['start']) if request.args.get('start') else None
+        end = parse_timestamp(request.args['end']) if request.args.get('end') else None
+
+        query = db.session.query(Sensor.id).filter(Sensor.is_active.is_(True))
+        if request.args.get('sensors'):
+            query = query.filter(Sensor.id.in_([sid.strip() for sid in request.args['sensors'].split(',')]))
+        sensor_ids = [row.id for row in query.order_by(Sensor.id)]
+
+        chunks = export_readings(
+            sensor_ids, start=start, end=end, fmt=fmt,
+            chunk_size=current_app.config['SENSOR_EXPORT_CHUNK_SIZE']
+        )
+    except ValueError:
+        return jsonify({'error': 'Некорректные параметры запроса'}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            print(f"Ошибка выгрузки показаний: {e}")
+            raise
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[fmt][0],
+        headers={'Content-Disposition': f'attachment; filename={export_filename(fmt)}'}
+    )
+
+
+@sensor_bp.route('/readings/anomalies', methods=['GET'])
+@jwt_required()
+def get_anomalous_readings():
+    """
+    Показания, помеченные детектором аномалий (для разбора)
+    Доступ: ADMIN, MCHS
+
+    Query параметры:
+    - sensors: id датчиков через запятую (по умолчанию все)
+    - hours: глубина в часах (по умолчанию 168)
+    - flag: spike, rate, flatline или level_shift
+    - limit: не более стольких показаний, самые свежие первыми (по умолчанию 500)
+    """
+    claims = get_jwt()
+    if claims.get('user_type') not in ['admin', 'mchs']:
+        return jsonify({'error': 'Требуются права администратора'}), 403
+
+    try:
+        hours = int(request.args.get('hours', 168))
+        limit = min(int(request.args.get('limit', 500)), 5000)
+        flag = request.args.get('flag')
+        if hours <= 0 or limit <= 0 or (flag and flag not in ANOMALY_FLAGS):
+            return jsonify({'error': 'Некорректные параметры запроса'}), 400
+
+        # Условие anomaly IS NOT NULL — чтобы выборка шла по частичному индексу
+        query = SensorReading.query.filter(
+            SensorReading.anomaly.isnot(None),
+            SensorReading.timestamp >= datetime.utcnow() - timedelta(hours=hours)
+        )
+        if request.args.get('sensors'):
+            query = query.filter(SensorReading.sensor_id.in_([sid.strip() for sid in request.args['sensors'].split(',')]))
+        if flag:
+            query = query.filter(SensorReading.anomaly.contains(flag))
+
+        readings = query.order_by(SensorReading.timestamp.desc(), SensorReading.id.desc()).limit(limit).all()
+
+        return jsonify({
+            'success': True,
+            'data': [reading.to_dict() for reading in readings],
+            'count': len(readings)
+        }), 200
+
+    except ValueError:
+        return jsonify({'error': 'Некорректные параметры запроса'}), 400
+    except Exception as e:
+        print(f"Ошибка получения аномальных показаний: {e}")
+        return jsonify({'error': 'Ошибка при получении аномальных показаний'}), 500
+
+
+@sensor_bp.route('/readings/queue', methods=['GET'])
+@jwt_required()
+def get_ingest_queue_stats():
+    """
+    Состояние очереди отложенной записи показаний (текущего процесса)
+    Доступ: ADMIN, MCHS
+
+    depth — показания, ещё не записанные в БД; lagSeconds — возраст самого старого
+    из них; lastFlushMs/maxFlushMs — длительность группового commit.
+    """
+    claims = get_jwt()
+    if claims.get('user_type') not in ['admin', 'mchs']:
+        return jsonify({'error': 'Требуются права администратора'}), 403
+
+    return jsonify({
+        'success': True,
+        'data': ingest_queue.stats()
+    }), 200
+
+
 # ============================================
 # ЭНДПОИНТЫ ДЛЯ ЗОН РИСКА
 # ============================================
 
 @sensor_bp.route('/zones', methods=['GET'])
+@conditional('risk_zones')
 def get_risk_zones():
     """
     Получить все зоны риска
     Доступ: PUBLIC
+
+    Query параметры:
+    - since: водяной знак прошлой синхронизации (см. GET /api/sensors)
+    - zoom: масштаб карты — полигоны упрощаются до точности пикселя на этом зуме
+    - tolerance: допуск упрощения полигонов в градусах (вместо zoom)
     """
     try:
+        since = parse_since()
+        tolerance = request.args.get('tolerance', type=float)
+        zoom = parse_zoom(request.args.get('zoom'))
+        if tolerance is None and zoom is not None:
+            tolerance = zoom_tolerance(zoom)
+        if tolerance is not None and not tolerance >= 0:
+            raise ValueError(tolerance)
+    except ValueError:
+        return jsonify({'error': 'Некорректный параметр since, zoom или tolerance'}), 400
+
+    try:
+        mark = watermark('risk_zones')
+        if since is not None and since <= mark:
+            records, deleted = changes(RiskZone, since, visible=lambda z: z.is_active)
+            return jsonify({
+                'success': True,
+                'data': [zone.to_dict(tolerance) for zone in records],
+                'deleted': deleted,
+                'watermark': mark,
+                'count': len(records)
+            }), 200
+
         query = RiskZone.query.filter_by(is_active=True)
 
         # Фильтр по типу
@@ -422,12 +1061,13 @@ def get_risk_zones():
         if zone_type:
             query = query.filter_by(type=zone_type)
 
-        zones = query.all()
+        records = query.all()
 
         return jsonify({
             'success': True,
-            'data': [zone.to_dict() for zone in zones],
-            'count': len(zones)
+            'data': [zone.to_dict(tolerance) for zone in records],
+            'watermark': mark,
+            'count': len(records)
         }), 200
 
     except Exception as e:
@@ -436,6 +1076,7 @@ def get_risk_zones():
 
 
 @sensor_bp.route('/zones/<zone_id>', methods=['GET'])
+@conditional('risk_zones')
 def get_risk_zone_by_id(zone_id):
     """
     Получить зону риска по ID
@@ -504,7 +1145,13 @@ def create_risk_zone():
         )
 
         db.session.add(zone)
+        db.session.flush()
+        # При наличии датчиков уровень и тренд зоны считаются по ним
+        zones.refresh_zones([zone.id])
+        # refresh_zones пишет bulk UPDATE мимо сессии — перечитываем зону для ответа
+        db.session.refresh(zone)
         db.session.commit()
+        response_cache.invalidate('risk_zones')
 
         return jsonify({
             'success': True,
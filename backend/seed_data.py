@@ -629,6 +629,13 @@ def seed_sensor_readings():
         print(f"  Создана история для {sensor.name}: {points} записей")
 
     db.session.commit()
+
+    # Часовые/суточные агрегаты, тренды зон и модели прогноза по созданной истории
+    from services import forecast, rollups, zones
+    rollups.rebuild()
+    zones.refresh_zones()
+    forecast.fit()
+    db.session.commit()
     print("[OK] История показаний успешно создана")
 
 
@@ -0,0 +1,3 @@
+"""
+Сервисный слой: логика, общая для нескольких маршрутов (приём показаний и т.п.)
+"""
@@ -0,0 +1,216 @@
+"""
+Оповещения о пересечении порогов уровня воды.
+
+Каждое новое показание прогоняется через автомат состояний датчика
+(sensor_alert_states) — O(1) на показание:
+- повышение уровня опасности — как только показание пересекло порог датчика;
+- понижение — только когда уровень опустился ниже порога на SENSOR_ALERT_HYSTERESIS,
+  чтобы колебания около порога не давали поток уведомлений;
+- переход объявляется после SENSOR_ALERT_DEBOUNCE подряд идущих показаний за порогом.
+
+Состояние и пороги всех датчиков пакета читаются одним запросом; на переходах
+уведомления (Notification) создаются одним bulk INSERT в той же транзакции.
+"""
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert
+
+from models import db, Sensor, SensorAlertState, Notification, User
+from services.sql import dialect_insert
+
+LEVELS = ['safe', 'attention', 'danger', 'critical']
+RANK = {level: i for i, level in enumerate(LEVELS)}
+
+LABELS = {
+    'safe': 'норма',
+    'attention': 'внимание',
+    'danger': 'опасно',
+    'critical': 'критично',
+}
+
+NOTIFICATION_TYPES = {
+    'attention': 'warning',
+    'danger': 'danger',
+    'critical': 'danger',
+}
+
+
+def classify(value, thresholds, margin=0.0):
+    """Уровень опасности значения по порогам (attention, danger, critical)"""
+    value += margin
+    attention, danger, critical = thresholds
+    if value >= critical:
+        return 'critical'
+    if value >= danger:
+        return 'danger'
+    if value >= attention:
+        return 'attention'
+    return 'safe'
+
+
+def step(state, value, thresholds, hysteresis, debounce):
+    """
+    Один шаг автомата по показанию value. state — словарь level/pending_level/pending_count,
+    меняется на месте. Возвращает новый уровень при переходе, иначе None.
+    """
+    current = state['level']
+    raw = classify(value, thresholds)
+    if RANK[raw] > RANK[current]:
+        target = raw
+    else:
+        # Понижение — только с запасом гистерезиса
+        relaxed = classify(value, thresholds, hysteresis)
+        target = relaxed if RANK[relaxed] < RANK[current] else current
+
+    if target == current:
+        state['pending_level'] = None
+        state['pending_count'] = 0
+        return None
+
+    pending = state['pending_level']
+    if pending is not None and (RANK[pending] > RANK[current]) == (RANK[target] > RANK[current]):
+        # Переход в ту же сторону продолжается; объявляем ближайший к текущему уровень
+        state['pending_count'] += 1
+        if abs(RANK[target] - RANK[current]) < abs(RANK[pending] - RANK[current]):
+            state['pending_level'] = target
+    else:
+        state['pending_level'] = target
+        state['pending_count'] = 1
+
+    if state['pending_count'] < debounce:
+        return None
+
+    new_level = state['pending_level']
+    state.update(level=new_level, pending_level=None, pending_count=0)
+    return new_level
+
+
+def apply_readings(rows, sensors):
+    """
+    Прогоняет новые показания через автоматы датчиков (без commit).
+    sensors — {sensor_id: last_update} до записи пакета: более старые показания
+    (догрузка истории) состояние оповещений не меняют.
+    """
+    config = current_app.config
+    if not config['SENSOR_ALERT_ENABLED']:
+        return []
+
+    fresh = sorted(
+        (row for row in rows
+         if sensors.get(row['sensor_id']) is None or row['timestamp'] > sensors[row['sensor_id']]),
+        key=lambda row: (row['sensor_id'], row['timestamp'])
+    )
+    if not fresh:
+        return []
+
+    records = db.session.query(
+        Sensor.id, Sensor.name, Sensor.danger_level,
+        Sensor.attention_threshold, Sensor.danger_threshold, Sensor.critical_threshold,
+        SensorAlertState.level, SensorAlertState.pending_level, SensorAlertState.pending_count
+    ).outerjoin(SensorAlertState, SensorAlertState.sensor_id == Sensor.id).filter(
+        Sensor.id.in_({row['sensor_id'] for row in fresh})
+    ).all()
+
+    states = {}
+    for r in records:
+        # Без сохранённого состояния стартуем с текущего danger_level, чтобы не было волны уведомлений
+        states[r.id] = {
+            'name': r.name,
+            'thresholds': (r.attention_threshold, r.danger_threshold, r.critical_threshold),
+            'before': (r.level, r.pending_level, r.pending_count),
+            'level': r.level or r.danger_level or 'safe',
+            'pending_level': r.pending_level,
+            'pending_count': r.pending_count or 0,
+        }
+
+    transitions = []
+    for row in fresh:
+        state = states.get(row['sensor_id'])
+        if state is None:
+            continue
+        previous = state['level']
+        new_level = step(state, row['water_level'], state['thresholds'],
+                         config['SENSOR_ALERT_HYSTERESIS'], config['SENSOR_ALERT_DEBOUNCE'])
+        if new_level is not None:
+            transitions.append((row['sensor_id'], previous, new_level, row))
+
+    changed = [
+        {
+            'sensor_id': sensor_id,
+            'level': state['level'],
+            'pending_level': state['pending_level'],
+            'pending_count': state['pending_count'],
+        }
+        for sensor_id, state in states.items()
+        if state['before'] != (state['level'], state['pending_level'], state['pending_count'])
+    ]
+    if changed:
+        now = datetime.utcnow()
+        moved = {sensor_id for sensor_id, *_ in transitions}
+        for values in changed:
+            values['changed_at'] = now if values['sensor_id'] in moved else None
+        stmt = dialect_insert(SensorAlertState).values(changed)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['sensor_id'],
+            set_={
+                'level': stmt.excluded.level,
+                'pending_level': stmt.excluded.pending_level,
+                'pending_count': stmt.excluded.pending_count,
+                'changed_at': db.func.coalesce(stmt.excluded.changed_at, SensorAlertState.changed_at),
+            }
+        )
+        db.session.execute(stmt)
+
+    if transitions:
+        _notify(transitions, states)
+    return transitions
+
+
+def _is_public(previous, new_level, public_levels):
+    """Повышение до публичного уровня — оповещаются все пользователи, иначе персонал"""
+    return new_level in public_levels and RANK[new_level] > RANK[previous]
+
+
+def _notify(transitions, states):
+    """Создаёт уведомления о переходах одним INSERT"""
+    config = current_app.config
+    public_levels = config['SENSOR_ALERT_PUBLIC_LEVELS']
+
+    # Получатели — один раз на пакет и только активные учётные записи
+    active = db.session.query(User.id).filter(User.is_active.is_(True))
+    staff = [uid for (uid,) in active.filter(User.user_type.in_(config['SENSOR_ALERT_STAFF_ROLES']))]
+    everyone = None
+    if any(_is_public(previous, new_level, public_levels) for _, previous, new_level, _ in transitions):
+        everyone = [uid for (uid,) in active]
+
+    notifications = []
+    for sensor_id, previous, new_level, row in transitions:
+        name = states[sensor_id]['name']
+        thresholds = dict(zip(LEVELS[1:], states[sensor_id]['thresholds']))
+        if RANK[new_level] > RANK[previous]:
+            notification_type = NOTIFICATION_TYPES[new_level]
+            title = f'{LABELS[new_level].capitalize()}: {name}'
+            message = (f'Уровень воды {row["water_level"]:.2f} м превысил порог '
+                       f'«{LABELS[new_level]}» ({thresholds[new_level]:.2f} м)')
+        else:
+            notification_type = 'info'
+            title = f'Уровень воды снизился: {name}'
+            message = f'Уровень воды {row["water_level"]:.2f} м, состояние: {LABELS[new_level]}'
+
+        recipients = everyone if _is_public(previous, new_level, public_levels) else staff
+        notifications.extend(
+            {
+                'user_id': user_id,
+                'type': notification_type,
+                'title': title,
+                'message': message,
+                'sensor_id': sensor_id,
+                'is_important': new_level in public_levels,
+                'created_at': row['timestamp'],
+            }
+            for user_id in recipients
+        )
+
+    if notifications:
+        db.session.execute(insert(Notification), notifications)
@@ -0,0 +1,177 @@
+"""
+Потоковое обнаружение аномалий в показаниях датчиков.
+
+Для каждого датчика хранится O(1) состояние (sensor_anomaly_states): экспоненциально
+взвешенные среднее и дисперсия уровня воды (вариант алгоритма Уэлфорда), последнее
+принятое показание и счётчики. Каждое новое показание проверяется за O(1):
+- spike     — отклонение от среднего больше SENSOR_ANOMALY_SPIKE_SIGMA стандартных отклонений;
+- rate      — изменение относительно последнего принятого показания быстрее
+              SENSOR_ANOMALY_MAX_RATE м/ч (с поправкой на обычный шум датчика);
+- flatline  — SENSOR_ANOMALY_FLATLINE_COUNT и более одинаковых значений подряд (датчик «завис»).
+
+Показания со spike/rate помещаются в карантин: они сохраняются в истории с меткой,
+но не меняют текущий уровень датчика, оповещения, зоны и прогноз. Если подряд
+SENSOR_ANOMALY_CONFIRM_COUNT показаний отклоняются, это не выброс, а реальный скачок
+уровня: показание принимается с меткой level_shift, а статистика начинается заново.
+flatline только помечается.
+
+Метки пишутся в SensorReading.anomaly (частичный индекс — для разбора помеченных
+показаний) и подробности — в SensorReading.extra_data['anomaly'].
+"""
+from flask import current_app
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, SensorReading, SensorAnomalyState
+from services.sql import dialect_insert
+
+QUARANTINE_FLAGS = ('spike', 'rate')
+FLAGS = ('spike', 'rate', 'flatline', 'level_shift')
+
+# Нижняя граница стандартного отклонения, м: у «гладкого» ряда любая дрожь не должна быть выбросом
+MIN_STD = 0.01
+
+STATE_FIELDS = ('mean', 'variance', 'count', 'last_value', 'last_timestamp', 'flat_count', 'reject_count')
+
+
+def not_quarantined():
+    """Условие SQL: показание не в карантине (для расчётов по истории — агрегаты, прогноз, тренды)"""
+    return or_(
+        SensorReading.anomaly.is_(None),
+        and_(*[~SensorReading.anomaly.contains(flag) for flag in QUARANTINE_FLAGS])
+    )
+
+
+def _accept(state, value, timestamp, alpha):
+    """Обновляет статистику принятым показанием"""
+    # Пока показаний мало — обычное среднее (точный Уэлфорд), дальше — экспоненциальное окно
+    weight = max(alpha, 1.0 / (state['count'] + 1))
+    diff = value - state['mean']
+    increment = weight * diff
+    state['mean'] += increment
+    state['variance'] = (1 - weight) * (state['variance'] + diff * increment)
+    state['count'] += 1
+    state['last_value'] = value
+    state['last_timestamp'] = timestamp
+    state['reject_count'] = 0
+
+
+def check(state, value, timestamp, config):
+    """
+    Один шаг детектора. state — словарь полей SensorAnomalyState, меняется на месте.
+    Возвращает (метки, карантин, подробности).
+    """
+    flags = []
+    details = {}
+    std = max(state['variance'] ** 0.5, MIN_STD)
+
+    if state['last_value'] is not None:
+        # Флэтлайн считается по всем показаниям, а не только по прогретым
+        if abs(value - state['last_value']) <= 1e-9:
+            state['flat_count'] += 1
+        else:
+            state['flat_count'] = 0
+        if state['flat_count'] + 1 >= config['SENSOR_ANOMALY_FLATLINE_COUNT']:
+            flags.append('flatline')
+
+    if state['count'] >= config['SENSOR_ANOMALY_WARMUP']:
+        deviation = (value - state['mean']) / std
+        details['expected'] = round(state['mean'], 4)
+        details['sigma'] = round(std, 4)
+        details['zScore'] = round(deviation, 2)
+        if abs(deviation) > config['SENSOR_ANOMALY_SPIKE_SIGMA']:
+            flags.append('spike')
+
+        hours = (timestamp - state['last_timestamp']).total_seconds() / 3600.0
+        allowed = config['SENSOR_ANOMALY_MAX_RATE'] * hours + config['SENSOR_ANOMALY_SPIKE_SIGMA'] * std
+        if abs(value - state['last_value']) > allowed:
+            details['rate'] = round((value - state['last_value']) / max(hours, 1.0 / 3600), 4)  # м/ч
+            flags.append('rate')
+
+    quarantined = any(flag in QUARANTINE_FLAGS for flag in flags)
+    if quarantined:
+        state['reject_count'] += 1
+        if state['reject_count'] >= config['SENSOR_ANOMALY_CONFIRM_COUNT']:
+            # Отклонения устойчивы — это реальный скачок уровня: начинаем статистику заново
+            flags = [flag for flag in flags if flag not in QUARANTINE_FLAGS] + ['level_shift']
+            quarantined = False
+            state.update(mean=value, variance=0.0, count=0)
+    if not quarantined:
+        _accept(state, value, timestamp, config['SENSOR_ANOMALY_ALPHA'])
+
+    return flags, quarantined, details
+
+
+def apply_readings(rows, inserted, readings=None):
+    """
+    Проверяет вставленные показания (без commit) и возвращает те, что не в карантине.
+    inserted — {(sensor_id, timestamp): id}; readings — объекты SensorReading
+    при store_readings(returning=True), в них метки проставляются без повторной загрузки.
+    Более старые, чем последнее принятое, показания (догрузка истории) не проверяются.
+    """
+    config = current_app.config
+    if not config['SENSOR_ANOMALY_ENABLED']:
+        return rows
+
+    states = {
+        s.sensor_id: {name: getattr(s, name) for name in STATE_FIELDS}
+        for s in SensorAnomalyState.query.filter(
+            SensorAnomalyState.sensor_id.in_({row['sensor_id'] for row in rows})
+        ).populate_existing()
+    }
+    before = {sensor_id: dict(state) for sensor_id, state in states.items()}
+
+    flagged = []
+    kept = []
+    for row in sorted(rows, key=lambda r: (r['sensor_id'], r['timestamp'])):
+        state = states.get(row['sensor_id'])
+        if state is None:
+            state = states[row['sensor_id']] = {
+                'mean': 0.0, 'variance': 0.0, 'count': 0, 'last_value': None, 'last_timestamp': None,
+                'flat_count': 0, 'reject_count': 0,
+            }
+        if state['last_timestamp'] is not None and row['timestamp'] <= state['last_timestamp']:
+            kept.append(row)
+            continue
+
+        flags, quarantined, details = check(state, row['water_level'], row['timestamp'], config)
+        if flags:
+            row['anomaly'] = ','.join(flags)
+            row['extra_data'] = {'anomaly': dict(details, flags=flags, quarantined=quarantined)}
+            flagged.append(row)
+        if not quarantined:
+            kept.append(row)
+
+    changed = [
+        dict(state, sensor_id=sensor_id) for sensor_id, state in states.items()
+        if before.get(sensor_id) != state
+    ]
+    if changed:
+        stmt = dialect_insert(SensorAnomalyState).values(changed)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['sensor_id'],
+            set_={name: stmt.excluded[name] for name in STATE_FIELDS}
+        )
+        db.session.execute(stmt)
+
+    if flagged:
+        # Помеченных показаний единицы — дописываем метки отдельным UPDATE по первичному ключу
+        db.session.execute(
+            update(SensorReading),
+            [
+                {
+                    'id': inserted[(row['sensor_id'], row['timestamp'])],
+                    'anomaly': row['anomaly'],
+                    'extra_data': row['extra_data'],
+                }
+                for row in flagged
+            ]
+        )
+        if readings:
+            by_key = {(r.sensor_id, r.timestamp): r for r in readings}
+            for row in flagged:
+                reading = by_key[(row['sensor_id'], row['timestamp'])]
+                set_committed_value(reading, 'anomaly', row['anomaly'])
+                set_committed_value(reading, 'extra_data', row['extra_data'])
+
+    return kept
@@ -0,0 +1,266 @@
+"""
+Холодный архив показаний датчиков.
+
+Показания старше SENSOR_ARCHIVE_AFTER_DAYS выносятся из sensor_readings в сжатые
+колоночные файлы NumPy (.npz) — по одному на датчик и месяц:
+SENSOR_ARCHIVE_DIR/<sensor_id>/<YYYY-MM>.npz. Что именно вынесено, записывается в
+манифест sensor_reading_archives. Часовые/суточные агрегаты не трогаются, поэтому
+графики за длинные периоды продолжают строиться без чтения архива.
+
+Файл пишется (атомарно, через os.replace) до удаления строк из БД; при повторном
+запуске после сбоя строки сливаются с существующим файлом по id без дублей.
+
+В файле хранятся и ключи идемпотентности, и метки аномалий: уникальные индексы
+sensor_readings на вынесенные строки уже не действуют, поэтому повтор показания
+за заархивированный месяц отсекается по файлу (drop_archived), а карантин
+сохраняется при чтении архива.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+
+from models import db, SensorReading, SensorReadingArchive
+from services.anomalies import QUARANTINE_FLAGS
+
+# Ограничение на размер IN (...) при удалении перенесённых строк
+DELETE_CHUNK_SIZE = 500
+
+# Строковые колонки, которых нет в файлах, записанных до их появления
+OPTIONAL_COLUMNS = ('idempotency_key', 'anomaly')
+
+
+def _month_start(ts):
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(ts):
+    return ts.replace(year=ts.year + 1, month=1) if ts.month == 12 else ts.replace(month=ts.month + 1)
+
+
+def _archive_dir():
+    return current_app.config['SENSOR_ARCHIVE_DIR']
+
+
+def _columns(readings):
+    """ORM-показания -> колонки numpy"""
+    return {
+        'id': np.array([r.id for r in readings], dtype=np.int64),
+        'timestamp': np.array([r.timestamp for r in readings], dtype='datetime64[us]'),
+        'water_level': np.array([r.water_level for r in readings], dtype=np.float64),
+        'temperature': np.array(
+            [np.nan if r.temperature is None else r.temperature for r in readings], dtype=np.float64
+        ),
+        'extra_data': np.array(
+            ['' if r.extra_data is None else json.dumps(r.extra_data) for r in readings], dtype=np.str_
+        ),
+        'idempotency_key': np.array([r.idempotency_key or '' for r in readings], dtype=np.str_),
+        'anomaly': np.array([r.anomaly or '' for r in readings], dtype=np.str_),
+    }
+
+
+def _load(path):
+    with np.load(path, allow_pickle=False) as f:
+        columns = {name: f[name] for name in f.files}
+    for name in OPTIONAL_COLUMNS:
+        if name not in columns:
+            columns[name] = np.full(len(columns['id']), '', dtype=np.str_)
+    return columns
+
+
+def _save(path, columns):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **columns)
+    os.replace(tmp, path)
+
+
+def _merge(existing, new):
+    """
+    Объединяет колонки двух частей архива, убирая повторы по (время, id) и сортируя по времени.
+    Одного id мало: SQLite после удаления строк с наибольшими id выдаёт их заново.
+    """
+    merged = {name: np.concatenate([existing[name], new[name]]) for name in new}
+    order = np.lexsort((merged['id'], merged['timestamp']))
+    ts, ids = merged['timestamp'][order], merged['id'][order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (ts[1:] != ts[:-1]) | (ids[1:] != ids[:-1])
+    return {name: values[order[keep]] for name, values in merged.items()}
+
+
+def _archive_month(sensor_id, start, end):
+    """Переносит показания датчика за [start, end) в файл месяца; возвращает число строк"""
+    readings = SensorReading.query.filter(
+        SensorReading.sensor_id == sensor_id,
+        SensorReading.timestamp >= start,
+        SensorReading.timestamp < end
+    ).order_by(SensorReading.timestamp.asc(), SensorReading.id.asc()).all()
+    if not readings:
+        return 0
+
+    month = start.strftime('%Y-%m')
+    relative = os.path.join(sensor_id, f'{month}.npz')
+    path = os.path.join(_archive_dir(), relative)
+
+    columns = _columns(readings)
+    if os.path.exists(path):
+        columns = _merge(_load(path), columns)
+    _save(path, columns)
+
+    entry = SensorReadingArchive.query.filter_by(sensor_id=sensor_id, month=month).first()
+    if entry is None:
+        entry = SensorReadingArchive(sensor_id=sensor_id, month=month, period_start=start, period_end=end)
+        db.session.add(entry)
+    entry.path = relative
+    entry.row_count = len(columns['id'])
+    entry.size_bytes = os.path.getsize(path)
+    entry.archived_at = datetime.utcnow()
+
+    ids = [r.id for r in readings]
+    for i in range(0, len(ids), DELETE_CHUNK_SIZE):
+        SensorReading.query.filter(
+            SensorReading.id.in_(ids[i:i + DELETE_CHUNK_SIZE])
+        ).delete(synchronize_session=False)
+
+    db.session.commit()
+    db.session.expunge_all()
+    return len(readings)
+
+
+def archive_readings(older_than_days=None):
+    """
+    Выносит в архив показания старше older_than_days (по умолчанию SENSOR_ARCHIVE_AFTER_DAYS).
+    Архивируются только целые месяцы, закончившиеся до границы. Один commit на файл.
+    Возвращает {'files': n, 'readings': m}.
+    """
+    if older_than_days is None:
+        older_than_days = current_app.config['SENSOR_ARCHIVE_AFTER_DAYS']
+
+    cutoff = _month_start(datetime.utcnow() - timedelta(days=older_than_days))
+
+    oldest = db.session.query(
+        SensorReading.sensor_id, db.func.min(SensorReading.timestamp)
+    ).filter(SensorReading.timestamp < cutoff).group_by(SensorReading.sensor_id).all()
+
+    files = 0
+    moved = 0
+    for sensor_id, first_ts in oldest:
+        start = _month_start(first_ts)
+        while start < cutoff:
+            end = _next_month(start)
+            count = _archive_month(sensor_id, start, end)
+            if count:
+                files += 1
+                moved += count
+            start = end
+
+    return {'files': files, 'readings': moved}
+
+
+def archived_entries(sensor_id, start=None, end=None):
+    """Записи манифеста датчика, пересекающиеся с окном [start, end)"""
+    query = SensorReadingArchive.query.filter(SensorReadingArchive.sensor_id == sensor_id)
+    if start is not None:
+        query = query.filter(SensorReadingArchive.period_end > start)
+    if end is not None:
+        query = query.filter(SensorReadingArchive.period_start < end)
+    return query.order_by(SensorReadingArchive.period_start.asc()).all()
+
+
+def iter_columns(entries):
+    """Колонки архивных файлов по записям манифеста (по одному файлу за раз)"""
+    base = _archive_dir()
+    for entry in entries:
+        path = os.path.join(base, entry.path)
+        if os.path.exists(path):
+            yield entry, _load(path)
+        else:
+            print(f"Файл архива не найден: {path}")
+
+
+def load_readings(sensor_id, start=None, after=None, limit=None):
+    """
+    Читает архивные показания датчика с timestamp >= start и (timestamp, id) > after,
+    по возрастанию времени, не более limit. Возвращает несохраняемые (transient)
+    объекты SensorReading, чтобы маршруты обрабатывали их так же, как строки из БД.
+    """
+    window_start = start
+    if after is not None and (window_start is None or after[0] > window_start):
+        window_start = after[0]
+
+    result = []
+    for entry, columns in iter_columns(archived_entries(sensor_id, start=window_start)):
+        ts = columns['timestamp']
+        mask = np.ones(len(ts), dtype=bool)
+        if start is not None:
+            mask &= ts >= np.datetime64(start, 'us')
+        if after is not None:
+            after_ts = np.datetime64(after[0], 'us')
+            mask &= (ts > after_ts) | ((ts == after_ts) & (columns['id'] > after[1]))
+
+        for i in np.flatnonzero(mask):
+            extra = str(columns['extra_data'][i])
+            temperature = float(columns['temperature'][i])
+            result.append(SensorReading(
+                id=int(columns['id'][i]),
+                sensor_id=sensor_id,
+                water_level=float(columns['water_level'][i]),
+                temperature=None if np.isnan(temperature) else temperature,
+                timestamp=ts[i].astype(datetime),
+                extra_data=json.loads(extra) if extra else None,
+                idempotency_key=str(columns['idempotency_key'][i]) or None,
+                anomaly=str(columns['anomaly'][i]) or None
+            ))
+            if limit is not None and len(result) >= limit:
+                return result
+
+    return result
+
+
+def iter_rows(sensor_ids=None):
+    """Архивные показания не в карантине в виде словарей колонок (для пересчёта агрегатов)"""
+    query = SensorReadingArchive.query
+    if sensor_ids:
+        query = query.filter(SensorReadingArchive.sensor_id.in_(sensor_ids))
+    for entry, columns in iter_columns(query.order_by(SensorReadingArchive.sensor_id, SensorReadingArchive.period_start).all()):
+        timestamps = columns['timestamp'].astype(datetime)
+        for level, ts, anomaly in zip(columns['water_level'].tolist(), timestamps, columns['anomaly'].tolist()):
+            if any(flag in anomaly.split(',') for flag in QUARANTINE_FLAGS):
+                continue
+            yield {'sensor_id': entry.sensor_id, 'water_level': level, 'timestamp': ts}
+
+
+def drop_archived(rows):
+    """
+    Убирает из rows (словари validate_reading) повторы уже заархивированных показаний:
+    тот же датчик и время или тот же ключ идемпотентности в файле месяца. Проверяются
+    только показания за прошлые месяцы (текущий не архивируется) — обычный приём
+    свежих показаний обходится без запросов.
+    """
+    current_month = _month_start(datetime.utcnow())
+    old = [row for row in rows if row['timestamp'] < current_month]
+    if not old:
+        return rows
+
+    months = {(row['sensor_id'], row['timestamp'].strftime('%Y-%m')) for row in old}
+    entries = SensorReadingArchive.query.filter(
+        SensorReadingArchive.sensor_id.in_({sensor_id for sensor_id, _ in months}),
+        SensorReadingArchive.month.in_({month for _, month in months})
+    ).all()
+    entries = [entry for entry in entries if (entry.sensor_id, entry.month) in months]
+    if not entries:
+        return rows
+
+    archived = set()
+    for entry, columns in iter_columns(entries):
+        archived.update((entry.sensor_id, ts) for ts in columns['timestamp'].astype(datetime))
+        archived.update((entry.sensor_id, 'key', key) for key in columns['idempotency_key'].tolist() if key)
+
+    return [
+        row for row in rows
+        if (row['sensor_id'], row['timestamp']) not in archived
+        and (row.get('idempotency_key') is None or (row['sensor_id'], 'key', row['idempotency_key']) not in archived)
+    ]
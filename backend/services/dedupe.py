@@ -0,0 +1,49 @@
+"""
+Разовая чистка дублей показаний, накопленных до появления уникальных ключей
+(sensor_id, timestamp) и (sensor_id, idempotency_key).
+
+Дубли удаляются одним set-based DELETE ... WHERE EXISTS: из каждой группы остаётся
+показание с наименьшим id (первая запись). Затем пересчитываются агрегаты
+затронутых датчиков и сбрасываются их кольцевые буферы.
+"""
+from sqlalchemy import delete, exists, select
+from sqlalchemy.orm import aliased
+
+from models import db, SensorReading
+from services import rollups
+from services.ring_buffer import ring_buffer
+
+
+def _duplicate_condition():
+    """Условие «у показания есть более ранний двойник»"""
+    earlier = aliased(SensorReading)
+    same_time = exists().where(
+        earlier.sensor_id == SensorReading.sensor_id,
+        earlier.timestamp == SensorReading.timestamp,
+        earlier.id < SensorReading.id
+    )
+    same_key = exists().where(
+        earlier.sensor_id == SensorReading.sensor_id,
+        earlier.idempotency_key == SensorReading.idempotency_key,
+        earlier.id < SensorReading.id
+    )
+    return same_time | same_key
+
+
+def dedupe_readings():
+    """Удаляет дубли показаний; возвращает {'deleted': n, 'sensors': [...]}"""
+    condition = _duplicate_condition()
+    affected = db.session.scalars(select(SensorReading.sensor_id).where(condition).distinct()).all()
+    if not affected:
+        return {'deleted': 0, 'sensors': []}
+
+    deleted = db.session.execute(
+        delete(SensorReading).where(condition).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+
+    rollups.rebuild(affected)
+    for sensor_id in affected:
+        ring_buffer.invalidate(sensor_id)
+
+    return {'deleted': deleted, 'sensors': affected}
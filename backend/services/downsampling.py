@@ -0,0 +1,63 @@
+"""
+Прореживание временных рядов для графиков (Largest-Triangle-Three-Buckets)
+и приведение нескольких рядов к общей временной сетке.
+
+LTTB оставляет точки, образующие наибольшие треугольники с соседними интервалами,
+поэтому пики и провалы уровня воды сохраняются, даже когда точек в десятки раз меньше.
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, points):
+    """
+    Возвращает индексы не более чем points точек ряда (x, y), выбранных по LTTB.
+    x должен быть отсортирован по возрастанию. Первая и последняя точки сохраняются всегда.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    size = len(x)
+    if points >= size or points < 3:
+        return np.arange(size)
+
+    # Внутренние точки 1..size-2 делятся на points-2 интервала
+    edges = np.linspace(1, size - 1, points - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Средние точки всех интервалов — одним проходом; для последнего «следующим» служит последняя точка
+    counts = ends - starts
+    avg_x = np.append(np.add.reduceat(x[1:size - 1], starts - 1) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[1:size - 1], starts - 1) / counts, y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+
+    a = 0
+    for i in range(points - 2):
+        start, end = starts[i], ends[i]
+        bx, by = x[start:end], y[start:end]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+
+        # Удвоенная площадь треугольника (a, точка интервала, среднее следующего интервала)
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+
+    return selected
+
+
+def resample_mean(x, y, start, step, size):
+    """
+    Раскладывает ряд (x, y) по сетке из size интервалов длиной step, начиная со start:
+    значение интервала — среднее попавших в него точек, NaN для пустых интервалов.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    cells = np.floor((x - start) / step).astype(np.int64)
+    inside = (cells >= 0) & (cells < size)
+    cells, y = cells[inside], y[inside]
+
+    counts = np.bincount(cells, minlength=size)
+    sums = np.bincount(cells, weights=y, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
@@ -0,0 +1,170 @@
+"""
+Потоковая выгрузка истории показаний в CSV или Parquet.
+
+Показания читаются порциями по chunk_size строк: сначала архивные файлы датчика
+(services.archive), затем sensor_readings keyset-запросами по индексу
+(sensor_id, timestamp). Между порциями транзакция чтения закрывается, поэтому
+многочасовая выгрузка не держит блокировку SQLite и не мешает приёму показаний,
+а память не зависит от объёма выгрузки.
+"""
+import csv
+import io
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import tuple_
+
+from models import db, SensorReading
+from services import archive
+
+COLUMNS = ['sensor_id', 'timestamp', 'water_level', 'temperature']
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def _chunk(sensor_id, timestamps, levels, temperatures):
+    return {
+        'sensor_id': sensor_id,
+        'timestamp': np.asarray(timestamps, dtype='datetime64[us]'),
+        'water_level': np.asarray(levels, dtype=np.float64),
+        'temperature': np.asarray(temperatures, dtype=np.float64),
+    }
+
+
+def iter_chunks(sensor_ids, start=None, end=None, chunk_size=10000):
+    """Порции показаний {колонка: массив numpy} по датчикам, по возрастанию времени"""
+    for sensor_id in sensor_ids:
+        for _, columns in archive.iter_columns(archive.archived_entries(sensor_id, start=start, end=end)):
+            ts = columns['timestamp']
+            mask = np.ones(len(ts), dtype=bool)
+            if start is not None:
+                mask &= ts >= np.datetime64(start, 'us')
+            if end is not None:
+                mask &= ts < np.datetime64(end, 'us')
+            for i in range(0, int(mask.sum()), chunk_size):
+                part = np.flatnonzero(mask)[i:i + chunk_size]
+                yield _chunk(sensor_id, ts[part], columns['water_level'][part], columns['temperature'][part])
+
+        last = None
+        while True:
+            query = db.session.query(
+                SensorReading.id, SensorReading.timestamp, SensorReading.water_level, SensorReading.temperature
+            ).filter(SensorReading.sensor_id == sensor_id)
+            if start is not None:
+                query = query.filter(SensorReading.timestamp >= start)
+            if end is not None:
+                query = query.filter(SensorReading.timestamp < end)
+            if last is not None:
+                query = query.filter(tuple_(SensorReading.timestamp, SensorReading.id) > last)
+            rows = query.order_by(SensorReading.timestamp, SensorReading.id).limit(chunk_size).all()
+
+            # Закрываем транзакцию чтения между порциями
+            db.session.rollback()
+            if not rows:
+                break
+
+            yield _chunk(
+                sensor_id,
+                [r.timestamp for r in rows],
+                [r.water_level for r in rows],
+                [np.nan if r.temperature is None else r.temperature for r in rows]
+            )
+            if len(rows) < chunk_size:
+                break
+            last = (rows[-1].timestamp, rows[-1].id)
+
+
+def write_csv(chunks):
+    """Порции -> куски текста CSV (с заголовком)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue()
+
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        timestamps = np.datetime_as_string(chunk['timestamp'], unit='us')
+        temperatures = ['' if np.isnan(t) else t for t in chunk['temperature'].tolist()]
+        writer.writerows(
+            (chunk['sensor_id'], ts, level, temp)
+            for ts, level, temp in zip(timestamps.tolist(), chunk['water_level'].tolist(), temperatures)
+        )
+        yield buffer.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    """Файлоподобный приёмник, из которого уже записанные байты забираются по частям"""
+
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Для выгрузки в Parquet нужен пакет pyarrow')
+    return pyarrow, pyarrow.parquet
+
+
+def write_parquet(chunks):
+    """Порции -> куски файла Parquet (одна row group на порцию)"""
+    pa, pq = _pyarrow()
+
+    schema = pa.schema([
+        ('sensor_id', pa.dictionary(pa.int32(), pa.string())),
+        ('timestamp', pa.timestamp('us')),
+        ('water_level', pa.float64()),
+        ('temperature', pa.float64()),
+    ])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for chunk in chunks:
+            size = len(chunk['timestamp'])
+            temperature = chunk['temperature']
+            table = pa.Table.from_arrays([
+                pa.DictionaryArray.from_arrays(np.zeros(size, dtype=np.int32), [chunk['sensor_id']]),
+                pa.array(chunk['timestamp'], type=pa.timestamp('us')),
+                pa.array(chunk['water_level']),
+                pa.array(temperature, mask=np.isnan(temperature)),
+            ], schema=schema)
+            writer.write_table(table)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_readings(sensor_ids, start=None, end=None, fmt='csv', chunk_size=10000):
+    """Генератор кусков выгрузки в формате fmt (csv или parquet)"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+    if fmt == 'parquet':
+        _pyarrow()  # до начала ответа, а не в середине потока
+
+    chunks = iter_chunks(sensor_ids, start=start, end=end, chunk_size=chunk_size)
+    return write_parquet(chunks) if fmt == 'parquet' else write_csv(chunks)
+
+
+def export_filename(fmt):
+    return f"sensor-readings-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{FORMATS[fmt][1]}"
@@ -0,0 +1,240 @@
+"""
+Прогноз уровня воды по датчикам.
+
+Модель каждого датчика — экспоненциальное сглаживание Хольта с затухающим трендом
+для неравномерных интервалов: уровень (м), тренд (м/ч) и дисперсия ошибки прогноза
+на шаг. Параметры хранятся в sensor_forecast_models и дообучаются на каждом пакете
+показаний в store_readings() — O(1) на показание, по всем датчикам пакета сразу
+(векторно по NumPy). fit() обучает модели заново по истории за SENSOR_FORECAST_FIT_HOURS
+(команда flask fit-forecasts).
+
+Прогноз по всему парку — одно векторное вычисление по массивам параметров; он только
+читает модели и ничего не обучает, поэтому публичный GET не пишет в БД.
+"""
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import numpy as np
+from flask import current_app
+
+from models import db, SensorReading, SensorForecastModel
+from services.anomalies import not_quarantined
+from services.sql import dialect_insert
+
+# Ограничение на число строк в одном INSERT (лимит переменных SQLite)
+UPSERT_CHUNK_SIZE = 500
+
+EPOCH = datetime(1970, 1, 1)
+
+# Минимальный интервал между показаниями, ч (защита от деления на ноль)
+MIN_STEP_HOURS = 1.0 / 3600
+
+
+def _hours(ts):
+    return (ts - EPOCH).total_seconds() / 3600.0
+
+
+def _params():
+    config = current_app.config
+    return config['SENSOR_FORECAST_ALPHA'], config['SENSOR_FORECAST_BETA'], config['SENSOR_FORECAST_PHI']
+
+
+def _advance(state, t, y, active, params):
+    """
+    Один шаг сглаживания для датчиков с маской active.
+    state — словарь массивов level/trend/variance/abs_error/count/last (часы).
+    """
+    alpha, beta, phi = params
+    first = active & (state['count'] == 0)
+    step = active & ~first
+
+    dt = np.maximum(t - state['last'], MIN_STEP_HOURS)
+    damping = phi ** dt
+    predicted = state['level'] + state['trend'] * (1 - damping) / (1 - phi) * phi
+    error = y - predicted
+
+    level = alpha * y + (1 - alpha) * predicted
+    trend = beta * (level - state['level']) / dt + (1 - beta) * state['trend'] * damping
+
+    state['level'] = np.where(first, y, np.where(step, level, state['level']))
+    state['trend'] = np.where(first, 0.0, np.where(step, trend, state['trend']))
+    state['variance'] = np.where(step, (1 - alpha) * state['variance'] + alpha * error ** 2, state['variance'])
+    state['abs_error'] = np.where(step, (1 - alpha) * state['abs_error'] + alpha * np.abs(error), state['abs_error'])
+    state['count'] = state['count'] + active
+    state['last'] = np.where(active, t, state['last'])
+
+
+def _run(sensor_ids, series, models):
+    """
+    Прогоняет ряды series {sensor_id: [(timestamp, level), ...]} через модели
+    (существующие в models продолжаются, остальные начинаются с нуля) и сохраняет их.
+    """
+    n = len(sensor_ids)
+    state = {
+        'level': np.zeros(n), 'trend': np.zeros(n), 'variance': np.zeros(n), 'abs_error': np.zeros(n),
+        'count': np.zeros(n, dtype=np.int64), 'last': np.zeros(n),
+    }
+    for i, sensor_id in enumerate(sensor_ids):
+        model = models.get(sensor_id)
+        if model is not None:
+            state['level'][i] = model.level
+            state['trend'][i] = model.trend
+            state['variance'][i] = model.variance
+            state['abs_error'][i] = model.abs_error
+            state['count'][i] = model.observations
+            state['last'][i] = _hours(model.last_timestamp)
+
+    # Матрица датчик × номер показания (NaN — у датчика показания кончились)
+    width = max(len(series[sensor_id]) for sensor_id in sensor_ids)
+    times = np.full((n, width), np.nan)
+    values = np.full((n, width), np.nan)
+    for i, sensor_id in enumerate(sensor_ids):
+        points = series[sensor_id]
+        times[i, :len(points)] = [_hours(ts) for ts, _ in points]
+        values[i, :len(points)] = [level for _, level in points]
+
+    params = _params()
+    for k in range(width):
+        active = ~np.isnan(times[:, k])
+        _advance(state, np.nan_to_num(times[:, k]), np.nan_to_num(values[:, k]), active, params)
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            'sensor_id': sensor_id,
+            'level': float(state['level'][i]),
+            'trend': float(state['trend'][i]),
+            'variance': float(state['variance'][i]),
+            'abs_error': float(state['abs_error'][i]),
+            'observations': int(state['count'][i]),
+            'last_timestamp': series[sensor_id][-1][0],
+            'updated_at': now,
+        }
+        for i, sensor_id in enumerate(sensor_ids)
+    ]
+    for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = dialect_insert(SensorForecastModel).values(rows[i:i + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['sensor_id'],
+            set_={name: stmt.excluded[name] for name in rows[0] if name != 'sensor_id'}
+        )
+        db.session.execute(stmt)
+
+
+def apply_readings(rows):
+    """Дообучает модели датчиков на новых показаниях пакета (без commit)"""
+    sensor_ids = {row['sensor_id'] for row in rows}
+    models = {
+        m.sensor_id: m for m in
+        SensorForecastModel.query.filter(SensorForecastModel.sensor_id.in_(sensor_ids)).populate_existing().all()
+    }
+
+    series = {}
+    for row in sorted(rows, key=lambda r: (r['sensor_id'], r['timestamp'])):
+        model = models.get(row['sensor_id'])
+        # Модель последовательная: показания старше уже учтённых пропускаются (их учтёт fit())
+        if model is not None and row['timestamp'] <= model.last_timestamp:
+            continue
+        series.setdefault(row['sensor_id'], []).append((row['timestamp'], row['water_level']))
+
+    if series:
+        _run(sorted(series), series, models)
+
+
+def fit(sensor_ids=None, hours=None):
+    """Обучает модели заново по истории за последние hours часов; возвращает число моделей"""
+    if hours is None:
+        hours = current_app.config['SENSOR_FORECAST_FIT_HOURS']
+
+    query = db.session.query(
+        SensorReading.sensor_id, SensorReading.timestamp, SensorReading.water_level
+    ).filter(
+        SensorReading.timestamp >= datetime.utcnow() - timedelta(hours=hours),
+        not_quarantined()
+    )
+    if sensor_ids:
+        query = query.filter(SensorReading.sensor_id.in_(sensor_ids))
+
+    series = {
+        sensor_id: [(r.timestamp, r.water_level) for r in group]
+        for sensor_id, group in groupby(
+            query.order_by(SensorReading.sensor_id, SensorReading.timestamp, SensorReading.id),
+            key=lambda r: r.sensor_id
+        )
+    }
+    if not series:
+        return 0
+
+    _run(sorted(series), series, {})
+    return len(series)
+
+
+def forecast(sensor_ids, horizons):
+    """
+    Прогноз по датчикам на горизонты horizons (часы) одним векторным вычислением.
+    Датчики без модели (ещё не было показаний после её появления и fit-forecasts не
+    запускался) не обучаются на лету, а возвращаются в missing. Возвращает словарь
+    массивов: sensorIds, value/lower/upper (датчик × горизонт), trend, sigma, а также
+    models и missing.
+    """
+    models = {
+        m.sensor_id: m for m in
+        SensorForecastModel.query.filter(SensorForecastModel.sensor_id.in_(sensor_ids)).all()
+    }
+    missing = [sid for sid in sensor_ids if sid not in models]
+
+    ids = [sid for sid in sensor_ids if sid in models]
+    _, _, phi = _params()
+    level = np.array([models[sid].level for sid in ids])
+    trend = np.array([models[sid].trend for sid in ids])
+    sigma = np.sqrt(np.array([models[sid].variance for sid in ids]))
+
+    # Прогноз от момента последнего показания: датчик мог молчать
+    now = _hours(datetime.utcnow())
+    lag = np.array([max(now - _hours(models[sid].last_timestamp), 0.0) for sid in ids])
+    h = lag[:, None] + np.asarray(horizons, dtype=np.float64)[None, :]
+
+    value = level[:, None] + trend[:, None] * phi * (1 - phi ** h) / (1 - phi)
+    spread = 1.96 * sigma[:, None] * np.sqrt(1 + h)
+    return {
+        'sensorIds': ids,
+        'value': value,
+        'lower': value - spread,
+        'upper': value + spread,
+        'trend': trend,
+        'sigma': sigma,
+        'models': models,
+        'missing': missing,
+    }
+
+
+def hours_to(level, trend, target, phi):
+    """
+    Через сколько часов (от момента последнего показания) прогноз достигнет target,
+    векторно по датчикам. inf — при затухающем тренде уровень target не достигается.
+    """
+    level, trend, target = np.broadcast_arrays(*(np.asarray(a, dtype=np.float64) for a in (level, trend, target)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # level + trend·φ(1 − φ^h)/(1 − φ) = target  =>  φ^h = 1 − (target − level)(1 − φ)/(trend·φ)
+        remaining = 1 - (target - level) * (1 - phi) / (trend * phi)
+        hours = np.log(remaining) / np.log(phi)
+    hours = np.where((trend > 0) & (remaining > 0), hours, np.inf)
+    return np.where(level >= target, 0.0, hours)
+
+
+def summary():
+    """Сводка по моделям для /api/admin/ai/models"""
+    row = db.session.query(
+        db.func.count(SensorForecastModel.sensor_id),
+        db.func.sum(SensorForecastModel.observations),
+        db.func.avg(SensorForecastModel.abs_error),
+        db.func.avg(SensorForecastModel.variance),
+        db.func.max(SensorForecastModel.updated_at),
+    ).one()
+    return {
+        'models': row[0] or 0,
+        'observations': int(row[1] or 0),
+        'mae': float(row[2] or 0.0),
+        'rmse': float(np.sqrt(row[3] or 0.0)),
+        'updatedAt': row[4],
+    }
@@ -0,0 +1,341 @@
+"""
+Приём показаний датчиков.
+
+Все пути записи показаний (одиночное показание, пакет, поток NDJSON) сходятся в store_readings():
+вставка одним bulk INSERT и обновление текущего состояния датчиков одним UPDATE.
+Повторы (тот же датчик и временная метка или тот же ключ идемпотентности) пропускаются.
+"""
+import json
+from datetime import datetime, timezone
+from sqlalchemy import case, update
+from models import db, Sensor, SensorReading
+from services import alerts, anomalies, archive, forecast, rollups, zones
+from services.ring_buffer import ring_buffer
+from services.sensor_stream import sensor_stream
+from services.sql import dialect_insert
+
+
+def parse_timestamp(value):
+    """Разбирает ISO-строку времени и приводит её к наивному UTC (как datetime.utcnow)"""
+    if value is None:
+        return datetime.utcnow()
+    if not isinstance(value, str):
+        raise ValueError('Некорректная временная метка')
+
+    ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def validate_reading(data, sensor_id=None):
+    """
+    Проверяет одно показание и возвращает (row, error).
+    row — словарь колонок SensorReading, готовый для bulk insert.
+    """
+    if not isinstance(data, dict):
+        return None, 'Показание должно быть объектом'
+
+    sensor_id = sensor_id or data.get('sensor_id')
+    if not sensor_id or not isinstance(sensor_id, str):
+        return None, 'Поле sensor_id обязательно'
+
+    if 'water_level' not in data:
+        return None, 'Уровень воды обязателен'
+
+    water_level = data['water_level']
+    if isinstance(water_level, bool) or not isinstance(water_level, (int, float)) or water_level < 0:
+        return None, 'Некорректный уровень воды'
+
+    temperature = data.get('temperature')
+    if temperature is not None and (isinstance(temperature, bool) or not isinstance(temperature, (int, float))):
+        return None, 'Некорректная температура'
+
+    try:
+        timestamp = parse_timestamp(data.get('timestamp'))
+    except ValueError:
+        return None, 'Некорректная временная метка'
+
+    idempotency_key = data.get('idempotency_key')
+    if idempotency_key is not None and (not isinstance(idempotency_key, str) or not 0 < len(idempotency_key) <= 64):
+        return None, 'Некорректный ключ идемпотентности'
+
+    return {
+        'sensor_id': sensor_id,
+        'water_level': float(water_level),
+        'temperature': float(temperature) if temperature is not None else None,
+        'timestamp': timestamp,
+        'idempotency_key': idempotency_key,
+    }, None
+
+
+def load_active_sensors(sensor_ids):
+    """Возвращает {sensor_id: last_update} для активных датчиков из списка (один запрос)"""
+    if not sensor_ids:
+        return {}
+    rows = db.session.query(Sensor.id, Sensor.last_update).filter(
+        Sensor.id.in_(sensor_ids),
+        Sensor.is_active.is_(True)
+    ).all()
+    return {row.id: row.last_update for row in rows}
+
+
+def _unique_rows(rows):
+    """Убирает повторы внутри пакета: по (датчик, время) и по (датчик, ключ идемпотентности)"""
+    seen = set()
+    unique = []
+    for row in rows:
+        row.setdefault('idempotency_key', None)
+        keys = [(row['sensor_id'], row['timestamp'])]
+        if row['idempotency_key'] is not None:
+            keys.append((row['sensor_id'], 'key', row['idempotency_key']))
+        if any(key in seen for key in keys):
+            continue
+        seen.update(keys)
+        unique.append(row)
+    return unique
+
+
+def store_readings(rows, sensors, returning=False):
+    """
+    Записывает проверенные показания без commit.
+
+    rows    — словари из validate_reading()
+    sensors — {sensor_id: last_update} из load_active_sensors()
+
+    Показания вставляются одним bulk INSERT ... ON CONFLICT DO NOTHING: повтор уже
+    сохранённого показания (ретрай шлюза) пропускается, первая запись остаётся в силе.
+    Повторы показаний, уже вынесенных в архив (services.archive), отсекаются по файлу архива.
+    water_level/temperature/last_update каждого датчика обновляются до его самого
+    свежего показания одним UPDATE ... CASE (вместе с danger_level по порогам датчика).
+    Более старые показания (например, догрузка истории) текущее состояние не откатывают.
+    Там же обновляются часовые/суточные агрегаты (services.rollups), уровень/тренд
+    затронутых зон риска (services.zones) и модели прогноза (services.forecast),
+    создаются уведомления о пересечении порогов (services.alerts), а кольцевой буфер
+    свежих показаний (services.ring_buffer) пополняется после commit. Показания,
+    отклонённые детектором аномалий (services.anomalies), сохраняются с меткой, но
+    на агрегаты, текущий уровень, оповещения, зоны и прогноз не влияют.
+
+    Возвращает только действительно вставленные показания: объекты SensorReading
+    при returning=True, иначе словари из rows.
+    """
+    rows = archive.drop_archived(_unique_rows(rows))
+    if not rows:
+        return []
+
+    stmt = dialect_insert(SensorReading).on_conflict_do_nothing()
+    if returning:
+        readings = db.session.scalars(stmt.returning(SensorReading), rows).all()
+        inserted = {(r.sensor_id, r.timestamp): r.id for r in readings}
+    else:
+        result = db.session.execute(
+            stmt.returning(SensorReading.id, SensorReading.sensor_id, SensorReading.timestamp), rows
+        )
+        inserted = {(r.sensor_id, r.timestamp): r.id for r in result}
+
+    rows = [row for row in rows if (row['sensor_id'], row['timestamp']) in inserted]
+    if not rows:
+        return []
+
+    # Выбросы помечаются и дальше (агрегаты, текущий уровень, прогноз, оповещения, зоны) не идут
+    accepted = anomalies.apply_readings(rows, inserted, readings if returning else None)
+
+    # В буфер — все показания, с метками аномалий (как в истории из БД)
+    ring_buffer.stage(rows, [inserted[(row['sensor_id'], row['timestamp'])] for row in rows])
+
+    # Часовые/суточные агрегаты — в той же транзакции
+    rollups.apply_readings(accepted)
+
+    # Модели прогноза дообучаются на новых показаниях
+    forecast.apply_readings(accepted)
+
+    # Оповещения о пересечении порогов — до обновления last_update датчиков
+    alerts.apply_readings(accepted, sensors)
+
+    # Самое свежее показание каждого датчика в пакете
+    newest = {}
+    for row in accepted:
+        current = newest.get(row['sensor_id'])
+        if current is None or row['timestamp'] >= current['timestamp']:
+            newest[row['sensor_id']] = row
+
+    latest = {
+        sensor_id: row for sensor_id, row in newest.items()
+        if sensors.get(sensor_id) is None or sensors[sensor_id] <= row['timestamp']
+    }
+
+    if latest:
+        water_level = case({sid: r['water_level'] for sid, r in latest.items()}, value=Sensor.id)
+        db.session.execute(
+            update(Sensor)
+            .where(Sensor.id.in_(list(latest)))
+            .values(
+                water_level=water_level,
+                temperature=case({sid: r['temperature'] for sid, r in latest.items()}, value=Sensor.id),
+                last_update=case({sid: r['timestamp'] for sid, r in latest.items()}, value=Sensor.id),
+                danger_level=Sensor.danger_level_expr(water_level),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        for sensor_id, row in latest.items():
+            sensors[sensor_id] = row['timestamp']
+
+    # Уровень и тренд зон риска — только для зон с датчиками из пакета
+    zones.refresh_for_sensors(newest.keys())
+
+    if returning:
+        return sorted(readings, key=lambda r: (r.timestamp, r.id))
+    return rows
+
+
+def ingest_batch(items, queue=None):
+    """
+    Принимает пакет показаний по многим датчикам.
+
+    Проверка всего пакета за один проход, один запрос к sensors, один INSERT,
+    один UPDATE и один commit. Возвращает (results, accepted_count), где results —
+    статус по каждому элементу в исходном порядке (accepted, duplicate или rejected).
+
+    Если передана очередь (services.ingest_queue), принятые показания вместо
+    записи в БД дописываются в её журнал.
+    """
+    results = []
+    rows = []
+
+    for index, item in enumerate(items):
+        row, error = validate_reading(item)
+        if error:
+            results.append({'index': index, 'status': 'rejected', 'error': error})
+        else:
+            results.append({'index': index, 'status': 'accepted', 'sensorId': row['sensor_id']})
+            rows.append((index, row))
+
+    sensors = load_active_sensors({row['sensor_id'] for _, row in rows})
+
+    accepted = []
+    for index, row in rows:
+        if row['sensor_id'] not in sensors:
+            results[index] = {'index': index, 'status': 'rejected', 'error': 'Датчик не найден'}
+        else:
+            accepted.append((index, row))
+
+    if queue is not None:
+        queue.enqueue([row for _, row in accepted])
+        return results, len(accepted)
+
+    stored = {id(row) for row in store_readings([row for _, row in accepted], sensors)}
+    db.session.commit()
+    sensor_stream.publish()
+
+    for index, row in accepted:
+        if id(row) not in stored:
+            results[index]['status'] = 'duplicate'
+    return results, len(stored)
+
+
+def ingest_stream(stream, chunk_size, offset=0, max_line_length=65536, max_errors=100):
+    """
+    Потоковый приём показаний в формате NDJSON (одно показание на строку).
+
+    Строки читаются из stream по одной и копятся в чанк из chunk_size показаний;
+    каждый чанк записывается через store_readings() с отдельным commit, поэтому память
+    не зависит от размера загрузки. Первые offset строк пропускаются без разбора —
+    так прерванную догрузку можно продолжить с места остановки.
+
+    Генератор отдаёт события-словари:
+    - {'event': 'progress', 'committedLine': n, ...} — после каждого commit;
+    - {'event': 'done' | 'aborted', 'committedLine': n, ...} — в конце.
+    committedLine — номер последней строки, вошедшей в зафиксированные данные;
+    его передают как offset при повторной отправке того же файла.
+
+    Отклонённые строки отдельными событиями не отдаются: событие несёт счётчик rejected
+    и errors — первые max_errors отклонений с прошлого события ([{'line', 'error'}]).
+    Так объём ответа растёт с числом чанков, а не строк загрузки.
+    """
+    sensors = {}
+    missing = set()
+    chunk = []
+    state = {'line': 0, 'committed_line': offset, 'accepted': 0, 'duplicates': 0, 'rejected': 0}
+    errors = []
+
+    def reject(line_no, error):
+        state['rejected'] += 1
+        if len(errors) < max_errors:
+            errors.append({'line': line_no, 'error': error})
+
+    def flush():
+        """Записывает накопленный чанк; строки с неизвестными датчиками отклоняются"""
+        unknown = {row['sensor_id'] for _, row in chunk} - sensors.keys() - missing
+        if unknown:
+            found = load_active_sensors(unknown)
+            sensors.update(found)
+            missing.update(unknown - found.keys())
+
+        rows = [row for _, row in chunk if row['sensor_id'] in sensors]
+        dropped = [line_no for line_no, row in chunk if row['sensor_id'] not in sensors]
+
+        stored = store_readings(rows, sensors)
+        db.session.commit()
+        sensor_stream.publish()
+
+        state['accepted'] += len(stored)
+        state['duplicates'] += len(rows) - len(stored)
+        for line_no in dropped:
+            reject(line_no, 'Датчик не найден')
+        state['committed_line'] = state['line']
+        chunk.clear()
+
+    def progress(event):
+        result = {
+            'event': event,
+            'committedLine': state['committed_line'],
+            'accepted': state['accepted'],
+            'duplicates': state['duplicates'],
+            'rejected': state['rejected'],
+            'errors': list(errors),
+        }
+        errors.clear()
+        return result
+
+    while True:
+        raw = stream.readline(max_line_length + 1)
+        if not raw:
+            break
+        state['line'] += 1
+        line_no = state['line']
+        if line_no <= offset:
+            continue
+
+        if len(raw) > max_line_length:
+            # Конец слишком длинной строки не найти, не прочитав его целиком — останавливаемся
+            state['line'] -= 1
+            flush()
+            reject(line_no, 'Слишком длинная строка')
+            yield progress('aborted')
+            return
+
+        raw = raw.strip()
+        if not raw:
+            continue
+
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            row, error = None, 'Некорректный JSON'
+        else:
+            row, error = validate_reading(item)
+
+        if row is not None and row['sensor_id'] in missing:
+            row, error = None, 'Датчик не найден'
+
+        if error:
+            reject(line_no, error)
+            continue
+
+        chunk.append((line_no, row))
+        if len(chunk) >= chunk_size:
+            flush()
+            yield progress('progress')
+
+    flush()
+    yield progress('done')
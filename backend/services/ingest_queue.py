@@ -0,0 +1,318 @@
+"""
+Очередь отложенной записи показаний (write-behind).
+
+Запрос подтверждается, как только показания дописаны в локальный журнал на диске
+(append + fsync), а фоновый поток переносит их в sensor_readings групповыми commit —
+по таймеру и при накоплении порога. Так задержка приёма не зависит от блокировки
+записи SQLite.
+
+Журнал каждого процесса — файл ingest-<pid>-<start>.log в SENSOR_INGEST_QUEUE_DIR
+(start — время запуска процесса в мс: PID после перезапуска контейнера или воркера
+повторяются, а пара pid+start — нет). Перед записью в БД он переносится в
+ingest-<pid>-<start>.<seq>.flushing и удаляется после commit; сегменты переносятся
+через link + unlink и никогда не перезаписывают существующий файл. Сегменты умерших
+процессов (перезапуск воркера gunicorn) подхватываются живыми процессами сразу при
+старте и дальше при каждом сбросе, поэтому подтверждённые показания не теряются:
+доставка «как минимум один раз». Сегменты сбрасываются в порядке номеров, чтобы
+более старые показания не попали в БД позже новых (и не сочлись досылкой).
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import psutil
+
+from models import db
+from services.ingest import load_active_sensors, store_readings
+from services.sensor_stream import sensor_stream
+
+# ingest-<pid>[-<start>](.log | .<seq>.flushing); сегменты без start — от старых версий
+SEGMENT = re.compile(r'^ingest-(\d+)(?:-(\d+))?(?:\.log|\.(\d+)\.flushing)$')
+
+
+def _started(pid):
+    """Время запуска процесса pid в мс или None, если процесса нет"""
+    try:
+        return int(psutil.Process(pid).create_time() * 1000)
+    except psutil.Error:
+        return None
+
+
+def _move(source, target):
+    """Переносит файл, не перезаписывая target; False — source уже забрал другой процесс"""
+    try:
+        os.link(source, target)  # FileExistsError, если target уже есть
+    except FileNotFoundError:
+        return False
+    try:
+        os.remove(source)
+    except FileNotFoundError:
+        os.remove(target)  # source одновременно перенёс другой процесс — сегмент его
+        return False
+    return True
+
+
+class IngestQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._owner = None
+        self._file = None
+        self._seq = 0
+        self._active_count = 0
+        self._active_oldest = None
+        self._inflight_count = 0
+        self._inflight_oldest = None
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'duplicates': 0,
+            'dropped': 0,
+            'flushes': 0,
+            'lastFlushMs': None,
+            'maxFlushMs': None,
+            'lastFlushAt': None,
+            'lastError': None,
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['SENSOR_INGEST_QUEUE_ENABLED']
+        self.directory = app.config['SENSOR_INGEST_QUEUE_DIR']
+        self.flush_interval = app.config['SENSOR_INGEST_FLUSH_INTERVAL']
+        self.flush_size = app.config['SENSOR_INGEST_FLUSH_SIZE']
+        app.extensions['ingest_queue'] = self
+
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self._shutdown)
+            # Сразу — чтобы забрать сегменты прошлого запуска, не дожидаясь новых показаний;
+            # в воркерах, созданных fork после init_app, — на первом запросе
+            self._ensure_started()
+            app.before_request(self._ensure_started)
+
+    # ---------- запись в журнал ----------
+
+    def _segment_path(self, seq=None):
+        if seq is None:
+            return os.path.join(self.directory, f'ingest-{self._owner}.log')
+        return os.path.join(self.directory, f'ingest-{self._owner}.{seq}.flushing')
+
+    def _ensure_started(self):
+        """Открывает журнал и запускает поток записи (после fork — заново в каждом воркере)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+
+            self._owner = f'{pid}-{_started(pid)}'
+            self._seq = max((seq for seq, _ in self._own_segments()), default=0)
+            path = self._segment_path()
+            # Имя уникально для процесса, но журнал мог остаться от этого же процесса
+            # (повторная инициализация) — его строки тоже ждут переноса
+            self._active_count = 0
+            self._active_oldest = None
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self._active_count = sum(1 for _ in f)
+                if self._active_count:
+                    self._active_oldest = os.path.getmtime(path)
+            self._file = open(path, 'ab')
+            self._inflight_count = 0
+            self._inflight_oldest = None
+            self._pid = pid
+
+            thread = threading.Thread(target=self._run, name='ingest-queue-writer', daemon=True)
+            thread.start()
+        self._wakeup.set()  # первый сброс — сразу: сегменты умерших процессов
+
+    def enqueue(self, rows):
+        """Дописывает проверенные показания в журнал; после возврата они сохранены на диске"""
+        if not rows:
+            return 0
+
+        payload = ''.join(
+            json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) + '\n'
+            for row in rows
+        ).encode('utf-8')
+
+        self._ensure_started()
+        with self._lock:
+            self._file.write(payload)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            if self._active_oldest is None:
+                self._active_oldest = time.time()
+            self._active_count += len(rows)
+            self._stats['enqueued'] += len(rows)
+            depth = self._active_count
+
+        if depth >= self.flush_size:
+            self._wakeup.set()
+        return len(rows)
+
+    # ---------- перенос в БД ----------
+
+    def _rotate(self):
+        """Закрывает активный сегмент и переводит его в .flushing"""
+        with self._lock:
+            if self._pid != os.getpid() or not self._active_count:
+                return
+            self._file.close()
+            self._seq += 1
+            _move(self._segment_path(), self._segment_path(self._seq))
+            self._file = open(self._segment_path(), 'ab')
+
+            self._inflight_count += self._active_count
+            if self._inflight_oldest is None:
+                self._inflight_oldest = self._active_oldest
+            self._active_count = 0
+            self._active_oldest = None
+
+    def _own_segments(self):
+        """Сегменты этого процесса, ожидающие переноса: [(номер, путь)] по возрастанию номера"""
+        segments = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT.match(name)
+            if match and match.group(3) and f'{match.group(1)}-{match.group(2)}' == self._owner:
+                segments.append((int(match.group(3)), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _claim_orphans(self):
+        """Забирает сегменты процессов, которых уже нет (старые — первыми)"""
+        orphans = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT.match(name)
+            if not match:
+                continue
+            pid, start, seq = int(match.group(1)), match.group(2), match.group(3)
+            if f'{pid}-{start}' == self._owner:
+                continue
+            started = _started(pid)
+            # Тот же PID у живого процесса ещё не значит, что сегмент его
+            if started is not None and start is not None and int(start) == started:
+                continue
+            # Активный журнал владельца новее всех его .flushing
+            orphans.append((int(start or 0), pid, int(seq) if seq else float('inf'), name))
+
+        claimed = []
+        for _, _, _, name in sorted(orphans):
+            self._seq += 1
+            target = self._segment_path(self._seq)
+            if _move(os.path.join(self.directory, name), target):
+                claimed.append(target)
+        return claimed
+
+    def _read_segment(self, path):
+        rows = []
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                    row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+                except (ValueError, KeyError):
+                    continue  # недописанная строка — запрос по ней не был подтверждён
+                rows.append(row)
+        return rows
+
+    def _flush_segment(self, path):
+        rows = self._read_segment(path)
+        sensors = load_active_sensors({row['sensor_id'] for row in rows})
+        accepted = [row for row in rows if row['sensor_id'] in sensors]
+
+        stored = store_readings(accepted, sensors)
+        db.session.commit()
+        sensor_stream.publish()
+        os.remove(path)
+
+        self._stats['flushed'] += len(stored)
+        self._stats['duplicates'] += len(accepted) - len(stored)
+        self._stats['dropped'] += len(rows) - len(accepted)
+
+    def flush(self):
+        """Переносит все накопленные показания в БД, по одному commit на сегмент"""
+        if self._pid != os.getpid():
+            return
+
+        with self._flush_lock:
+            self._claim_orphans()
+            self._rotate()
+            segments = [path for _, path in self._own_segments()]
+            if not segments:
+                return
+
+            started = time.perf_counter()
+            with self.app.app_context():
+                try:
+                    for path in segments:
+                        self._flush_segment(path)
+                except Exception as e:
+                    db.session.rollback()
+                    self._stats['lastError'] = str(e)
+                    print(f"Ошибка записи очереди показаний: {e}")
+                    return  # сегмент остаётся на диске и будет повторён
+
+            elapsed = round((time.perf_counter() - started) * 1000, 2)
+            with self._lock:
+                self._inflight_count = 0
+                self._inflight_oldest = None
+            self._stats['flushes'] += 1
+            self._stats['lastFlushMs'] = elapsed
+            self._stats['maxFlushMs'] = max(self._stats['maxFlushMs'] or 0, elapsed)
+            self._stats['lastFlushAt'] = datetime.utcnow().isoformat()
+            self._stats['lastError'] = None
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self._stats['lastError'] = str(e)
+                print(f"Ошибка потока очереди показаний: {e}")
+
+    def _shutdown(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Ошибка записи очереди при остановке: {e}")
+
+    # ---------- метрики ----------
+
+    def stats(self):
+        """Глубина очереди, задержка commit и отставание записи (для текущего процесса)"""
+        with self._lock:
+            depth = self._active_count + self._inflight_count
+            oldest = [t for t in (self._active_oldest, self._inflight_oldest) if t is not None]
+
+        pending_segments = 0
+        if self.enabled and os.path.isdir(self.directory):
+            pending_segments = sum(1 for name in os.listdir(self.directory) if name.startswith('ingest-'))
+
+        return {
+            'enabled': self.enabled,
+            'pid': os.getpid(),
+            'depth': depth,
+            'lagSeconds': round(time.time() - min(oldest), 3) if oldest else 0.0,
+            'pendingSegments': pending_segments,
+            'flushInterval': self.flush_interval if self.enabled else None,
+            'flushSize': self.flush_size if self.enabled else None,
+            **self._stats,
+        }
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,126 @@
+"""
+Кэш готовых ответов публичных GET-эндпоинтов.
+
+Ответ (уже сериализованный JSON, байты) хранится в локальной SQLite-базе
+RESPONSE_CACHE_PATH (по умолчанию в /dev/shm) — она общая для всех воркеров gunicorn
+на узле. Ключ — путь и нормализованные query-параметры; вместе с телом хранится ETag,
+посчитанный по версиям таблиц (services.versions). Запись отдаётся, только если её
+ETag совпадает с текущим, поэтому устаревший ответ не может быть отдан даже при
+записи из другого воркера или из приёма показаний.
+
+Обработчики создания/изменения/удаления дополнительно вызывают invalidate(таблицы) —
+записи, построенные по этим таблицам, удаляются сразу, не дожидаясь вытеснения.
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    tags TEXT NOT NULL,
+    etag TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    mimetype TEXT NOT NULL,
+    body BLOB NOT NULL,
+    stored_at REAL NOT NULL
+)
+"""
+
+# Как часто (в записях) проверять размер кэша
+PRUNE_EVERY = 100
+
+
+def default_path(database_uri):
+    """Файл кэша: в /dev/shm, отдельный для каждой БД"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    suffix = hashlib.sha1(database_uri.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(base, f'gidroatlas-cache-{suffix}.sqlite')
+
+
+def cache_key(path, args):
+    """Путь + query-параметры в каноническом порядке (?b=2&a=1 и ?a=1&b=2 — один ключ)"""
+    items = sorted((name, value) for name, values in args.lists() for value in values if value != '')
+    return f'{path}?{urlencode(items)}' if items else path
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.enabled = False
+        self._local = threading.local()
+        self._writes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['RESPONSE_CACHE_ENABLED']
+        self.max_entries = app.config['RESPONSE_CACHE_MAX_ENTRIES']
+        self.path = app.config['RESPONSE_CACHE_PATH'] or default_path(app.config['SQLALCHEMY_DATABASE_URI'])
+        app.extensions['response_cache'] = self
+
+        if self.enabled:
+            self._connect().execute(SCHEMA)
+
+    def _connect(self):
+        """Соединение текущего потока (после fork — новое)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # кэш можно потерять без последствий
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, etag):
+        """(status, mimetype, body) для ключа, если запись построена при той же версии данных"""
+        if not self.enabled:
+            return None
+        try:
+            row = self._connect().execute(
+                'SELECT status, mimetype, body FROM responses WHERE key = ? AND etag = ?', (key, etag)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Ошибка чтения кэша ответов: {e}")
+            return None
+        return row
+
+    def set(self, key, tables, etag, status, mimetype, body):
+        if not self.enabled:
+            return
+        tags = ',' + ','.join(sorted(tables)) + ','
+        try:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, tags, etag, status, mimetype, body, stored_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, tags, etag, status, mimetype, body, time.time())
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                # Вытесняем самые старые записи сверх RESPONSE_CACHE_MAX_ENTRIES
+                conn.execute(
+                    'DELETE FROM responses WHERE key IN ('
+                    'SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            print(f"Ошибка записи кэша ответов: {e}")
+
+    def invalidate(self, *tables):
+        """Удаляет ответы, построенные по любой из таблиц (после commit изменений)"""
+        if not self.enabled:
+            return
+        try:
+            conn = self._connect()
+            for table in tables:
+                conn.execute('DELETE FROM responses WHERE tags LIKE ?', (f'%,{table},%',))
+        except sqlite3.Error as e:
+            print(f"Ошибка сброса кэша ответов: {e}")
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,313 @@
+"""
+Кольцевой буфер последних показаний каждого датчика.
+
+Буфер датчика — файл фиксированного размера в SENSOR_RING_DIR (по умолчанию /dev/shm),
+отображённый в память (mmap) как массив numpy из SENSOR_RING_CAPACITY записей
+(id, timestamp в мкс, уровень, температура, метки аномалий) — 40 байт на показание.
+Метки хранятся битовой маской по services.anomalies.FLAGS, чтобы показания в карантине
+отдавались из буфера с той же меткой, что и из БД. Файл общий для
+всех воркеров gunicorn, доступ защищён flock, поэтому показание, принятое одним
+воркером, сразу видно остальным.
+
+Буфер пополняется из store_readings() после успешного commit (события сессии),
+а при первом запросе истории датчика прогревается из БД. Запрос за последние
+hours <= SENSOR_RING_WINDOW_HOURS обслуживается целиком из буфера, без SQL.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import event
+
+from models import db, SensorReading
+from services.anomalies import FLAGS as ANOMALY_FLAGS
+
+try:
+    import fcntl
+except ImportError:  # Windows: только однопроцессный dev-сервер
+    fcntl = None
+
+RECORD = np.dtype([('id', '<i8'), ('ts', '<i8'), ('level', '<f8'), ('temp', '<f8'), ('anomaly', '<i8')])
+HEADER = np.dtype([('capacity', '<i8'), ('count', '<i8'), ('head', '<i8'), ('since', '<i8'), ('epoch', '<i8')])
+
+# since == NOT_READY — буфер ещё не прогрет (или сброшен) и запросы не обслуживает
+NOT_READY = np.iinfo(np.int64).max
+EPOCH = datetime(1970, 1, 1)
+SESSION_KEY = 'ring_buffer_pending'
+
+
+def to_us(ts):
+    return (ts - EPOCH) // timedelta(microseconds=1)
+
+
+def from_us(us):
+    return EPOCH + timedelta(microseconds=int(us))
+
+
+def anomaly_mask(anomaly):
+    """Метки SensorReading.anomaly ('spike,rate') -> битовая маска"""
+    if not anomaly:
+        return 0
+    return sum(1 << i for i, flag in enumerate(ANOMALY_FLAGS) if flag in anomaly.split(','))
+
+
+def anomaly_flags(mask):
+    """Битовая маска -> метки в формате SensorReading.anomaly (или None)"""
+    return ','.join(flag for i, flag in enumerate(ANOMALY_FLAGS) if mask >> i & 1) or None
+
+
+def default_directory(database_uri):
+    """Каталог буферов: в /dev/shm, отдельный для каждой БД"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    suffix = hashlib.sha1(database_uri.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(base, f'gidroatlas-ring-{suffix}')
+
+
+class _Ring:
+    """Открытый файл буфера одного датчика"""
+
+    def __init__(self, path, capacity):
+        size = HEADER.itemsize + capacity * RECORD.itemsize
+        self.file = open(path, 'a+b')
+        with self._flock(True):
+            if os.fstat(self.file.fileno()).st_size != size:
+                # Новый файл или изменилась ёмкость — инициализируем заново
+                self.file.truncate(size)
+                self._map(capacity)
+                self.header[...] = (capacity, 0, 0, NOT_READY, 0)
+                return
+        self._map(capacity)
+
+    def _map(self, capacity):
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.header = np.ndarray((), dtype=HEADER, buffer=self.mm, offset=0)
+        self.records = np.ndarray((capacity,), dtype=RECORD, buffer=self.mm, offset=HEADER.itemsize)
+
+    @contextmanager
+    def _flock(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def ordered(self):
+        """Записи буфера от старой к новой (копия)"""
+        count = int(self.header['count'])
+        capacity = int(self.header['capacity'])
+        oldest = (int(self.header['head']) - count) % capacity
+        return self.records[(oldest + np.arange(count)) % capacity].copy()
+
+    def reset(self):
+        self.header['count'] = 0
+        self.header['head'] = 0
+        self.header['since'] = NOT_READY
+        self.header['epoch'] += 1
+
+    def write(self, new):
+        """Дописывает отсортированные по времени записи, вытесняя самые старые"""
+        capacity = int(self.header['capacity'])
+        count = int(self.header['count'])
+        head = int(self.header['head'])
+
+        if count and new['ts'][0] < self.records['ts'][(head - 1) % capacity]:
+            # Показание старше уже сохранённых (догрузка истории) — проще прогреть заново
+            self.reset()
+            return
+
+        last_evicted = None
+        if len(new) > capacity:
+            last_evicted = int(new['ts'][len(new) - capacity - 1])
+            new = new[-capacity:]
+            evicted = count
+        else:
+            evicted = max(0, count + len(new) - capacity)
+            if evicted:
+                oldest = (head - count) % capacity
+                last_evicted = int(self.records['ts'][(oldest + evicted - 1) % capacity])
+
+        self.records[(head + np.arange(len(new))) % capacity] = new
+        self.header['head'] = (head + len(new)) % capacity
+        self.header['count'] = min(capacity, count + len(new))
+
+        since = int(self.header['since'])
+        if last_evicted is not None and since != NOT_READY:
+            # Полнота буфера гарантирована только после последнего вытесненного показания
+            self.header['since'] = max(since, last_evicted + 1)
+
+
+class RingBuffer:
+    def __init__(self, app=None):
+        self.enabled = False
+        self._rings = {}
+        self._pid = None
+        self._lock = threading.RLock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['SENSOR_RING_ENABLED']
+        self.capacity = app.config['SENSOR_RING_CAPACITY']
+        self.window_hours = app.config['SENSOR_RING_WINDOW_HOURS']
+        self.directory = app.config['SENSOR_RING_DIR'] or default_directory(app.config['SQLALCHEMY_DATABASE_URI'])
+        app.extensions['ring_buffer'] = self
+
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            if not event.contains(db.session, 'after_commit', _apply_pending):
+                event.listen(db.session, 'after_commit', _apply_pending)
+                event.listen(db.session, 'after_rollback', _drop_pending)
+
+    def _ring(self, sensor_id, create):
+        if self._pid != os.getpid():
+            # После fork дескрипторы (и блокировки flock) у процессов должны быть свои
+            self._rings = {}
+            self._pid = os.getpid()
+        ring = self._rings.get(sensor_id)
+        if ring is None:
+            path = os.path.join(self.directory, sensor_id.encode('utf-8').hex() + '.ring')
+            if not create and not os.path.exists(path):
+                return None
+            ring = _Ring(path, self.capacity)
+            self._rings[sensor_id] = ring
+        return ring
+
+    @contextmanager
+    def _locked(self, sensor_id, exclusive=True, create=True):
+        with self._lock:
+            ring = self._ring(sensor_id, create)
+            if ring is None:
+                yield None
+                return
+            with ring._flock(exclusive):
+                yield ring
+
+    # ---------- запись ----------
+
+    def stage(self, rows, ids):
+        """Запоминает вставленные показания (уже с метками аномалий) до commit текущей сессии"""
+        if not self.enabled:
+            return
+        db.session.info.setdefault(SESSION_KEY, []).extend(zip(ids, rows))
+
+    def append(self, sensor_id, records):
+        with self._locked(sensor_id) as ring:
+            ring.write(np.sort(records, order=['ts', 'id']))
+
+    def invalidate(self, sensor_id):
+        """Сбрасывает буфер датчика (удаление датчика, чистка дублей и т.п.)"""
+        if not self.enabled:
+            return
+        with self._locked(sensor_id, create=False) as ring:
+            if ring is not None:
+                ring.reset()
+
+    def warm(self, sensor_id):
+        """Заполняет буфер последними показаниями из БД за окно SENSOR_RING_WINDOW_HOURS"""
+        if not self.enabled:
+            return
+        start = datetime.utcnow() - timedelta(hours=self.window_hours)
+        with self._locked(sensor_id) as ring:
+            if int(ring.header['since']) != NOT_READY:
+                return
+            epoch = int(ring.header['epoch'])
+
+        rows = db.session.query(
+            SensorReading.id, SensorReading.timestamp, SensorReading.water_level, SensorReading.temperature,
+            SensorReading.anomaly
+        ).filter(
+            SensorReading.sensor_id == sensor_id,
+            SensorReading.timestamp >= start
+        ).order_by(SensorReading.timestamp.desc(), SensorReading.id.desc()).limit(self.capacity).all()
+
+        loaded = np.array(
+            [(r.id, to_us(r.timestamp), r.water_level, np.nan if r.temperature is None else r.temperature,
+              anomaly_mask(r.anomaly))
+             for r in rows],
+            dtype=RECORD
+        )
+
+        with self._locked(sensor_id) as ring:
+            if int(ring.header['epoch']) != epoch:
+                return  # буфер сбросили, пока читали БД — прогреем в следующий раз
+
+            # Показания, пришедшие во время прогрева, уже дописаны в буфер — объединяем по id
+            merged = np.concatenate([loaded, ring.ordered()])
+            _, unique = np.unique(merged['id'], return_index=True)
+            merged = np.sort(merged[unique], order=['ts', 'id'])[-self.capacity:]
+
+            if len(rows) < self.capacity:
+                since = to_us(start)
+            else:
+                since = int(loaded['ts'].min()) + 1
+
+            ring.records[:len(merged)] = merged
+            ring.header['count'] = len(merged)
+            ring.header['head'] = len(merged) % self.capacity
+            ring.header['since'] = since
+
+    # ---------- чтение ----------
+
+    def covers(self, hours):
+        return self.enabled and hours <= self.window_hours
+
+    def recent(self, sensor_id, start):
+        """
+        Показания датчика с timestamp >= start из буфера, или None, если буфер
+        не прогрет либо не покрывает окно целиком.
+        Возвращает несохраняемые (transient) объекты SensorReading.
+        """
+        start_us = to_us(start)
+        # Файлы буферов создаются только для существующих датчиков (прогрев, приём показаний)
+        with self._locked(sensor_id, exclusive=False, create=False) as ring:
+            if ring is None or start_us < int(ring.header['since']):
+                return None
+            records = ring.ordered()
+
+        records = records[np.searchsorted(records['ts'], start_us):]
+        return [
+            SensorReading(
+                id=int(rec['id']),
+                sensor_id=sensor_id,
+                water_level=float(rec['level']),
+                temperature=None if np.isnan(rec['temp']) else float(rec['temp']),
+                timestamp=from_us(rec['ts']),
+                anomaly=anomaly_flags(int(rec['anomaly']))
+            )
+            for rec in records
+        ]
+
+
+def _apply_pending(session):
+    pending = session.info.pop(SESSION_KEY, None)
+    if not pending:
+        return
+
+    by_sensor = {}
+    for reading_id, row in pending:
+        temperature = row['temperature']
+        by_sensor.setdefault(row['sensor_id'], []).append(
+            (reading_id, to_us(row['timestamp']), row['water_level'], np.nan if temperature is None else temperature,
+             anomaly_mask(row.get('anomaly')))
+        )
+
+    for sensor_id, records in by_sensor.items():
+        try:
+            ring_buffer.append(sensor_id, np.array(records, dtype=RECORD))
+        except Exception as e:
+            print(f"Ошибка обновления буфера показаний {sensor_id}: {e}")
+
+
+def _drop_pending(session):
+    session.info.pop(SESSION_KEY, None)
+
+
+ring_buffer = RingBuffer()
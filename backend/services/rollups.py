@@ -0,0 +1,128 @@
+"""
+Часовые и суточные агрегаты показаний (sensor_reading_rollups).
+
+apply_readings() вызывается из store_readings() в той же транзакции, что и вставка
+показаний: строки группируются по (датчик, разрешение, интервал) и сливаются с уже
+сохранёнными агрегатами через INSERT ... ON CONFLICT DO UPDATE.
+rebuild() пересчитывает агрегаты с нуля (flask rebuild-rollups); историю, накопленную
+до появления агрегатов, заполняет миграция e9f4b1c7d2a5 (flask db upgrade).
+"""
+import itertools
+from sqlalchemy import case
+from models import db, SensorReading, SensorReadingRollup
+from services import archive
+from services.anomalies import not_quarantined
+from services.sql import dialect_insert
+
+RESOLUTIONS = ('hour', 'day')
+
+# Ограничение на число строк в одном INSERT (лимит переменных SQLite)
+UPSERT_CHUNK_SIZE = 500
+
+
+def bucket_start(ts, resolution):
+    """Начало часового/суточного интервала, в который попадает ts"""
+    if resolution == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f'Неизвестное разрешение: {resolution}')
+
+
+def pick_resolution(hours, config):
+    """Выбирает raw/hour/day по длине запрошенного окна"""
+    if hours <= config['SENSOR_READINGS_RAW_MAX_HOURS']:
+        return 'raw'
+    if hours <= config['SENSOR_READINGS_HOURLY_MAX_HOURS']:
+        return 'hour'
+    return 'day'
+
+
+def _aggregate(rows):
+    """Сворачивает показания в агрегаты по (sensor_id, resolution, bucket_start)"""
+    buckets = {}
+    for row in rows:
+        level = row['water_level']
+        ts = row['timestamp']
+        for resolution in RESOLUTIONS:
+            key = (row['sensor_id'], resolution, bucket_start(ts, resolution))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = {
+                    'sensor_id': key[0],
+                    'resolution': resolution,
+                    'bucket_start': key[2],
+                    'count': 1,
+                    'min_level': level,
+                    'max_level': level,
+                    'sum_level': level,
+                    'last_level': level,
+                    'last_timestamp': ts,
+                }
+                continue
+            agg['count'] += 1
+            agg['sum_level'] += level
+            agg['min_level'] = min(agg['min_level'], level)
+            agg['max_level'] = max(agg['max_level'], level)
+            if ts >= agg['last_timestamp']:
+                agg['last_level'] = level
+                agg['last_timestamp'] = ts
+    return list(buckets.values())
+
+
+def apply_readings(rows):
+    """Добавляет показания к агрегатам (без commit)"""
+    values = _aggregate(rows)
+    table = SensorReadingRollup.__table__.c
+
+    for i in range(0, len(values), UPSERT_CHUNK_SIZE):
+        stmt = dialect_insert(SensorReadingRollup).values(values[i:i + UPSERT_CHUNK_SIZE])
+        new = stmt.excluded
+        newer = new.last_timestamp >= table.last_timestamp
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['sensor_id', 'resolution', 'bucket_start'],
+            set_={
+                'count': table['count'] + new['count'],
+                'sum_level': table.sum_level + new.sum_level,
+                'min_level': case((new.min_level < table.min_level, new.min_level), else_=table.min_level),
+                'max_level': case((new.max_level > table.max_level, new.max_level), else_=table.max_level),
+                'last_level': case((newer, new.last_level), else_=table.last_level),
+                'last_timestamp': case((newer, new.last_timestamp), else_=table.last_timestamp),
+            }
+        )
+        db.session.execute(stmt)
+
+
+def rebuild(sensor_ids=None, chunk_size=5000):
+    """
+    Пересчитывает агрегаты по сырым показаниям — архивным и из sensor_readings.
+    Показания читаются потоком по chunk_size строк, поэтому память не зависит от объёма истории.
+    """
+    delete = SensorReadingRollup.query
+    readings = db.session.query(
+        SensorReading.sensor_id, SensorReading.water_level, SensorReading.timestamp
+    ).filter(not_quarantined())
+    if sensor_ids:
+        delete = delete.filter(SensorReadingRollup.sensor_id.in_(sensor_ids))
+        readings = readings.filter(SensorReading.sensor_id.in_(sensor_ids))
+
+    delete.delete(synchronize_session=False)
+
+    hot = (
+        {'sensor_id': r.sensor_id, 'water_level': r.water_level, 'timestamp': r.timestamp}
+        for r in readings.order_by(SensorReading.sensor_id, SensorReading.timestamp).yield_per(chunk_size)
+    )
+
+    total = 0
+    chunk = []
+    for row in itertools.chain(archive.iter_rows(sensor_ids), hot):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            apply_readings(chunk)
+            total += len(chunk)
+            chunk = []
+
+    apply_readings(chunk)
+    total += len(chunk)
+    db.session.commit()
+    return total
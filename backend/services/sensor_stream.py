@@ -0,0 +1,209 @@
+"""
+Поток изменений датчиков для дашбордов (Server-Sent Events, GET /api/sensors/stream).
+
+В каждом процессе один поток-рассыльщик: по сигналу publish() (обработчики приёма
+показаний и изменения датчиков в этом процессе) или раз в SENSOR_STREAM_POLL_INTERVAL
+(изменения из других воркеров) он сравнивает ревизию таблицы sensors с последней
+разосланной и, если она выросла, одним запросом берёт изменённые датчики
+(services.versions.changes). Событие сериализуется один раз и кладётся в общий журнал
+в памяти — подписчики только копируют готовые байты, без запросов к БД и сериализации
+на каждого клиента. Пока подписчиков нет, опрос не выполняется.
+
+События (id — ревизия, браузер пришлёт её в Last-Event-ID при переподключении):
+- sensors — изменённые датчики (формат Sensor.to_dict) и id удалённых;
+- danger  — переход уровня опасности датчика (из, в);
+- reset   — клиент отстал больше, чем хранит журнал: нужно перечитать GET /api/sensors.
+
+Подписчик ждёт на условной переменной и не держит соединение с БД. В Docker поток
+обслуживает отдельный gunicorn с воркерами gevent (порт 5253): там threading подменён
+гринлетами, и простаивающее соединение стоит ~22 КБ, а не поток ОС — тысячи подписчиков
+на воркер. На API-воркерах gthread (порт 5252) подписчик держит спящий поток, общий
+с остальными запросами. Поэтому подписчиков на процесс не больше
+SENSOR_STREAM_MAX_SUBSCRIBERS: сверх лимита reserve() отказывает, и клиент повторяет
+подписку позже — простаивающие дашборды не блокируют API.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from models import db, Sensor
+from services.versions import watermark, changes
+
+# Через сколько мс браузер переподключается после разрыва
+RETRY_MS = 3000
+
+PING = b': ping\n\n'
+
+
+def format_event(event, revision, data):
+    """Одно SSE-сообщение"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {revision}\nevent: {event}\ndata: {payload}\n\n'.encode('utf-8')
+
+
+def _visible(sensor):
+    return sensor.is_active
+
+
+class SensorStream:
+    def __init__(self, app=None):
+        self.app = None
+        self._cond = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._subscribers = 0
+        self._log = deque()  # (ревизия, байты события)
+        self._head = 0  # ревизия, до которой изменения разосланы
+        self._floor = 0  # начиная с этой ревизии журнал полон
+        self._levels = {}  # sensor_id -> последний разосланный уровень опасности
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.poll_interval = app.config['SENSOR_STREAM_POLL_INTERVAL']
+        self.heartbeat = app.config['SENSOR_STREAM_HEARTBEAT']
+        self.max_seconds = app.config['SENSOR_STREAM_MAX_SECONDS']
+        self.backlog = app.config['SENSOR_STREAM_BACKLOG']
+        self.max_subscribers = app.config['SENSOR_STREAM_MAX_SUBSCRIBERS']
+        app.extensions['sensor_stream'] = self
+
+    def publish(self):
+        """Изменения датчиков зафиксированы в этом процессе — разослать, не дожидаясь опроса"""
+        if self._subscribers:
+            self._wakeup.set()
+
+    # ---------- рассыльщик ----------
+
+    def start(self):
+        """
+        Запускает поток рассыльщика (после fork — заново в каждом воркере). Если подписчиков
+        нет, текущее состояние становится точкой отсчёта: журнал и уровни перечитываются.
+        """
+        pid = os.getpid()
+        with self._poll_lock:
+            if self._pid != pid:
+                self._pid = pid
+                with self._cond:
+                    self._subscribers = 0
+                thread = threading.Thread(target=self._run, name='sensor-stream', daemon=True)
+                thread.start()
+            if not self._subscribers:
+                self._baseline()
+
+    def _baseline(self):
+        head = watermark('sensors')
+        self._levels = dict(db.session.query(Sensor.id, Sensor.danger_level).filter(Sensor.is_active.is_(True)))
+        with self._cond:
+            self._log.clear()
+            self._head = self._floor = head
+
+    def poll(self):
+        """Рассылает изменения датчиков после последней разосланной ревизии"""
+        head = watermark('sensors')
+        if head <= self._head:
+            return
+        sensors, deleted = changes(Sensor, self._head, visible=_visible)
+
+        transitions = []
+        for sensor in sensors:
+            previous = self._levels.get(sensor.id)
+            if previous is not None and previous != sensor.danger_level:
+                transitions.append({
+                    'sensorId': sensor.id,
+                    'name': sensor.name,
+                    'from': previous,
+                    'to': sensor.danger_level,
+                    'waterLevel': sensor.water_level,
+                    'lastUpdate': sensor.last_update.isoformat() if sensor.last_update else None,
+                })
+            self._levels[sensor.id] = sensor.danger_level
+        for sensor_id in deleted:
+            self._levels.pop(sensor_id, None)
+
+        message = format_event('sensors', head, {
+            'revision': head,
+            'sensors': [sensor.to_dict() for sensor in sensors],
+            'deleted': deleted,
+        })
+        message += b''.join(format_event('danger', head, transition) for transition in transitions)
+
+        with self._cond:
+            self._log.append((head, message))
+            while len(self._log) > self.backlog:
+                self._floor = self._log.popleft()[0]
+            self._head = head
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if not self._subscribers:
+                continue
+            with self.app.app_context():
+                try:
+                    with self._poll_lock:
+                        self.poll()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Ошибка рассылки изменений датчиков: {e}")
+                finally:
+                    db.session.remove()
+
+    # ---------- подписчики ----------
+
+    def reserve(self):
+        """Занимает место подписчика; False — лимит процесса исчерпан"""
+        with self._cond:
+            if self._subscribers >= self.max_subscribers:
+                return False
+            self._subscribers += 1
+            return True
+
+    def release(self):
+        """Освобождает место подписчика (при закрытии ответа сервером)"""
+        with self._cond:
+            self._subscribers -= 1
+
+    def catch_up(self, since, revision):
+        """Начальное событие для клиента, синхронизированного на ревизии since"""
+        if since is None or since == revision:
+            return b''
+        if since > revision:
+            return format_event('reset', revision, {'revision': revision})
+        sensors, deleted = changes(Sensor, since, visible=_visible)
+        return format_event('sensors', revision, {
+            'revision': revision,
+            'sensors': [sensor.to_dict() for sensor in sensors],
+            'deleted': deleted,
+        })
+
+    def listen(self, revision, initial=b''):
+        """
+        Генератор SSE одного клиента: события с ревизией больше revision, в простое — пинги.
+        Место подписчика занимается заранее (reserve) и освобождается при закрытии ответа.
+        """
+        yield f'retry: {RETRY_MS}\n\n'.encode('utf-8') + initial
+        deadline = time.monotonic() + self.max_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return  # браузер переподключится с Last-Event-ID
+            with self._cond:
+                self._cond.wait_for(lambda: self._head > revision, timeout=min(self.heartbeat, remaining))
+                head = self._head
+                if head <= revision:
+                    chunk = PING
+                elif revision < self._floor:
+                    chunk = format_event('reset', head, {'revision': head})
+                else:
+                    chunk = b''.join(message for r, message in self._log if r > revision)
+            revision = max(revision, head)
+            yield chunk
+
+
+sensor_stream = SensorStream()
@@ -0,0 +1,96 @@
+"""
+Упрощение полигонов зон риска для мелких масштабов карты (алгоритм Дугласа — Пекера).
+
+Для каждого полигона заранее считаются упрощения с допусками TOLERANCES (градусы) и
+хранятся рядом с исходным (RiskZone.simplified). Клиент выбирает уровень параметром
+zoom (допуск не больше размера пикселя на этом зуме — упрощение незаметно глазу) или
+tolerance. Уровни фиксированы: при их изменении сохранённые упрощения нужно пересчитать
+(flask simplify-zones).
+"""
+import numpy as np
+
+# Допуски упрощения, градусы (~10 м ... ~5 км)
+TOLERANCES = (0.0001, 0.0005, 0.002, 0.01, 0.05)
+
+
+def _douglas_peucker(points, tolerance):
+    """Индексы точек ломаной points (n x 2), оставляемых при упрощении с допуском tolerance"""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+
+def simplify_ring(ring, tolerance):
+    """
+    Упрощает кольцо полигона [{'lat', 'lng'}, ...] (без повтора первой точки в конце).
+    Кольцо делится на две ломаные — от первой точки до самой удалённой от неё и обратно,
+    — чтобы у замкнутого контура не было вырожденного отрезка. None — если после
+    упрощения остаётся меньше трёх вершин.
+    """
+    points = np.array([(float(p['lng']), float(p['lat'])) for p in ring])
+    if len(points) <= 3:
+        return None
+    split = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    if split == 0:
+        return None
+    first = _douglas_peucker(points[:split + 1], tolerance)
+    second = _douglas_peucker(np.vstack([points[split:], points[:1]]), tolerance)[1:-1] + split
+    indices = np.concatenate([first, second])
+    if len(indices) < 3:
+        return None
+    return [ring[i] for i in indices]
+
+
+def simplify_levels(ring):
+    """
+    Упрощения кольца на всех уровнях TOLERANCES: {'допуск': кольцо}. Уровень хранится,
+    только если он убирает вершины по сравнению с предыдущим.
+    """
+    levels = {}
+    if not isinstance(ring, list):
+        return levels
+    try:
+        previous = len(ring)
+        for tolerance in TOLERANCES:
+            simplified = simplify_ring(ring, tolerance)
+            if simplified is None:
+                break
+            if len(simplified) < previous:
+                levels[repr(tolerance)] = simplified
+                previous = len(simplified)
+    except (KeyError, TypeError, ValueError):
+        return {}
+    return levels
+
+
+def pick(original, levels, tolerance):
+    """Самое сильное сохранённое упрощение с допуском не больше tolerance (или исходный полигон)"""
+    if not tolerance or not levels:
+        return original, 0
+    chosen = max((float(key) for key in levels if float(key) <= tolerance), default=None)
+    if chosen is None:
+        return original, 0
+    return levels[repr(chosen)], chosen
+
+
+def zoom_tolerance(zoom):
+    """Размер пикселя тайла 256 px на зуме zoom, градусы долготы"""
+    return 360.0 / (256 * (1 << zoom))
@@ -0,0 +1,266 @@
+"""
+Пространственный индекс слоёв карты: выборка объектов по bbox без обхода таблиц.
+
+Координаты объектов лежат в числовых индексированных колонках latitude/longitude
+(у ГТС и водных объектов они заполняются из JSON coordinates при сохранении). Поверх
+них в каждом процессе держится равномерная сетка (MAP_GRID_CELL_DEGREES): ячейка ->
+id объектов. Запрос по bbox смотрит только пересекающиеся ячейки, точная проверка —
+по координатам в памяти, а строки затем читаются по первичному ключу.
+
+Для мелких масштабов карты (zoom <= MAP_CLUSTER_MAX_ZOOM) рядом держится иерархическая
+сетка кластеров: на каждом зуме ячейка ~ 256 / MAP_CLUSTER_CELLS_PER_TILE пикселей
+в проекции Web Mercator, для ячейки — число объектов, сумма координат (центроид) и
+счётчики степени опасности (худшая — уровень датчиков или техсостояние объектов).
+Вставка и удаление объекта меняют по одной ячейке на каждом зуме, поэтому ответ на
+мелком масштабе строится из готовых агрегатов и не растёт с числом объектов.
+
+Сетки строятся один раз (запрос только id, координат и степени опасности) и дальше
+обновляются инкрементально: при росте ревизии таблицы (services.versions) читаются
+лишь изменённые после прошлой синхронизации записи и надгробия удалённых.
+"""
+import math
+import threading
+from collections import Counter, defaultdict
+
+from models import Sensor, HydroFacility, WaterBody
+from services.versions import watermark, changes
+
+# Слой карты -> (модель, видимость записи на карте, колонка степени опасности)
+LAYERS = {
+    'sensors': (Sensor, lambda s: s.is_active, 'danger_level'),
+    'hydro_facilities': (HydroFacility, None, 'technical_condition'),
+    'water_bodies': (WaterBody, None, 'technical_condition'),
+}
+
+# Степени опасности по возрастанию и ключ худшей из них в ответе кластера
+SEVERITY = {
+    'sensors': ('dangerLevel', ['safe', 'attention', 'danger', 'critical']),
+    'hydro_facilities': ('condition', [1, 2, 3, 4, 5]),
+    'water_bodies': ('condition', [1, 2, 3, 4, 5]),
+}
+
+# Предел широты проекции Web Mercator
+MAX_LATITUDE = 85.05112878
+
+
+def parse_bbox(value):
+    """bbox=minLng,minLat,maxLng,maxLat -> кортеж или None; ValueError при некорректном значении"""
+    if not value:
+        return None
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError(value)
+    min_lng, min_lat, max_lng, max_lat = parts
+    # minLng > maxLng допустимо — рамка пересекает 180-й меридиан
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise ValueError(value)
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def parse_zoom(value):
+    """zoom карты (0..22) -> int или None; ValueError при некорректном значении"""
+    if value is None or value == '':
+        return None
+    zoom = int(value)
+    if not 0 <= zoom <= 22:
+        raise ValueError(value)
+    return zoom
+
+
+def in_bbox(lat, lng, bbox):
+    min_lng, min_lat, max_lng, max_lat = bbox
+    if not min_lat <= lat <= max_lat:
+        return False
+    return min_lng <= lng <= max_lng if min_lng <= max_lng else (lng >= min_lng or lng <= max_lng)
+
+
+def mercator(lat, lng):
+    """Координаты Web Mercator, нормированные к [0, 1)"""
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    x = (lng + 180.0) / 360.0
+    y = (1.0 - math.log(math.tan(math.radians(lat)) + 1.0 / math.cos(math.radians(lat))) / math.pi) / 2.0
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+class GridIndex:
+    """Равномерная сетка lat/lng -> id объектов одного слоя"""
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.cells = defaultdict(set)
+        self.points = {}  # id -> (lat, lng)
+
+    def _key(self, lat, lng):
+        return math.floor(lat / self.cell), math.floor(lng / self.cell)
+
+    def put(self, object_id, lat, lng):
+        self.remove(object_id)
+        if lat is None or lng is None:
+            return  # объект без координат на карту не попадает
+        self.points[object_id] = (lat, lng)
+        self.cells[self._key(lat, lng)].add(object_id)
+
+    def remove(self, object_id):
+        point = self.points.pop(object_id, None)
+        if point is None:
+            return
+        key = self._key(*point)
+        self.cells[key].discard(object_id)
+        if not self.cells[key]:
+            del self.cells[key]
+
+    def query(self, min_lng, min_lat, max_lng, max_lat):
+        """id объектов внутри рамки (границы включительно)"""
+        spans = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180.0), (-180.0, max_lng)]
+        row_from, row_to = math.floor(min_lat / self.cell), math.floor(max_lat / self.cell)
+
+        result = []
+        for lng_from, lng_to in spans:
+            col_from, col_to = math.floor(lng_from / self.cell), math.floor(lng_to / self.cell)
+            if (row_to - row_from + 1) * (col_to - col_from + 1) > len(self.cells):
+                # Рамка шире занятой части сетки — дешевле пройти по непустым ячейкам
+                keys = [k for k in self.cells if row_from <= k[0] <= row_to and col_from <= k[1] <= col_to]
+            else:
+                keys = [(r, c) for r in range(row_from, row_to + 1) for c in range(col_from, col_to + 1)
+                        if (r, c) in self.cells]
+            for key in keys:
+                for object_id in self.cells[key]:
+                    lat, lng = self.points[object_id]
+                    if min_lat <= lat <= max_lat and lng_from <= lng <= lng_to:
+                        result.append(object_id)
+        return result
+
+
+class ClusterIndex:
+    """Иерархическая сетка кластеров: на каждом зуме 0..max_zoom — агрегаты непустых ячеек"""
+
+    def __init__(self, max_zoom, cells_per_tile):
+        self.cells_per_tile = cells_per_tile
+        self.levels = [{} for _ in range(max_zoom + 1)]  # ключ ячейки -> [ids, сумма lat, сумма lng, Counter]
+        self.members = {}  # id -> (lat, lng, степень опасности)
+
+    def _keys(self, lat, lng):
+        x, y = mercator(lat, lng)
+        for zoom in range(len(self.levels)):
+            scale = (1 << zoom) * self.cells_per_tile
+            yield zoom, (int(x * scale), int(y * scale))
+
+    def put(self, object_id, lat, lng, severity):
+        if self.members.get(object_id) == (lat, lng, severity):
+            return  # изменились другие поля (например, показание без смены уровня)
+        self.remove(object_id)
+        if lat is None or lng is None:
+            return
+        self.members[object_id] = (lat, lng, severity)
+        for zoom, key in self._keys(lat, lng):
+            cell = self.levels[zoom].get(key)
+            if cell is None:
+                cell = self.levels[zoom][key] = [set(), 0.0, 0.0, Counter()]
+            cell[0].add(object_id)
+            cell[1] += lat
+            cell[2] += lng
+            cell[3][severity] += 1
+
+    def remove(self, object_id):
+        member = self.members.pop(object_id, None)
+        if member is None:
+            return
+        lat, lng, severity = member
+        for zoom, key in self._keys(lat, lng):
+            cell = self.levels[zoom][key]
+            cell[0].discard(object_id)
+            if not cell[0]:
+                del self.levels[zoom][key]
+                continue
+            cell[1] -= lat
+            cell[2] -= lng
+            cell[3][severity] -= 1
+            if not cell[3][severity]:
+                del cell[3][severity]
+
+    def clusters(self, zoom, severity_key, order, bbox=None):
+        """Кластеры зума: центроид, число объектов, худшая степень опасности и разбивка по степеням"""
+        result = []
+        for (kx, ky), (ids, sum_lat, sum_lng, severities) in self.levels[zoom].items():
+            count = len(ids)
+            lat, lng = sum_lat / count, sum_lng / count
+            if bbox is not None and not in_bbox(lat, lng, bbox):
+                continue
+            worst = max(severities, key=lambda v: order.index(v) if v in order else -1)
+            cluster = {
+                'id': f'{zoom}/{kx}/{ky}',
+                'cluster': True,
+                'count': count,
+                'lat': round(lat, 6),
+                'lng': round(lng, 6),
+                severity_key: worst,
+                'breakdown': {str(v): n for v, n in severities.items()},
+            }
+            if count == 1:
+                cluster['objectId'] = next(iter(ids))
+            result.append(cluster)
+        return result
+
+
+class SpatialIndex:
+    def __init__(self, app=None):
+        self.cell = 0.5
+        self.max_zoom = 14
+        self.cells_per_tile = 4
+        self._lock = threading.Lock()
+        self._layers = {}  # слой -> [GridIndex, ClusterIndex, ревизия таблицы]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cell = app.config['MAP_GRID_CELL_DEGREES']
+        self.max_zoom = app.config['MAP_CLUSTER_MAX_ZOOM']
+        self.cells_per_tile = app.config['MAP_CLUSTER_CELLS_PER_TILE']
+        app.extensions['spatial_index'] = self
+
+    def _build(self, layer):
+        model, _, severity = LAYERS[layer]
+        revision = watermark(layer)
+        grid = GridIndex(self.cell)
+        clusters = ClusterIndex(self.max_zoom, self.cells_per_tile)
+        query = model.query.with_entities(model.id, model.latitude, model.longitude, getattr(model, severity))
+        if model is Sensor:
+            query = query.filter(Sensor.is_active.is_(True))
+        for object_id, lat, lng, level in query:
+            grid.put(object_id, lat, lng)
+            clusters.put(object_id, lat, lng, level)
+        return [grid, clusters, revision]
+
+    def _sync(self, layer):
+        """Актуальные сетки слоя: построение при первом обращении, дальше — по дельте изменений"""
+        state = self._layers.get(layer)
+        if state is None:
+            state = self._layers[layer] = self._build(layer)
+            return state
+
+        revision = watermark(layer)
+        if revision > state[2]:
+            model, visible, severity = LAYERS[layer]
+            records, deleted = changes(model, state[2], visible=visible)
+            for object_id in deleted:
+                state[0].remove(object_id)
+                state[1].remove(object_id)
+            for record in records:
+                state[0].put(record.id, record.latitude, record.longitude)
+                state[1].put(record.id, record.latitude, record.longitude, getattr(record, severity))
+            state[2] = revision
+        return state
+
+    def query(self, layer, bbox):
+        """id объектов слоя внутри bbox (minLng, minLat, maxLng, maxLat)"""
+        with self._lock:
+            return self._sync(layer)[0].query(*bbox)
+
+    def clusters(self, layer, zoom, bbox=None):
+        """Кластеры слоя на зуме zoom (не больше max_zoom), центроиды внутри bbox"""
+        severity_key, order = SEVERITY[layer]
+        with self._lock:
+            return self._sync(layer)[1].clusters(min(zoom, self.max_zoom), severity_key, order, bbox)
+
+
+spatial_index = SpatialIndex()
@@ -0,0 +1,11 @@
+"""Вспомогательные SQL-конструкции, зависящие от диалекта БД."""
+from models import db
+
+
+def dialect_insert(model):
+    """INSERT с поддержкой ON CONFLICT для текущей БД (SQLite или PostgreSQL)"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
@@ -0,0 +1,259 @@
+"""
+Монитор датчиков, переставших присылать показания.
+
+Датчик считается stale, если не отчитывался дольше SENSOR_STALE_FACTOR своих интервалов
+(report_interval, по умолчанию SENSOR_REPORT_INTERVAL), и offline — дольше
+SENSOR_OFFLINE_FACTOR интервалов. Состояние хранится в Sensor.connectivity.
+
+Вместо периодического обхода всей таблицы монитор держит min-кучу сроков: для каждого
+датчика — момент, когда он станет stale (или offline, если уже stale). Фоновый поток
+спит до ближайшего срока, перечитывает по первичному ключу только «просроченные»
+датчики (показание могло прийти через другой воркер — тогда срок просто сдвигается)
+и переводит их дальше. Возврат в online проверяется по индексу connectivity —
+среди немногих stale/offline датчиков.
+
+Поток работает в каждом воркере; переход записывается условным UPDATE
+(connectivity и last_update не изменились с момента чтения), и уведомление создаёт
+только тот процесс, чей UPDATE затронул строку, — одно уведомление на переход.
+"""
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update
+
+from models import db, Sensor, Notification, User
+from services.sensor_stream import sensor_stream
+
+STATES = ['online', 'stale', 'offline']
+
+LABELS = {
+    'online': 'на связи',
+    'stale': 'нет свежих данных',
+    'offline': 'не на связи',
+}
+
+
+def classify(age, interval, stale_factor, offline_factor):
+    """Состояние связи по возрасту последнего показания (секунды) и интервалу отчётов"""
+    if age >= interval * offline_factor:
+        return 'offline'
+    if age >= interval * stale_factor:
+        return 'stale'
+    return 'online'
+
+
+class StalenessMonitor:
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._heap = []  # (срок, sensor_id)
+        self._scheduled = {}  # sensor_id -> действующий срок; записи кучи с другим сроком устарели
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['SENSOR_MONITOR_ENABLED']
+        self.report_interval = app.config['SENSOR_REPORT_INTERVAL']
+        self.stale_factor = app.config['SENSOR_STALE_FACTOR']
+        self.offline_factor = app.config['SENSOR_OFFLINE_FACTOR']
+        self.poll_interval = app.config['SENSOR_MONITOR_POLL_INTERVAL']
+        app.extensions['staleness_monitor'] = self
+
+        if self.enabled:
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        """Запускает поток монитора (после fork — заново в каждом воркере)"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._heap = []
+            self._scheduled = {}
+
+        thread = threading.Thread(target=self._run, name='sensor-staleness-monitor', daemon=True)
+        thread.start()
+
+    # ---------- куча сроков ----------
+
+    def _deadline(self, last_update, interval, connectivity):
+        """Следующий срок проверки датчика, или None (offline — ждём показания)"""
+        if connectivity == 'offline':
+            return None
+        factor = self.stale_factor if connectivity == 'online' else self.offline_factor
+        return last_update + timedelta(seconds=(interval or self.report_interval) * factor)
+
+    def track(self, sensor):
+        """Ставит (или переставляет) срок проверки датчика после его создания или изменения"""
+        if self._pid != os.getpid():
+            return  # поток ещё не запущен — датчик попадёт в кучу при начальной загрузке
+        with self._lock:
+            deadline = None
+            if sensor.is_active:
+                deadline = self._deadline(sensor.last_update or sensor.created_at,
+                                          sensor.report_interval, sensor.connectivity)
+            self._schedule(sensor.id, deadline)
+
+    def _schedule(self, sensor_id, deadline):
+        if deadline is None:
+            self._scheduled.pop(sensor_id, None)
+            return
+        if self._scheduled.get(sensor_id) == deadline:
+            return
+        self._scheduled[sensor_id] = deadline
+        heapq.heappush(self._heap, (deadline, sensor_id))
+        if self._heap[0][1] == sensor_id:
+            self._wakeup.set()  # новый ближайший срок — поток должен проснуться раньше
+
+    def _pop_due(self, now):
+        due = set()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, sensor_id = heapq.heappop(self._heap)
+                if self._scheduled.get(sensor_id) == deadline:
+                    del self._scheduled[sensor_id]
+                    due.add(sensor_id)
+        return due
+
+    def _seconds_to_next(self):
+        with self._lock:
+            # Устаревшие записи на вершине кучи выбрасываем, чтобы не просыпаться зря
+            while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return (self._heap[0][0] - datetime.utcnow()).total_seconds()
+
+    # ---------- проверка ----------
+
+    def _columns(self):
+        return (Sensor.id, Sensor.name, Sensor.last_update, Sensor.created_at,
+                Sensor.report_interval, Sensor.connectivity, Sensor.is_active)
+
+    def load(self):
+        """Начальная загрузка сроков всех активных датчиков (один раз на процесс)"""
+        rows = db.session.query(*self._columns()).filter(Sensor.is_active.is_(True)).all()
+        db.session.rollback()
+        with self._lock:
+            for row in rows:
+                self._schedule(row.id, self._deadline(row.last_update or row.created_at,
+                                                      row.report_interval, row.connectivity))
+        return len(rows)
+
+    def check(self):
+        """Переводит просроченные и вернувшиеся на связь датчики; возвращает список переходов"""
+        now = datetime.utcnow()
+        due = self._pop_due(now)
+
+        rows = []
+        if due:
+            rows = db.session.query(*self._columns()).filter(Sensor.id.in_(due)).all()
+        # Кандидаты на возврат в online — по индексу connectivity
+        recovering = db.session.query(*self._columns()).filter(
+            Sensor.connectivity.in_(['stale', 'offline']),
+            Sensor.is_active.is_(True)
+        )
+        if due:
+            recovering = recovering.filter(Sensor.id.notin_(due))
+        rows += recovering.all()
+
+        transitions = []
+        schedule = {}
+        for row in rows:
+            if not row.is_active:
+                continue
+            last_update = row.last_update or row.created_at
+            target = classify((now - last_update).total_seconds(), row.report_interval or self.report_interval,
+                              self.stale_factor, self.offline_factor)
+            if target != row.connectivity:
+                # Переход только если датчик не изменился с момента чтения (показание, другой воркер)
+                result = db.session.execute(
+                    update(Sensor)
+                    .where(Sensor.id == row.id,
+                           Sensor.connectivity == row.connectivity,
+                           Sensor.last_update == row.last_update)
+                    .values(connectivity=target)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount != 1:
+                    # Датчик изменился — перечитаем на следующей проверке
+                    schedule[row.id] = now + timedelta(seconds=self.poll_interval)
+                    continue
+                transitions.append((row, target))
+            schedule[row.id] = self._deadline(last_update, row.report_interval, target)
+
+        if transitions:
+            self._notify(transitions, now)
+        db.session.commit()
+        if transitions:
+            sensor_stream.publish()
+
+        with self._lock:
+            for sensor_id, deadline in schedule.items():
+                self._schedule(sensor_id, deadline)
+        return [(row.id, row.connectivity, target) for row, target in transitions]
+
+    def _notify(self, transitions, now):
+        """Одно уведомление персоналу на каждый переход (одним INSERT)"""
+        staff = [uid for (uid,) in db.session.query(User.id).filter(
+            User.user_type.in_(self.app.config['SENSOR_ALERT_STAFF_ROLES'])
+        )]
+        notifications = []
+        for row, target in transitions:
+            last_update = row.last_update or row.created_at
+            if target == 'online':
+                notification_type = 'info'
+                title = f'Датчик снова на связи: {row.name}'
+                message = f'Показания поступают, последнее — {last_update.strftime("%d.%m.%Y %H:%M")} UTC'
+            else:
+                notification_type = 'warning'
+                title = f'Датчик {LABELS[target]}: {row.name}'
+                message = (f'Последнее показание — {last_update.strftime("%d.%m.%Y %H:%M")} UTC; '
+                           f'текущий уровень воды может быть неактуален')
+            notifications.extend(
+                {
+                    'user_id': user_id,
+                    'type': notification_type,
+                    'title': title,
+                    'message': message,
+                    'sensor_id': row.id,
+                    'is_important': target == 'offline',
+                    'created_at': now,
+                }
+                for user_id in staff
+            )
+        if notifications:
+            db.session.execute(insert(Notification), notifications)
+
+    def _run(self):
+        with self.app.app_context():
+            try:
+                self.load()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Ошибка загрузки монитора датчиков: {e}")
+
+            while True:
+                timeout = self._seconds_to_next()
+                timeout = self.poll_interval if timeout is None else min(max(timeout, 0), self.poll_interval)
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                try:
+                    self.check()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Ошибка монитора датчиков: {e}")
+                finally:
+                    db.session.remove()
+
+
+staleness_monitor = StalenessMonitor()
@@ -0,0 +1,320 @@
+"""
+Тайлы слоёв карты: GET /api/map/tiles/<слой>/<z>/<x>/<y> (схема XYZ, Web Mercator).
+
+Тайл — компактный GeoJSON FeatureCollection: только объекты, попавшие в тайл
+(точки — через пространственный индекс services.spatial, полигоны зон риска — по их
+охватывающим прямоугольникам и упрощённые под зум, services.simplify), с короткими
+свойствами и координатами, округлёнными до точности, различимой на этом зуме. Формат Mapbox Vector Tiles не используется:
+для него нужен protobuf-кодировщик, а GeoJSON-тайлы карта читает как есть.
+
+Готовые тайлы хранятся на диске (MAP_TILE_CACHE_DIR/<слой>/<z>/<x>/<y>.json) и общие
+для всех воркеров. Инвалидация — по тайлам: процесс держит охватывающие прямоугольники
+объектов слоя и перед ответом сверяет ревизию таблицы (services.versions); для
+изменённых и удалённых объектов удаляются тайлы старого и нового положения на всех
+зумах до MAP_TILE_MAX_ZOOM, остальные тайлы остаются в кэше. Ревизия, до которой кэш
+слоя согласован, пишется в файл REVISION; если при старте процесса она отстаёт
+(данные менялись, пока тайлы никто не обслуживал), кэш слоя очищается целиком.
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+
+from models import db, Sensor, HydroFacility, WaterBody, RiskZone
+from services.simplify import zoom_tolerance
+from services.spatial import spatial_index, MAX_LATITUDE
+from services.versions import watermark, changes
+
+
+def _point_envelope(record):
+    if record.latitude is None or record.longitude is None:
+        return None
+    return record.longitude, record.latitude, record.longitude, record.latitude
+
+
+def _polygon_envelope(record):
+    try:
+        lats = [float(p['lat']) for p in record.coordinates or []]
+        lngs = [float(p['lng']) for p in record.coordinates or []]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not lats:
+        return None
+    return min(lngs), min(lats), max(lngs), max(lats)
+
+
+def _sensor_feature(s, precision):
+    return _point(s, precision, {
+        'id': s.id,
+        'name': s.name,
+        'dangerLevel': s.danger_level,
+        'waterLevel': s.water_level,
+        'status': s.connectivity if s.status == 'active' else 'offline',
+    })
+
+
+def _facility_feature(f, precision):
+    return _point(f, precision, {
+        'id': f.id,
+        'name': f.name,
+        'type': f.type,
+        'condition': f.technical_condition,
+        'riskLevel': f.risk_level,
+        'status': f.status,
+    })
+
+
+def _water_body_feature(wb, precision):
+    return _point(wb, precision, {
+        'id': wb.id,
+        'name': wb.name,
+        'type': wb.type,
+        'condition': wb.technical_condition,
+    })
+
+
+def _zone_feature(zone, precision, zoom):
+    # Полигон, упрощённый до точности пикселя на этом зуме
+    points = zone.coordinates_at(zoom_tolerance(zoom))[0]
+    ring = [[round(float(p['lng']), precision), round(float(p['lat']), precision)] for p in points]
+    if ring and ring[0] != ring[-1]:
+        ring.append(ring[0])  # GeoJSON: кольцо полигона замкнуто
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+        'properties': {
+            'id': zone.id,
+            'name': zone.name,
+            'type': zone.type,
+            'status': zone.status,
+            'waterLevel': zone.water_level,
+            'trend': zone.trend,
+        },
+    }
+
+
+def _point(record, precision, properties):
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [round(record.longitude, precision), round(record.latitude, precision)],
+        },
+        'properties': properties,
+    }
+
+
+# Слой URL -> (таблица, модель, видимость, охватывающий прямоугольник)
+LAYERS = {
+    'sensors': ('sensors', Sensor, lambda s: s.is_active, _point_envelope),
+    'facilities': ('hydro_facilities', HydroFacility, None, _point_envelope),
+    'waterbodies': ('water_bodies', WaterBody, None, _point_envelope),
+    'zones': ('risk_zones', RiskZone, lambda z: z.is_active, _polygon_envelope),
+}
+
+
+def tile_bounds(z, x, y):
+    """(minLng, minLat, maxLng, maxLat) тайла XYZ"""
+    n = 1 << z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def tile_range(envelope, z):
+    """Диапазоны (x_from, x_to, y_from, y_to) тайлов зума z, пересекающих прямоугольник"""
+    n = 1 << z
+    min_lng, min_lat, max_lng, max_lat = envelope
+
+    def column(lng):
+        return min(max(int((lng + 180.0) / 360.0 * n), 0), n - 1)
+
+    def row(lat):
+        lat = math.radians(max(min(lat, MAX_LATITUDE), -MAX_LATITUDE))
+        return min(max(int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n), 0), n - 1)
+
+    return column(min_lng), column(max_lng), row(max_lat), row(min_lat)
+
+
+def precision(z):
+    """Знаков после запятой, достаточных для точности в пиксель тайла 256 px"""
+    return min(7, max(2, int(math.ceil(math.log10((1 << z) * 256 / 360.0))) + 1))
+
+
+class TileCache:
+    def __init__(self, app=None):
+        self.directory = None
+        self.max_zoom = 16
+        self._lock = threading.Lock()
+        self._layers = {}  # слой -> [ревизия, {id: прямоугольник}]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config['MAP_TILE_CACHE_DIR']
+        self.max_zoom = app.config['MAP_TILE_MAX_ZOOM']
+        app.extensions['tile_cache'] = self
+        os.makedirs(self.directory, exist_ok=True)
+
+    # ---------- инвалидация ----------
+
+    def _path(self, layer, z, x, y):
+        return os.path.join(self.directory, layer, str(z), str(x), f'{y}.json')
+
+    def _revision_path(self, layer):
+        return os.path.join(self.directory, layer, 'REVISION')
+
+    def _read_revision(self, layer):
+        try:
+            with open(self._revision_path(layer)) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return None
+
+    def _write_revision(self, layer, revision):
+        stored = self._read_revision(layer)
+        if stored is not None and stored >= revision:
+            return  # другой воркер уже продвинулся дальше
+        os.makedirs(os.path.join(self.directory, layer), exist_ok=True)
+        self._atomic_write(self._revision_path(layer), str(revision).encode('utf-8'))
+
+    def _atomic_write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _baseline(self, layer):
+        table, model, visible, envelope = LAYERS[layer]
+        revision = watermark(table)
+        if self._read_revision(layer) != revision:
+            # Неизвестно, что менялось без нас — кэш слоя больше не согласован
+            shutil.rmtree(os.path.join(self.directory, layer), ignore_errors=True)
+        query = model.query
+        if visible is not None:
+            query = query.filter(model.is_active.is_(True))
+        envelopes = {}
+        for record in query:
+            box = envelope(record)
+            if box is not None:
+                envelopes[record.id] = box
+        self._write_revision(layer, revision)
+        return [revision, envelopes]
+
+    def _invalidate(self, layer, boxes):
+        """Удаляет закэшированные тайлы, пересекающие прямоугольники, на всех зумах"""
+        removed = 0
+        for box in boxes:
+            for z in range(self.max_zoom + 1):
+                x_from, x_to, y_from, y_to = tile_range(box, z)
+                for x in range(x_from, x_to + 1):
+                    # Смотрим только существующие файлы: крупная зона на большом зуме — тысячи тайлов
+                    column = os.path.dirname(self._path(layer, z, x, 0))
+                    try:
+                        names = os.listdir(column)
+                    except FileNotFoundError:
+                        continue
+                    for name in names:
+                        stem, ext = os.path.splitext(name)
+                        if ext == '.json' and stem.isdigit() and y_from <= int(stem) <= y_to:
+                            try:
+                                os.remove(os.path.join(column, name))
+                                removed += 1
+                            except FileNotFoundError:
+                                pass
+        return removed
+
+    def sync(self, layer):
+        """Согласует кэш слоя с БД: удаляет тайлы объектов, изменённых после прошлой сверки"""
+        table, model, visible, envelope = LAYERS[layer]
+        with self._lock:
+            state = self._layers.get(layer)
+            if state is None:
+                state = self._layers[layer] = self._baseline(layer)
+                return state[0]
+
+            revision = watermark(table)
+            if revision <= state[0]:
+                return state[0]
+
+            records, deleted = changes(model, state[0], visible=visible)
+            boxes = [state[1].pop(object_id) for object_id in deleted if object_id in state[1]]
+            for record in records:
+                box = envelope(record)
+                old = state[1].pop(record.id, None)
+                if old is not None:
+                    boxes.append(old)
+                if box is not None:
+                    state[1][record.id] = box
+                    if box != old:
+                        boxes.append(box)
+            self._invalidate(layer, set(boxes))
+            state[0] = revision
+            self._write_revision(layer, revision)
+            return revision
+
+    # ---------- построение ----------
+
+    def render(self, layer, z, x, y):
+        """GeoJSON тайла (байты)"""
+        table, model, visible, envelope = LAYERS[layer]
+        bounds = tile_bounds(z, x, y)
+        digits = precision(z)
+
+        if layer == 'zones':
+            min_lng, min_lat, max_lng, max_lat = bounds
+            with self._lock:
+                ids = [
+                    object_id for object_id, box in self._layers[layer][1].items()
+                    if box[0] <= max_lng and box[2] >= min_lng and box[1] <= max_lat and box[3] >= min_lat
+                ]
+            records = RiskZone.query.filter(RiskZone.id.in_(ids)).order_by(RiskZone.id).all() if ids else []
+            features = [_zone_feature(zone, digits, z) for zone in records]
+        else:
+            ids = spatial_index.query(table, bounds)
+            records = model.query.filter(model.id.in_(ids)).order_by(model.id).all() if ids else []
+            build = {'sensors': _sensor_feature, 'facilities': _facility_feature,
+                     'waterbodies': _water_body_feature}[layer]
+            features = [build(record, digits) for record in records]
+
+        return json.dumps({'type': 'FeatureCollection', 'features': features},
+                          ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def get(self, layer, z, x, y):
+        """Байты тайла: из кэша на диске или построенный заново (и сохранённый)"""
+        revision = self.sync(layer)
+        path = self._path(layer, z, x, y)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+
+        body = self.render(layer, z, x, y)
+        if not self._unchanged(layer, revision):
+            return body  # пока строили тайл, данные изменились — такой тайл не кэшируем
+        try:
+            self._atomic_write(path, body)
+        except OSError as e:
+            print(f"Ошибка записи тайла в кэш: {e}")
+            return body
+        # Другой воркер мог изменить данные и уже удалить тайлы до нашей записи —
+        # тогда убираем записанный тайл сами, иначе его удалит следующая инвалидация
+        if not self._unchanged(layer, revision):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return body
+
+    def _unchanged(self, layer, revision):
+        db.session.rollback()  # завершаем транзакцию чтения, чтобы увидеть свежую ревизию
+        return watermark(LAYERS[layer][0]) == revision
+
+
+tile_cache = TileCache()
@@ -0,0 +1,133 @@
+"""
+Версии таблиц и условные GET (ETag / Last-Modified) для публичных списков.
+
+Каждая запись в отслеживаемые таблицы увеличивает счётчик таблицы в table_versions
+в той же транзакции: INSERT/UPDATE (через ORM, bulk-операции и Core, из любого воркера) —
+через default/onupdate колонки revision, удаление через ORM — событием after_delete,
+которое оставляет надгробие в sync_tombstones. Поэтому версия меняется ровно тогда,
+когда изменились данные, и откатывается вместе с ними.
+
+Значение счётчика записывается в revision изменённых строк: по нему changes() отдаёт
+клиенту только записи, изменённые после его последней синхронизации (since), и id
+удалённых. В PostgreSQL строка счётчика заблокирована до commit, поэтому ревизии
+фиксируются в порядке возрастания и водяной знак не «перепрыгивает» незафиксированные.
+
+Декоратор conditional(*tables) читает версии нужных таблиц одним запросом к
+table_versions и, если ETag клиента (If-None-Match) совпал, отвечает 304 — без
+основного запроса и сериализации. Иначе ответ берётся из кэша готовых ответов
+(services.response_cache) при совпадении версии, а построенный заново — сохраняется в нём.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import request, make_response, Response
+
+from models import db, TableVersion, SyncTombstone
+from services.response_cache import response_cache, cache_key
+
+def watermark(table):
+    """Текущая ревизия таблицы — водяной знак для следующей дельта-синхронизации"""
+    version = db.session.query(TableVersion.version).filter(TableVersion.name == table).scalar()
+    return version or 0
+
+
+def parse_since():
+    """Параметр since (ревизия последней синхронизации клиента): None — полный список"""
+    since = request.args.get('since', '')
+    if since == '':
+        return None
+    since = int(since)  # ValueError — некорректный параметр
+    if since < 0:
+        raise ValueError(since)
+    return since
+
+
+def changes(model, since, visible=None):
+    """
+    Дельта таблицы model после ревизии since: (изменённые записи, id удалённых).
+    visible(record) — видна ли запись в списке: изменённые, но скрытые (мягкое удаление)
+    попадают в удалённые. Водяной знак клиенту читается до выборки — запись, изменённая
+    во время запроса, в худшем случае придёт повторно.
+    """
+    table = model.__tablename__
+    records = model.query.filter(model.revision > since).order_by(model.revision).all()
+
+    pk_type = model.__table__.c.id.type.python_type
+    deleted = [
+        pk_type(record_id) for (record_id,) in db.session.query(SyncTombstone.record_id).filter(
+            SyncTombstone.table_name == table, SyncTombstone.revision > since
+        ).order_by(SyncTombstone.revision)
+    ]
+    if visible is not None:
+        deleted += [record.id for record in records if not visible(record)]
+        records = [record for record in records if visible(record)]
+    return records, list(dict.fromkeys(deleted))
+
+
+def current(tables):
+    """(etag, время последнего изменения с микросекундами) по текущим версиям таблиц — один запрос"""
+    rows = {
+        row.name: row for row in db.session.query(
+            TableVersion.name, TableVersion.version, TableVersion.updated_at
+        ).filter(TableVersion.name.in_(tables))
+    }
+    # Дата — в составе ключа: приоритеты ГТС зависят от текущего года (calculate_priority)
+    parts = [datetime.utcnow().strftime('%Y-%m-%d')]
+    modified = []
+    for name in sorted(tables):
+        row = rows.get(name)
+        parts.append(f'{name}:{row.version}:{row.updated_at.isoformat()}' if row else f'{name}:0')
+        if row:
+            modified.append(row.updated_at)
+    etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:20]
+    return etag, max(modified) if modified else None
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        # Last-Modified — с точностью до секунды, а версии меняются чаще: 304 только если
+        # последнее изменение строго раньше секунды из заголовка
+        return last_modified < request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional(*tables):
+    """
+    Декоратор публичного GET: ETag/Last-Modified по версиям tables, ответ 304 без
+    выполнения view и кэш готового ответа для той же версии данных
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                etag, last_modified = current(tables)
+            except Exception as e:
+                print(f"Ошибка чтения версий таблиц: {e}")
+                return view(*args, **kwargs)
+
+            key = cache_key(request.path, request.args)
+            if _not_modified(etag, last_modified):
+                response = Response(status=304)
+            else:
+                cached = response_cache.get(key, etag)
+                if cached is not None:
+                    status, mimetype, body = cached
+                    response = Response(body, status=status, mimetype=mimetype)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    response_cache.set(key, tables, etag, response.status_code, response.mimetype,
+                                       response.get_data())
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified.replace(microsecond=0)
+            # Браузер хранит ответ, но каждый раз переспрашивает сервер с If-None-Match
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
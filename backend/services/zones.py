@@ -0,0 +1,120 @@
+"""
+Уровень воды и тренд зон риска по связанным датчикам.
+
+Зона пересчитывается только тогда, когда пришли показания её датчиков: обратный
+индекс risk_zone_sensors (датчик -> зоны) даёт затронутые зоны одним запросом,
+поэтому стоимость приёма показания — O(затронутых зон), а не перебор всех зон.
+
+Уровень зоны — максимум (SENSOR_ZONE_LEVEL_MODE = 'max') или среднее ('mean')
+текущих уровней активных датчиков. Тренд — наклон МНК-прямой по показаниям за
+последние SENSOR_ZONE_TREND_HOURS часов (м/ч): для 'max' — у датчика с наибольшим
+уровнем, для 'mean' — средний наклон.
+"""
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, select, update
+
+from models import db, Sensor, SensorReading, RiskZone, RiskZoneSensor
+from services.anomalies import not_quarantined
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _slope(times, levels):
+    """Наклон МНК-прямой уровня по времени, м/ч"""
+    if len(times) < 2:
+        return 0.0
+    t = np.array([(ts - EPOCH).total_seconds() for ts in times]) / 3600.0
+    y = np.asarray(levels, dtype=np.float64)
+    t -= t.mean()
+    denominator = float((t * t).sum())
+    return float((t * (y - y.mean())).sum()) / denominator if denominator else 0.0
+
+
+def _slopes(sensor_ids, since):
+    rows = db.session.query(
+        SensorReading.sensor_id, SensorReading.timestamp, SensorReading.water_level
+    ).filter(
+        SensorReading.sensor_id.in_(sensor_ids),
+        SensorReading.timestamp >= since,
+        not_quarantined()
+    ).order_by(SensorReading.sensor_id, SensorReading.timestamp)
+
+    slopes = {}
+    for sensor_id, group in groupby(rows, key=lambda r: r.sensor_id):
+        group = list(group)
+        slopes[sensor_id] = _slope([r.timestamp for r in group], [r.water_level for r in group])
+    return slopes
+
+
+def trend_of(slope, threshold):
+    if slope > threshold:
+        return 'rising'
+    if slope < -threshold:
+        return 'falling'
+    return 'stable'
+
+
+def refresh_zones(zone_ids=None):
+    """
+    Пересчитывает water_level и trend активных зон (все, если zone_ids=None) без commit.
+    Зоны без активных датчиков не трогаются. Возвращает число обновлённых зон.
+    """
+    config = current_app.config
+    links = db.session.query(RiskZoneSensor.zone_id, RiskZoneSensor.sensor_id).join(
+        RiskZone, RiskZone.id == RiskZoneSensor.zone_id
+    ).filter(RiskZone.is_active.is_(True))
+    if zone_ids is not None:
+        links = links.filter(RiskZoneSensor.zone_id.in_(zone_ids))
+
+    members = {}
+    for zone_id, sensor_id in links:
+        members.setdefault(zone_id, []).append(sensor_id)
+    if not members:
+        return 0
+
+    sensor_ids = {sid for sids in members.values() for sid in sids}
+    levels = dict(db.session.query(Sensor.id, Sensor.water_level).filter(
+        Sensor.id.in_(sensor_ids), Sensor.is_active.is_(True)
+    ).all())
+    slopes = _slopes(list(levels), datetime.utcnow() - timedelta(hours=config['SENSOR_ZONE_TREND_HOURS']))
+
+    values = {}
+    for zone_id, sids in members.items():
+        present = [sid for sid in sids if levels.get(sid) is not None]
+        if not present:
+            continue
+        if config['SENSOR_ZONE_LEVEL_MODE'] == 'mean':
+            level = sum(levels[sid] for sid in present) / len(present)
+            slope = sum(slopes.get(sid, 0.0) for sid in present) / len(present)
+        else:
+            top = max(present, key=levels.get)
+            level = levels[top]
+            slope = slopes.get(top, 0.0)
+        values[zone_id] = (round(level, 3), trend_of(slope, config['SENSOR_ZONE_TREND_THRESHOLD']))
+
+    if values:
+        db.session.execute(
+            update(RiskZone)
+            .where(RiskZone.id.in_(list(values)))
+            .values(
+                water_level=case({zid: v[0] for zid, v in values.items()}, value=RiskZone.id),
+                trend=case({zid: v[1] for zid, v in values.items()}, value=RiskZone.id),
+                updated_at=datetime.utcnow(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    return len(values)
+
+
+def refresh_for_sensors(sensor_ids):
+    """Пересчитывает только зоны, в которые входят указанные датчики (без commit)"""
+    zone_ids = db.session.scalars(
+        select(RiskZoneSensor.zone_id).where(RiskZoneSensor.sensor_id.in_(list(sensor_ids))).distinct()
+    ).all()
+    if not zone_ids:
+        return 0
+    return refresh_zones(zone_ids)
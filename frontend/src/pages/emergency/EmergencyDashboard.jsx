@@ -18,7 +18,7 @@ import {
 import { getWaterBodies, getWaterBodiesStats } from '../../services/waterBodyService';
 import { getHydroFacilities } from '../../services/hydroFacilityService';
 import { getHighRiskPredictions } from '../../services/predictionService';
-import { getAllSensors, getCriticalSensors } from '../../services/sensorService';
+import { getAllSensors, getCriticalSensors, subscribeSensorUpdates } from '../../services/sensorService';
 
 const EmergencyDashboard = () => {
   const [currentTime, setCurrentTime] = useState(new Date());
@@ -33,9 +33,27 @@ const EmergencyDashboard = () => {
     fetchDashboardData();
   }, []);
 
-  const fetchDashboardData = async () => {
+  // Живые обновления по изменениям датчиков (SSE) вместо опроса; пачку событий
+  // сводим в одно перечитывание не чаще раза в 5 секунд
+  useEffect(() => {
+    let timer = null;
+    const refresh = () => {
+      if (timer) return;
+      timer = setTimeout(() => {
+        timer = null;
+        fetchDashboardData(true);
+      }, 5000);
+    };
+    const unsubscribe = subscribeSensorUpdates({ onSensors: refresh, onDanger: refresh, onReset: refresh });
+    return () => {
+      clearTimeout(timer);
+      unsubscribe();
+    };
+  }, []);
+
+  const fetchDashboardData = async (silent = false) => {
     try {
-      setLoading(true);
+      if (!silent) setLoading(true);
       setError('');
 
       // Fetch all data
@@ -11,7 +11,7 @@ import {
   ChevronRight
 } from 'lucide-react';
 import { Link } from 'react-router-dom';
-import { getAllSensors, getCriticalSensors } from '../../services/sensorService';
+import { getAllSensors, getCriticalSensors, subscribeSensorUpdates } from '../../services/sensorService';
 import { getNotifications } from '../../services/notificationService';
 import { getPredictions } from '../../services/predictionService';
 
@@ -55,9 +55,27 @@ const ExpertDashboard = () => {
     loadDashboardData();
   }, []);
 
-  const loadDashboardData = async () => {
+  // Живые обновления по изменениям датчиков (SSE) вместо опроса; пачку событий
+  // сводим в одно перечитывание не чаще раза в 5 секунд
+  useEffect(() => {
+    let timer = null;
+    const refresh = () => {
+      if (timer) return;
+      timer = setTimeout(() => {
+        timer = null;
+        loadDashboardData(true);
+      }, 5000);
+    };
+    const unsubscribe = subscribeSensorUpdates({ onSensors: refresh, onDanger: refresh, onReset: refresh });
+    return () => {
+      clearTimeout(timer);
+      unsubscribe();
+    };
+  }, []);
+
+  const loadDashboardData = async (silent = false) => {
     try {
-      setLoading(true);
+      if (!silent) setLoading(true);
 
       // Загрузка датчиков
       const sensorsResponse = await getAllSensors();
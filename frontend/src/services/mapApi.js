@@ -55,7 +55,7 @@ const apiRequest = async (endpoint, options = {}) => {
 
 /**
  * Получить все водные объекты
- * @param {Object} params - query параметры { region, condition }
+ * @param {Object} params - query параметры { region, condition, bbox: 'minLng,minLat,maxLng,maxLat', zoom }
  */
 export const getWaterBodies = async (params = {}) => {
   const queryString = new URLSearchParams(params).toString();
@@ -73,7 +73,7 @@ export const getWaterBodyDetails = async (id) => {
 
 /**
  * Получить все ГТС
- * @param {Object} params - query параметры { region, condition }
+ * @param {Object} params - query параметры { region, condition, bbox: 'minLng,minLat,maxLng,maxLat', zoom }
  */
 export const getHydroFacilities = async (params = {}) => {
   const queryString = new URLSearchParams(params).toString();
@@ -91,7 +91,7 @@ export const getHydroFacilityDetails = async (id) => {
 
 /**
  * Получить критические зоны рек
- * @param {Object} params - query параметры { region }
+ * @param {Object} params - query параметры { region, bbox }
  */
 export const getCriticalZones = async (params = {}) => {
   const queryString = new URLSearchParams(params).toString();
@@ -101,7 +101,7 @@ export const getCriticalZones = async (params = {}) => {
 
 /**
  * Получить датчики IoT для карты
- * @param {Object} params - query параметры { region, status }
+ * @param {Object} params - query параметры { region, status, bbox: 'minLng,minLat,maxLng,maxLat', zoom }
  */
 export const getMapSensors = async (params = {}) => {
   const queryString = new URLSearchParams(params).toString();
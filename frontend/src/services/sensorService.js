@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { API_BASE_URL } from '../utils/constants';
+import { API_BASE_URL, STREAM_BASE_URL } from '../utils/constants';
 
 // Настройка axios
 const api = axios.create({
@@ -78,11 +78,12 @@ export const getCriticalSensors = async () => {
 
 /**
  * Получение зон риска
+ * @param {Object} [options] - { zoom } или { tolerance } — упрощённые полигоны для мелкого масштаба
  * @returns {Promise<{success: boolean, data: Array}>}
  */
-export const getRiskZones = async () => {
+export const getRiskZones = async (options = {}) => {
   try {
-    const response = await api.get('/zones');
+    const response = await api.get('/zones', { params: options });
     return response.data;
   } catch (error) {
     console.error('Ошибка получения зон риска:', error);
@@ -183,3 +184,48 @@ export const addSensorReading = async (sensorId, readingData) => {
     throw new Error(error.response?.data?.error || 'Не удалось добавить показание');
   }
 };
+
+// Пауза перед повторной подпиской после отказа сервера (503 — лимит подписчиков), мс
+const STREAM_RETRY_MS = 30000;
+
+/**
+ * Подписка на изменения датчиков (Server-Sent Events) вместо периодического опроса
+ * @param {Object} handlers - { onSensors({sensors, deleted, revision}), onDanger(transition), onReset() }
+ * @param {number} [since] - watermark из ответа getAllSensors: придут изменения после него
+ * @returns {Function} отписка
+ */
+export const subscribeSensorUpdates = ({ onSensors, onDanger, onReset } = {}, since) => {
+  let source = null;
+  let retryTimer = null;
+  let closed = false;
+  let revision = since;
+
+  const connect = () => {
+    const query = revision !== undefined && revision !== null ? `?since=${revision}` : '';
+    source = new EventSource(`${STREAM_BASE_URL}/api/sensors/stream${query}`);
+
+    source.addEventListener('sensors', (event) => {
+      revision = Number(event.lastEventId);
+      onSensors?.(JSON.parse(event.data));
+    });
+    source.addEventListener('danger', (event) => onDanger?.(JSON.parse(event.data)));
+    source.addEventListener('reset', (event) => {
+      revision = Number(event.lastEventId);
+      onReset?.();
+    });
+
+    // Разрыв соединения браузер переподключает сам, а ответ не 200 (например, 503) — нет:
+    // повторяем подписку с паузой и разбросом, чтобы клиенты не вернулись одновременно
+    source.onerror = () => {
+      if (closed || source.readyState !== EventSource.CLOSED) return;
+      retryTimer = setTimeout(connect, STREAM_RETRY_MS * (1 + Math.random() / 2));
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retryTimer);
+    source?.close();
+  };
+};
@@ -104,4 +104,8 @@ export const SORT_OPTIONS = [
   { value: 'priority_low', label: 'Приоритет (низкий→высокий)' }
 ];
 
-export const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5252';
\ No newline at end of file
+export const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5252';
+
+// Поток изменений датчиков (SSE) обслуживает отдельный процесс на gevent (порт 5253);
+// без REACT_APP_STREAM_URL — тот же адрес, что и API
+export const STREAM_BASE_URL = process.env.REACT_APP_STREAM_URL || API_BASE_URL;
\ No newline at end of file